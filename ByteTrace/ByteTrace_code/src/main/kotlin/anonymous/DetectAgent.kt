@@ -27,9 +27,6 @@ object DetectAgent {
      */
     @JvmStatic
     fun premain(agentArgs: String?, instrumentation: Instrumentation) {
-
-        println("agentArgs="+agentArgs)
-
         val command = System.getProperty("sun.java.command")
         if (command != null && "defects4j.build.xml" in command
             && !command.endsWith("run.dev.tests")
@@ -59,7 +56,8 @@ object DetectAgent {
                 logger.info { "Error when reading file: $agentArgs! Skip." }
                 Properties()
             }
-
+        TraceConfig.load(args)
+        TraceConfig.debug { "agentArgs=$agentArgs" }
 
         // 配置 log4j
         val logFilePath = args.getProperty("log.file.path", "bugDetect.log") // 默认值 bugDetect.log
@@ -102,12 +100,14 @@ object DetectAgent {
         oriLogger.addAppender(oriFileAppender)
         oriLogger.additivity = false
 
+        TraceSink.load(args)
+
         // 继续原有逻辑
         val classes = properties.getProperty(D4J_CLASSES, "").split(",").toSet()
         val methods = properties.getProperty(D4J_METHODS, "").split(",").toSet()
 
-        println("classes="+classes)
-        println("methods="+methods)
+        TraceConfig.debug { "classes=$classes" }
+        TraceConfig.debug { "methods=$methods" }
         instrumentation.addTransformer(DetectTransformer(classes, methods, args), true)
     }
 }
\ No newline at end of file
@@ -2,13 +2,12 @@
 
 package anonymous
 
-import anonymous.logger.ori.OriDebugLoggerHelper
-import anonymous.logger.small.SmallDebugLoggerHelper
 import com.google.gson.*
 import java.io.File
 import java.lang.reflect.Type
 import java.util.concurrent.ConcurrentHashMap
 import java.util.concurrent.CopyOnWriteArrayList
+import java.util.concurrent.atomic.AtomicInteger
 import kotlin.collections.*
 
 object DetectMonitor {
@@ -19,6 +18,8 @@ object DetectMonitor {
     private val notChangedVarRecorder = ConcurrentHashMap<String, ConcurrentHashMap<String, String>>()
     private val branchInfoMap = ConcurrentHashMap<String, CopyOnWriteArrayList<String>>()
     private val loopInfoMap = ConcurrentHashMap<String, CopyOnWriteArrayList<String>>()
+    private val localVarCounters = ConcurrentHashMap<String, AtomicInteger>()
+    private val loopCounters = ConcurrentHashMap<String, AtomicInteger>()
 
     private val normalGson: Gson = GsonBuilder().create()
 
@@ -168,23 +169,40 @@ object DetectMonitor {
         loopInfoMap.computeIfAbsent(name) { CopyOnWriteArrayList() }
     }
 
+    /**
+     * Whether the n-th local variable snapshot of a method is recorded, following trace.method.sample.every and
+     * trace.method.max.events. The snapshot that reaches the cap is replaced by a note saying so.
+     */
+    private fun sampleSnapshot(methodFullName: String, className: String, methodName: String, line: Int): Boolean {
+        val count = localVarCounters.computeIfAbsent(methodFullName) { AtomicInteger() }.incrementAndGet() - 1
+        if (count % TraceConfig.sampleEvery != 0) return false
+        val recorded = count / TraceConfig.sampleEvery
+        val max = TraceConfig.methodMaxEvents
+        if (max > 0 && recorded >= max) {
+            if (recorded == max) {
+                val note = "Snapshot limit of $max reached, further local variables of this method are not recorded"
+                TraceSink.emit(TraceSink.STREAM_SMALL, TraceSink.KIND_LOCAL_VARIABLES) { "$className:$methodName:$line->[Local Variables] $note" }
+            }
+            return false
+        }
+        return true
+    }
+
     @JvmStatic
     fun monitorLocalVar(line: Int, vars: HashMap<String, Any?>, relevant: Boolean) {
         if (vars.isEmpty()) return
-        println("Calling monitorLocalVar with line: $line, variables: $vars, relevant: $relevant")
-
+        TraceConfig.debug { "Calling monitorLocalVar with line: $line, variables: $vars, relevant: $relevant" }
 
         val stack = Thread.currentThread().stackTrace
         val className = stack[2].className
         val methodName = stack[2].methodName
         val methodFullName = "$className::$methodName"
-
+        if (!sampleSnapshot(methodFullName, className, methodName, line)) return
 
         val oriStr = gson.toJson(vars)
-        println("oriStr="+oriStr)
-        println("vars="+vars)
+        TraceConfig.debug { "oriStr=$oriStr" }
         if (oriStr != "{}") {
-            OriDebugLoggerHelper.logger.info { "$className:$methodName:$line->[Local Variables] $oriStr" }
+            TraceSink.emit(TraceSink.STREAM_ORI, TraceSink.KIND_LOCAL_VARIABLES) { "$className:$methodName:$line->[Local Variables] $oriStr" }
         }
 
         if (relevant) return
@@ -207,7 +225,7 @@ object DetectMonitor {
         if (strMap.isEmpty()) return
         val varsStr = gson.toJson(strMap)
         if (varsStr != "{}") {
-            SmallDebugLoggerHelper.logger.info { "$className:$methodName:$line->[Local Variables] $varsStr" }
+            TraceSink.emit(TraceSink.STREAM_SMALL, TraceSink.KIND_LOCAL_VARIABLES) { "$className:$methodName:$line->[Local Variables] $varsStr" }
         }
     }
 
@@ -217,16 +235,28 @@ object DetectMonitor {
         branchInfoMap.computeIfAbsent(methodFullName) { CopyOnWriteArrayList() }
         val branchStr = "Branch Info: Line: $line, Condition: $condition, Executed: $executed"
         branchInfoMap[methodFullName]!!.add(branchStr)
-        SmallDebugLoggerHelper.logger.info { "$className:$methodName:$line->[Control Flow] $branchStr" }
+        TraceSink.emit(TraceSink.STREAM_SMALL, TraceSink.KIND_CONTROL_FLOW) { "$className:$methodName:$line->[Control Flow] $branchStr" }
     }
 
     @JvmStatic
     fun monitorLoop(className: String, methodName: String, line: Int, description: String) {
         val methodFullName = "$className::$methodName"
+        val max = TraceConfig.loopMaxEvents
+        if (max > 0) {
+            val count = loopCounters.computeIfAbsent("$methodFullName:$line") { AtomicInteger() }.incrementAndGet()
+            if (count > max) {
+                if (count == max + 1) {
+                    val capStr = "Loop Info: Line: $line, Description: $description, " +
+                            "more than $max iterations, further iterations are not recorded"
+                    TraceSink.emit(TraceSink.STREAM_SMALL, TraceSink.KIND_CONTROL_FLOW) { "$className:$methodName:$line->[Control Flow] $capStr" }
+                }
+                return
+            }
+        }
         loopInfoMap.computeIfAbsent(methodFullName) { CopyOnWriteArrayList() }
         val loopStr = "Loop Info: Line: $line, Description: $description"
         loopInfoMap[methodFullName]!!.add(loopStr)
-        SmallDebugLoggerHelper.logger.info { "$className:$methodName:$line->[Control Flow] $loopStr" }
+        TraceSink.emit(TraceSink.STREAM_SMALL, TraceSink.KIND_CONTROL_FLOW) { "$className:$methodName:$line->[Control Flow] $loopStr" }
     }
 
     @JvmStatic
@@ -238,6 +268,6 @@ object DetectMonitor {
         calledMethod: String
     ) {
         val callStr = "Call Stack: ${className}.${methodName}:$line -> ${calledClass.replace('/', '.')}.$calledMethod"
-        SmallDebugLoggerHelper.logger.info { "$className:$methodName:$line->[Method Call] $callStr" }
+        TraceSink.emit(TraceSink.STREAM_SMALL, TraceSink.KIND_METHOD_CALL) { "$className:$methodName:$line->[Method Call] $callStr" }
     }
 }
\ No newline at end of file
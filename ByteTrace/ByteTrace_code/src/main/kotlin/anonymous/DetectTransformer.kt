@@ -11,6 +11,7 @@ import org.objectweb.asm.Opcodes.*
 import org.objectweb.asm.Type
 import org.objectweb.asm.commons.AdviceAdapter
 import org.objectweb.asm.tree.*
+import java.io.IOException
 import java.lang.instrument.ClassFileTransformer
 import java.security.ProtectionDomain
 import org.objectweb.asm.Opcodes
@@ -67,8 +68,8 @@ class DetectTransformer(
                 // when baseline location is not available, use relevant ones.
                 this.classes.addAll(classes)
             }
-            println("this.methods="+this.methods)
-            println("this.classes="+this.classes)
+            TraceConfig.debug { "this.methods=${this.methods}" }
+            TraceConfig.debug { "this.classes=${this.classes}" }
         }
         this.classes.remove("")
         this.methods.remove("")
@@ -76,6 +77,17 @@ class DetectTransformer(
         this.classes.removeIf { "Exception" in it }
     }
 
+    /** Everything that decides the instrumented bytes besides the class itself */
+    private val cache = TransformCache.load(
+        args,
+        listOf(
+            this.classes.sorted().joinToString(","),
+            this.methods.sorted().joinToString(","),
+            changedLocalVarsOnly,
+            TraceConfig.level
+        ).joinToString("\n")
+    )
+
     companion object {
         private val logger = KotlinLogging.logger {}
         private const val KEY_CHANGED_LOCAL_VARS_ONLY = "changedLocalVarsOnly"
@@ -90,6 +102,10 @@ class DetectTransformer(
             DetectAgent::class.java,
             DetectMonitor::class.java,
             DetectTransformer::class.java,
+            TraceConfig::class.java,
+            TraceSink::class.java,
+            TransformCache::class.java,
+            TransformCache.Companion::class.java,
             Companion::class.java,
             DetectMonitor.ClassJsonSerializer::class.java,
             DetectMonitor.AllObjectSerializer::class.java,
@@ -110,15 +126,18 @@ class DetectTransformer(
             return null
         }
         try {
-            val classReader = ClassReader(
-                classLoader.getResourceAsStream(className.replace(".", "/") + ".class")
-            )
+            val original = classLoader.getResourceAsStream(className.replace(".", "/") + ".class")
+                ?.use { it.readBytes() } ?: throw IOException("Class not found: $className")
+            cache?.get(className, original)?.let { return it }
+            val classReader = ClassReader(original)
             val classWriter = ClassWriter(ClassWriter.COMPUTE_FRAMES)
             val classNode = ClassNode(ASM9)
             classReader.accept(classNode, ClassReader.EXPAND_FRAMES)
             transformClass(classNode)
             classNode.accept(classWriter)
-            return classWriter.toByteArray()
+            val transformed = classWriter.toByteArray()
+            cache?.put(className, original, transformed)
+            return transformed
         } catch (e: Exception) {
             logger.error { e.stackTraceToString() }
         }
@@ -130,10 +149,10 @@ class DetectTransformer(
             try {
                 val fullMethodName = "${classNode.name.replace("/", ".")}::${method.name}"
                 if (fullMethodName in methods) {
-                    println("Method name: ${method.name}")
-                    println("Method descriptor: ${method.desc}")
-                    println("Method code: ${method.instructions}")
-                    println("classNode.name="+classNode.name)
+                    TraceConfig.debug { "Method name: ${method.name}" }
+                    TraceConfig.debug { "Method descriptor: ${method.desc}" }
+                    TraceConfig.debug { "Method code: ${method.instructions}" }
+                    TraceConfig.debug { "classNode.name=${classNode.name}" }
                     transformMethod(method, classNode.name)
                 }
             } catch (e: Throwable) {
@@ -144,26 +163,34 @@ class DetectTransformer(
 
     private fun transformMethod(methodNode: MethodNode, owner: String) {
         val fullMethodName = "${owner.replace("/", ".")}::${methodNode.name}"
-        println("Start transforming method: $fullMethodName")  // 调试信息: 方法开始处理
+        TraceConfig.debug { "Start transforming method: $fullMethodName" }  // 调试信息: 方法开始处理
         val relevant = if (methods.isNotEmpty() && fullMethodName !in methods) {
             true
         } else {
             false
         }
-        println("Method relevance: $relevant")  // 调试信息: 方法是否相关
+        TraceConfig.debug { "Method relevance: $relevant" }  // 调试信息: 方法是否相关
 
         if (methodNode.name == "<clinit>" || methodNode.localVariables == null) {
-            println("Skipping method: ${methodNode.name} (clinit or no local variables)")  // 调试信息: 跳过clinit或没有局部变量的方法
+            TraceConfig.debug { "Skipping method: ${methodNode.name} (clinit or no local variables)" }  // 调试信息: 跳过clinit或没有局部变量的方法
             return
         }
 
         if (!relevant && fullMethodName in methods) {
-            println("Analyzing control flow for method: $fullMethodName")  // 调试信息: 分析控制流
-            analyzeControlFlow(methodNode, owner)
+            if (TraceConfig.traces(TraceConfig.Level.FLOW)) {
+                TraceConfig.debug { "Analyzing control flow for method: $fullMethodName" }  // 调试信息: 分析控制流
+                analyzeControlFlow(methodNode, owner)
+            }
             analyzeMethodCalls(methodNode, owner)
 
         }
 
+        if (!TraceConfig.traces(TraceConfig.Level.VARS)) {
+            // 低于 vars 级别时不插入局部变量监控
+            insertEnterMonitor(owner, methodNode)
+            return
+        }
+
         val notFirstTimeVars = hashSetOf<LocalVariableNode>()
         val availableVars = hashMapOf<Int, LocalVariableNode>()
         val wroteOrFirstVisitVars = hashSetOf<LocalVariableNode>()
@@ -180,26 +207,26 @@ class DetectTransformer(
             }
             startVarMap[localVar.start]!![localVar.index] = localVar
             endVarMap[localVar.end]!![localVar.index] = localVar
-            println("Local variable added: ${localVar.name} at index ${localVar.index}")  // 调试信息: 添加局部变量
+            TraceConfig.debug { "Local variable added: ${localVar.name} at index ${localVar.index}" }  // 调试信息: 添加局部变量
         }
 
         val modifications = mutableListOf<Pair<AbstractInsnNode, InsnList>>()
         var i = 0
         while (i < methodNode.instructions.size()) {
             val inst = methodNode.instructions[i]
-            println("Processing instruction at index $i: $inst")  // 调试信息: 当前处理的指令
+            TraceConfig.debug { "Processing instruction at index $i: $inst" }  // 调试信息: 当前处理的指令
 
             if (inst is LabelNode) {
                 if (inst in startVarMap) {
                     val varNodes = startVarMap[inst]!!
                     availableVars.putAll(varNodes)
-                    println("Updated availableVars with start variables at label $inst")  // 调试信息: 更新可用变量
+                    TraceConfig.debug { "Updated availableVars with start variables at label $inst" }  // 调试信息: 更新可用变量
                 }
                 if (inst in endVarMap) {
                     val varNodes = endVarMap[inst]!!
                     for ((index, _) in varNodes) {
                         availableVars.remove(index)
-                        println("Removed variable from availableVars at label $inst")  // 调试信息: 移除变量
+                        TraceConfig.debug { "Removed variable from availableVars at label $inst" }  // 调试信息: 移除变量
                     }
                 }
             }
@@ -210,7 +237,7 @@ class DetectTransformer(
                         val localVar = availableVars[inst.`var`]!!
                         if (inst.isWriteLocalVar()) {
                             wroteOrFirstVisitVars.add(localVar)
-                            println("Marked localVar as written: ${localVar.name}")  // 调试信息: 标记局部变量为已写入
+                            TraceConfig.debug { "Marked localVar as written: ${localVar.name}" }  // 调试信息: 标记局部变量为已写入
                         }
                     }
                 }
@@ -226,8 +253,8 @@ class DetectTransformer(
                         if (varNode !in notFirstTimeVars) {
                             notFirstTimeVars.add(varNode)
                             wroteOrFirstVisitVars.add(varNode)
-                            println("Visited Variables: ${wroteOrFirstVisitVars.map { it.name }}")
-                            println("Added to notFirstTimeVars: ${varNode.name}")  // 调试信息: 添加到未访问过的变量集合
+                            TraceConfig.debug { "Visited Variables: ${wroteOrFirstVisitVars.map { it.name }}" }
+                            TraceConfig.debug { "Added to notFirstTimeVars: ${varNode.name}" }  // 调试信息: 添加到未访问过的变量集合
                         }
                     }
                     generateMonitorLocalVar(inst.line - 1, wroteOrFirstVisitVars, relevant)
@@ -243,9 +270,9 @@ class DetectTransformer(
             i++
         }
 
-        println("Total modifications to be inserted: ${modifications.size}")  // 调试信息: 总的修改指令数
+        TraceConfig.debug { "Total modifications to be inserted: ${modifications.size}" }  // 调试信息: 总的修改指令数
         for ((inst, insnList) in modifications) {
-            println("Inserting modification at instruction: $inst")  // 调试信息: 插入指令的位置
+            TraceConfig.debug { "Inserting modification at instruction: $inst" }  // 调试信息: 插入指令的位置
             if (inst.next is FrameNode) {
                 var insertBefore = inst.next
                 while (insertBefore is FrameNode) {
@@ -260,7 +287,7 @@ class DetectTransformer(
         }
 
         insertEnterMonitor(owner, methodNode)
-        println("Finished transforming method: $fullMethodName")  // 调试信息: 方法处理完成
+        TraceConfig.debug { "Finished transforming method: $fullMethodName" }  // 调试信息: 方法处理完成
     }
 
 
@@ -291,16 +318,16 @@ class DetectTransformer(
         val list = InsnList()
 
         // 1. Debug: Check visited vars
-        println("Visited Vars: ${visitedVars.map { it.name }}")
+        TraceConfig.debug { "Visited Vars: ${visitedVars.map { it.name }}" }
 
         // Skip if no variables or only 'this'
         if (visitedVars.isEmpty() || visitedVars.all { it.name == "this" }) {
-            println("No variables or only 'this' found. Skipping generation.")
+            TraceConfig.debug { "No variables or only 'this' found. Skipping generation." }
             return list
         }
 
         // 2. Debug: Check line number
-        println("Line number: $line")
+        TraceConfig.debug { "Line number: $line" }
 
         // Add instructions based on the line number
         when (line) {
@@ -317,7 +344,7 @@ class DetectTransformer(
         }
 
         // 3. Debug: Creating HashMap
-        println("Creating new HashMap")
+        TraceConfig.debug { "Creating new HashMap" }
         list.add(TypeInsnNode(NEW, "java/util/HashMap"))
         list.add(InsnNode(DUP))
         list.add(
@@ -330,12 +357,12 @@ class DetectTransformer(
         // 4. Process each local variable
         for (localVar in visitedVars) {
             if (localVar.name == "this") {
-                println("Skipping 'this' variable.")
+                TraceConfig.debug { "Skipping 'this' variable." }
                 continue
             }
 
             // 5. Debug: Print variable name and type
-            println("Processing variable: ${localVar.name}, Type: ${localVar.desc}")
+            TraceConfig.debug { "Processing variable: ${localVar.name}, Type: ${localVar.desc}" }
 
             list.add(InsnNode(DUP))
             list.add(LdcInsnNode(localVar.name))
@@ -343,13 +370,13 @@ class DetectTransformer(
 
             // 6. Debug: Check loaded variable value
             val loadedValue = loadVar(localVar)
-            println("Loading variable: ${localVar.name}, Value: $loadedValue")
+            TraceConfig.debug { "Loading variable: ${localVar.name}, Value: $loadedValue" }
 
 
             // 7. Debug: Check boxIfNeed
             val boxIfNeed = boxIfNeed(localVar.desc)
             if (boxIfNeed != null) {
-                println("Boxed instruction added for: ${localVar.name}")
+                TraceConfig.debug { "Boxed instruction added for: ${localVar.name}" }
                 list.add(boxIfNeed)
             }
 
@@ -363,20 +390,20 @@ class DetectTransformer(
             list.add(InsnNode(POP))
 
             // 8. Debug: After adding to HashMap
-            println("Variable '${localVar.name}' added to HashMap with value: $loadedValue")
+            TraceConfig.debug { "Variable '${localVar.name}' added to HashMap with value: $loadedValue" }
         }
 
         // 9. Debug: Add final relevant check
         if (relevant) {
-            println("Adding relevant flag: true")
+            TraceConfig.debug { "Adding relevant flag: true" }
             list.add(InsnNode(ICONST_1))
         } else {
-            println("Adding relevant flag: false")
+            TraceConfig.debug { "Adding relevant flag: false" }
             list.add(InsnNode(ICONST_0))
         }
 
         // 10. Debug: Add monitorLocalVar call
-        println("Adding monitorLocalVar method call")
+        TraceConfig.debug { "Adding monitorLocalVar method call" }
         list.add(
             MethodInsnNode(
                 AdviceAdapter.INVOKESTATIC, Type.getInternalName(DetectMonitor::class.java),
@@ -395,26 +422,26 @@ class DetectTransformer(
         val labelToLine = mutableMapOf<LabelNode, Int>()
         var currentLine = -1
         var firstLine = -1
-        println("Starting analyzeControlFlow for method: ${methodNode.name} in class: $owner")
+        TraceConfig.debug { "Starting analyzeControlFlow for method: ${methodNode.name} in class: $owner" }
 
         // Iterate through method instructions to map line numbers
         for (inst in methodNode.instructions) {
             if (inst is LineNumberNode) {
                 currentLine = inst.line
                 if (firstLine == -1) firstLine = currentLine
-                println("LineNumberNode found: $currentLine")
+                TraceConfig.debug { "LineNumberNode found: $currentLine" }
             }
             if (inst is LabelNode && currentLine != -1) {
                 labelToLine[inst] = currentLine
-                println("LabelNode found at line $currentLine")
+                TraceConfig.debug { "LabelNode found at line $currentLine" }
             }
         }
         val defaultLine = if (firstLine != -1) firstLine else 0
-        println("Default line set to: $defaultLine")
+        TraceConfig.debug { "Default line set to: $defaultLine" }
 
         // Collect local variable names by index
         val localVars = methodNode.localVariables?.associateBy({ it.index }, { it.name }) ?: emptyMap()
-        println("Local variables: $localVars")
+        TraceConfig.debug { "Local variables: $localVars" }
 
         val modifications = mutableListOf<Pair<AbstractInsnNode, InsnList>>()
         var i = 0
@@ -425,14 +452,14 @@ class DetectTransformer(
 
             // If it's a jump instruction
             if (inst is JumpInsnNode && inst.opcode != GOTO) {
-                println("Processing JumpInsnNode: ${inst.opcode}")
+                TraceConfig.debug { "Processing JumpInsnNode: ${inst.opcode}" }
 
                 // Helper function to find line number before the instruction
                 fun findLineNumberBefore(insn: AbstractInsnNode, default: Int): Int {
                     var current: AbstractInsnNode? = insn
                     while (current != null) {
                         if (current is LineNumberNode) {
-                            println("Found LineNumberNode before jump: ${current.line}")
+                            TraceConfig.debug { "Found LineNumberNode before jump: ${current.line}" }
                             return current.line
                         }
                         current = current.previous
@@ -441,7 +468,7 @@ class DetectTransformer(
                 }
 
                 val lineNumber = findLineNumberBefore(inst, defaultLine)
-                println("Line number for this jump: $lineNumber")
+                TraceConfig.debug { "Line number for this jump: $lineNumber" }
 
                 // Extract left-hand expression
                 var leftExpr = "unknown"
@@ -465,7 +492,7 @@ class DetectTransformer(
                     }
                     prevInst = prevInst.previous
                 }
-                println("Left-hand expression: $leftExpr")
+                TraceConfig.debug { "Left-hand expression: $leftExpr" }
 
                 // Extract right-hand expression for comparison opcodes
                 var rightExpr = "unknown"
@@ -485,7 +512,7 @@ class DetectTransformer(
                         rightInst = rightInst.previous
                     }
                 }
-                println("Right-hand expression: $rightExpr")
+                TraceConfig.debug { "Right-hand expression: $rightExpr" }
 
                 // Create the condition based on the opcode
                 val condition = when (inst.opcode) {
@@ -505,7 +532,7 @@ class DetectTransformer(
                     IFNULL -> "$leftExpr != null"
                     else -> "unknown_condition_${inst.opcode}"
                 }
-                println("Condition for jump: $condition")
+                TraceConfig.debug { "Condition for jump: $condition" }
 
                 // Insert monitoring before the jump (for branch not taken)
                 val monitorNotTakenInsnList = InsnList().apply {
@@ -546,7 +573,7 @@ class DetectTransformer(
                 modifications.add(inst.label.next to monitorNotTakenInsnList)      // 跳转到了 L1 ⇒ true 分支
                 modifications.add(inst.next to monitorTakenInsnList)
 
-                println("Monitoring instructions inserted for jump at index $i")
+                TraceConfig.debug { "Monitoring instructions inserted for jump at index $i" }
 
             }
 
@@ -572,7 +599,7 @@ class DetectTransformer(
                         )
                     }
                     modifications.add(inst to monitorLoopInsnList)
-                    println("Monitoring instructions inserted for loop at index $i")
+                    TraceConfig.debug { "Monitoring instructions inserted for loop at index $i" }
                 }
             }
             i++
@@ -581,10 +608,10 @@ class DetectTransformer(
         // Insert all modifications at the calculated positions
         for ((inst, insnList) in modifications) {
             methodNode.instructions.insertBefore(inst, insnList)
-            println("Inserted modifications before instruction at index ${methodNode.instructions.indexOf(inst)}")
+            TraceConfig.debug { "Inserted modifications before instruction at index ${methodNode.instructions.indexOf(inst)}" }
         }
 
-        println("Finished analyzeControlFlow for method: ${methodNode.name}")
+        TraceConfig.debug { "Finished analyzeControlFlow for method: ${methodNode.name}" }
     }
 
 
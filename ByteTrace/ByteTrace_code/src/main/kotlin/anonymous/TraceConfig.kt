@@ -0,0 +1,58 @@
+package anonymous
+
+import java.util.Properties
+
+/**
+ * Trace verbosity, read from the agent arguments file (the temp.properties written by Project.run_test).
+ *
+ * - trace.level: `calls` records method calls only, `flow` adds branches and loops, `vars` (default) adds
+ *   local variable snapshots. Events below the level are not instrumented at all.
+ * - trace.debug: print instrumentation and monitor debug output to stdout (default false).
+ * - trace.method.sample.every: record every n-th local variable snapshot of a method (default 1).
+ * - trace.method.max.events: at most this many snapshots per method, 0 = unlimited (default 0).
+ * - trace.loop.max.events: at most this many iterations per loop, 0 (default) = unlimited.
+ */
+object TraceConfig {
+    enum class Level { CALLS, FLOW, VARS }
+
+    private const val KEY_LEVEL = "trace.level"
+    private const val KEY_DEBUG = "trace.debug"
+    private const val KEY_SAMPLE_EVERY = "trace.method.sample.every"
+    private const val KEY_METHOD_MAX_EVENTS = "trace.method.max.events"
+    private const val KEY_LOOP_MAX_EVENTS = "trace.loop.max.events"
+
+    @JvmStatic
+    var level = Level.VARS
+        private set
+
+    @JvmStatic
+    var debugEnabled = false
+        private set
+
+    @JvmStatic
+    var sampleEvery = 1
+        private set
+
+    @JvmStatic
+    var methodMaxEvents = 0
+        private set
+
+    @JvmStatic
+    var loopMaxEvents = 0
+        private set
+
+    fun load(args: Properties) {
+        level = args.getProperty(KEY_LEVEL)?.trim()?.uppercase()
+            ?.let { name -> Level.values().firstOrNull { it.name == name } } ?: Level.VARS
+        debugEnabled = args.getProperty(KEY_DEBUG, "false").trim().toBoolean()
+        sampleEvery = args.getProperty(KEY_SAMPLE_EVERY)?.trim()?.toIntOrNull()?.coerceAtLeast(1) ?: 1
+        methodMaxEvents = args.getProperty(KEY_METHOD_MAX_EVENTS)?.trim()?.toIntOrNull()?.coerceAtLeast(0) ?: 0
+        loopMaxEvents = args.getProperty(KEY_LOOP_MAX_EVENTS)?.trim()?.toIntOrNull()?.coerceAtLeast(0) ?: 0
+    }
+
+    fun traces(required: Level) = level >= required
+
+    inline fun debug(message: () -> String) {
+        if (debugEnabled) println(message())
+    }
+}
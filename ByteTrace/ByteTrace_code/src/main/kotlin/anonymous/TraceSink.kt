@@ -0,0 +1,149 @@
+package anonymous
+
+import anonymous.logger.ori.OriDebugLoggerHelper
+import anonymous.logger.small.SmallDebugLoggerHelper
+import java.io.BufferedOutputStream
+import java.io.DataOutputStream
+import java.io.File
+import java.io.FileOutputStream
+import java.io.IOException
+import java.util.Properties
+import java.util.concurrent.ArrayBlockingQueue
+import java.util.concurrent.TimeUnit
+import java.util.concurrent.atomic.AtomicLong
+
+/**
+ * Destination of the trace events.
+ *
+ * With `trace.sink=log` (default) events go to the small / ori log4j loggers as before. With `trace.sink=binary`
+ * they are queued and written by a background thread to `trace.sink.path` in a length-prefixed format:
+ *
+ * - header: the magic `BTRC` and a version byte;
+ * - record: payload length (u32, big endian), stream (u8: 0 small, 1 ori), kind (u8), payload (UTF-8 line
+ *   `{class}:{method}:{line}->[{kind}] {payload}`, the same text the loggers write).
+ *
+ * Events are never dropped silently: when the queue is full (trace.sink.queue.capacity) or the file reached
+ * trace.sink.max.bytes, a [KIND_TRUNCATED] record says how many events were lost.
+ */
+object TraceSink {
+    const val STREAM_SMALL = 0
+    const val STREAM_ORI = 1
+
+    const val KIND_LOCAL_VARIABLES = 1
+    const val KIND_CONTROL_FLOW = 2
+    const val KIND_METHOD_CALL = 3
+    const val KIND_TRUNCATED = 127
+    private const val KIND_END = 0
+
+    private val MAGIC = byteArrayOf('B'.code.toByte(), 'T'.code.toByte(), 'R'.code.toByte(), 'C'.code.toByte())
+    private const val VERSION = 1
+
+    private const val KEY_SINK = "trace.sink"
+    private const val KEY_SINK_PATH = "trace.sink.path"
+    private const val KEY_QUEUE_CAPACITY = "trace.sink.queue.capacity"
+    private const val KEY_MAX_BYTES = "trace.sink.max.bytes"
+
+    private class Event(val stream: Int, val kind: Int, val line: String)
+
+    private val END = Event(STREAM_SMALL, KIND_END, "")
+
+    @Volatile
+    private var queue: ArrayBlockingQueue<Event>? = null
+    private var out: DataOutputStream? = null
+    private var maxBytes = 0L
+    private var writtenBytes = 0L
+    private val dropped = AtomicLong()
+    private var overLimit = 0L
+
+    fun load(args: Properties) {
+        if (args.getProperty(KEY_SINK, "log").trim().lowercase() != "binary") return
+        val path = args.getProperty(KEY_SINK_PATH)?.trim()?.takeIf { it.isNotEmpty() } ?: "bugDetect.trace"
+        val capacity = args.getProperty(KEY_QUEUE_CAPACITY)?.trim()?.toIntOrNull()?.coerceAtLeast(1) ?: 65536
+        maxBytes = args.getProperty(KEY_MAX_BYTES)?.trim()?.toLongOrNull()?.coerceAtLeast(0) ?: 0L
+        try {
+            val stream = DataOutputStream(BufferedOutputStream(FileOutputStream(File(path)), 1 shl 16))
+            stream.write(MAGIC)
+            stream.writeByte(VERSION)
+            out = stream
+        } catch (e: IOException) {
+            System.err.println("Error when opening trace file: $path! Falling back to the log files.")
+            return
+        }
+        queue = ArrayBlockingQueue(capacity)
+        val writer = Thread(::drain, "ByteTrace-writer").apply { isDaemon = true }
+        writer.start()
+        Runtime.getRuntime().addShutdownHook(Thread {
+            queue!!.offer(END, 5, TimeUnit.SECONDS)
+            writer.join(10_000)
+        })
+        TraceConfig.debug { "Binary trace sink: $path, queue capacity $capacity" }
+    }
+
+    /**
+     * Record one event; [line] is only built when the event is kept.
+     */
+    inline fun emit(stream: Int, kind: Int, crossinline line: () -> String) {
+        if (binary()) {
+            offer(stream, kind, line())
+        } else if (stream == STREAM_ORI) {
+            OriDebugLoggerHelper.logger.info { line() }
+        } else {
+            SmallDebugLoggerHelper.logger.info { line() }
+        }
+    }
+
+    fun binary() = queue != null
+
+    fun offer(stream: Int, kind: Int, line: String) {
+        if (!queue!!.offer(Event(stream, kind, line))) {
+            dropped.incrementAndGet()
+        }
+    }
+
+    private fun drain() {
+        val queue = queue!!
+        val out = out!!
+        try {
+            while (true) {
+                val event = queue.poll(100, TimeUnit.MILLISECONDS)
+                val lost = dropped.getAndSet(0)
+                if (lost > 0) {
+                    write(out, STREAM_SMALL, KIND_TRUNCATED, "[Trace Truncated] $lost events dropped, the trace queue was full")
+                }
+                if (event == null) {
+                    out.flush()
+                    continue
+                }
+                if (event === END) break
+                if (maxBytes > 0 && writtenBytes >= maxBytes) {
+                    overLimit++
+                    continue
+                }
+                write(out, event.stream, event.kind, event.line)
+            }
+            if (overLimit > 0) {
+                write(out, STREAM_SMALL, KIND_TRUNCATED,
+                    "[Trace Truncated] $overLimit events not recorded, the trace reached $maxBytes bytes")
+            }
+        } catch (e: IOException) {
+            System.err.println("Error when writing the trace: ${e.message}")
+        } catch (e: InterruptedException) {
+            Thread.currentThread().interrupt()
+        } finally {
+            try {
+                out.close()
+            } catch (e: IOException) {
+                System.err.println("Error when closing the trace: ${e.message}")
+            }
+        }
+    }
+
+    private fun write(out: DataOutputStream, stream: Int, kind: Int, line: String) {
+        val payload = line.toByteArray(Charsets.UTF_8)
+        out.writeInt(payload.size)
+        out.writeByte(stream)
+        out.writeByte(kind)
+        out.write(payload)
+        writtenBytes += payload.size + 6
+    }
+}
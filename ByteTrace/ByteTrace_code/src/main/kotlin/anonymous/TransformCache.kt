@@ -0,0 +1,88 @@
+package anonymous
+
+import java.io.File
+import java.io.IOException
+import java.security.MessageDigest
+import java.util.Properties
+
+/**
+ * On-disk cache of instrumented class bytes shared by the traced JVMs.
+ *
+ * An entry is keyed on the SHA-256 of the agent build (the hash of the agent jar's content), the
+ * instrumentation options, the class name and the original bytecode, so a changed class, method selection,
+ * trace level or a rebuilt agent never reuses a stale entry. Entries are written to a temporary file and renamed,
+ * so concurrent JVMs sharing `trace.cache.dir` only ever see complete files. A hit refreshes the entry's
+ * modification time, the Python side evicts the least recently used entries beyond its size and age limits.
+ */
+class TransformCache private constructor(private val dir: File, version: String, options: String) {
+    private val prefix = "$version\n$options\n".toByteArray(Charsets.UTF_8)
+
+    private fun entry(className: String, original: ByteArray): File {
+        val digest = MessageDigest.getInstance("SHA-256")
+        digest.update(prefix)
+        digest.update("$className\n".toByteArray(Charsets.UTF_8))
+        digest.update(original)
+        val key = digest.digest().joinToString("") { "%02x".format(it) }
+        return File(File(dir, key.substring(0, 2)), "$key.class")
+    }
+
+    fun get(className: String, original: ByteArray): ByteArray? {
+        val file = entry(className, original)
+        return try {
+            if (file.isFile) file.readBytes().also { file.setLastModified(System.currentTimeMillis()) } else null
+        } catch (e: IOException) {
+            null
+        }
+    }
+
+    fun put(className: String, original: ByteArray, transformed: ByteArray) {
+        val file = entry(className, original)
+        try {
+            file.parentFile.mkdirs()
+            val tmp = File.createTempFile(file.name, ".tmp", file.parentFile)
+            tmp.writeBytes(transformed)
+            if (!tmp.renameTo(file)) {
+                tmp.delete()
+            }
+        } catch (e: IOException) {
+            TraceConfig.debug { "Could not cache $className: ${e.message}" }
+        }
+    }
+
+    companion object {
+        private const val KEY_CACHE_DIR = "trace.cache.dir"
+
+        private val agentVersion: String? by lazy {
+            val location = try {
+                File(TransformCache::class.java.protectionDomain.codeSource.location.toURI())
+            } catch (e: Exception) {
+                null
+            }
+            if (location == null || !location.isFile) return@lazy null
+            try {
+                val digest = MessageDigest.getInstance("SHA-256")
+                location.inputStream().use { input ->
+                    val buffer = ByteArray(1 shl 16)
+                    while (true) {
+                        val read = input.read(buffer)
+                        if (read < 0) break
+                        digest.update(buffer, 0, read)
+                    }
+                }
+                digest.digest().joinToString("") { "%02x".format(it) }
+            } catch (e: IOException) {
+                null
+            }
+        }
+
+        /**
+         * The cache configured by `trace.cache.dir`, or null when caching is off or the agent is not run from a jar.
+         */
+        fun load(args: Properties, options: String): TransformCache? {
+            val dir = args.getProperty(KEY_CACHE_DIR)?.trim()?.takeIf { it.isNotEmpty() } ?: return null
+            val version = agentVersion ?: return null
+            TraceConfig.debug { "Instrumented class cache: $dir" }
+            return TransformCache(File(dir), version, options)
+        }
+    }
+}
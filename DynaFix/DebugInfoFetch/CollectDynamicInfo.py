@@ -10,6 +10,7 @@ from filelock import FileLock
 import concurrent.futures
 from Project import Project
 from ExtractDebugInfo import *
+from admission import configure as configure_admission, GB
 import ast
 
 parser = argparse.ArgumentParser(description="Extract debug information for Defects4J projects")
@@ -21,10 +22,57 @@ parser.add_argument('--checkout_path', default="/path/to/defects4j_buggy", type=
                     help="Path to checked-out Defects4J projects")
 parser.add_argument('--major_root', default="/path/to/defects4j/major", type=str,
                     help="Path to Defects4J major root")
+parser.add_argument('--scope', default='auto', choices=['auto', 'file', 'stack'],
+                    help="Methods to instrument: the <pid>_<bid>b.txt location file, planned from the failing stack, "
+                         "or the file when it exists and the stack otherwise")
+parser.add_argument('--scope_depth', default=2, type=int,
+                    help="Relevant stack frames per failing test, or call graph levels below the test method")
+parser.add_argument('--scope_max_methods', default=20, type=int,
+                    help="Most methods a planned scope instruments")
+parser.add_argument('--bytetrace_jar', default=BYTETRACE_JAR, type=str,
+                    help="ByteTrace.jar used by ant_debug; trace options it predates are not passed on")
+parser.add_argument('--trace_level', default=None, choices=['calls', 'flow', 'vars'],
+                    help="ByteTrace verbosity: method calls only, plus branches and loops, or plus local variables (default)")
+parser.add_argument('--trace_sample_every', default=None, type=int,
+                    help="Record every n-th local variable snapshot of a method")
+parser.add_argument('--trace_method_max_events', default=None, type=int,
+                    help="At most this many local variable snapshots per method (0 = unlimited)")
+parser.add_argument('--trace_loop_max_events', default=None, type=int,
+                    help="At most this many recorded iterations per loop (default: unlimited)")
+parser.add_argument('--trace_debug', action='store_true',
+                    help="Print ByteTrace instrumentation debug output to stdout")
+parser.add_argument('--trace_sink', default='log', choices=['binary', 'log'],
+                    help="Write traces to the 5KB rolling logs, or to a complete binary file from a background thread "
+                         "(needs a rebuilt ByteTrace.jar)")
+parser.add_argument('--trace_max_bytes', default=None, type=int,
+                    help="Size limit of a binary trace, later events are counted in a truncation marker (0 = unlimited)")
+parser.add_argument('--trace_cache_dir', default=os.path.expanduser("~/.cache/bytetrace"), type=str,
+                    help="Cache of instrumented classes shared by the traced JVMs ('' to disable)")
+parser.add_argument('--trace_cache_max_mb', default=2048, type=int,
+                    help="Size limit of --trace_cache_dir, least recently used entries are evicted (0 = unlimited)")
+parser.add_argument('--trace_cache_max_age_days', default=30, type=int,
+                    help="Entries of --trace_cache_dir unused for this many days are evicted (0 = keep)")
+parser.add_argument('--max_jobs', default=0, type=int,
+                    help="Most traced test runs at once; fewer run when memory or CPU is short (0 = number of CPUs)")
+parser.add_argument('--memory_reserve', default=0.1, type=float,
+                    help="Fraction of the host memory never given to test runs")
+parser.add_argument('--jvm_peak_default', default=1.5, type=float,
+                    help="Expected peak GB of a project's JVMs until one of its runs has been measured")
+parser.add_argument('--max_load', default=1.5, type=float,
+                    help="1-minute load average per CPU above which no new test run starts")
+parser.add_argument('--admission_state', default=os.path.expanduser("~/.cache/dynafix/jvm_peaks.json"), type=str,
+                    help="File keeping the learned peak memory of each project's JVMs across runs")
 args = parser.parse_args()
 
 eventlet.monkey_patch()
 
+prune_transform_cache(args.trace_cache_dir, args.trace_cache_max_mb * 1024 ** 2, args.trace_cache_max_age_days)
+
+os.makedirs(os.path.dirname(os.path.abspath(args.admission_state)), exist_ok=True)
+admission = configure_admission(args.admission_state, max_jobs=args.max_jobs,
+                                default_peak=args.jvm_peak_default * GB, memory_reserve=args.memory_reserve,
+                                max_load=args.max_load)
+
 # ========== Replace ant with ant_debug ==========
 _debug_ant_path = os.path.join(args.major_root, "bin", "ant_debug")
 if not os.path.exists(_debug_ant_path):
@@ -45,23 +93,29 @@ shutil.copy2(_debug_ant_path, ant_original)
 try:
     # ========== Main logic starts ==========
 
-    # Regular expression matching filename format "{pid}_{bid}b_{num}.txt"
-    file_pattern = re.compile(r"(\w+)_(\d+)b_(\d+)\.txt")
+    # Regular expression matching filename format "{pid}_{bid}b.txt" or "{pid}_{bid}b_{num}.txt"
+    file_pattern = re.compile(r"(\w+?)_(\d+)b(?:_\d+)?\.txt")
 
-    # Get all filenames in the folder
+    # Get all bugs in the folder; the files of one bug share its checkout, so it is traced once
     all_ids = []
-    for filename in os.listdir(args.input_path):
-        match = file_pattern.match(filename)
-        if match:
-            pid, bid, num = match.groups()
-            all_ids.append((pid, int(bid), int(num)))
+    for filename in sorted(os.listdir(args.input_path)):
+        match = file_pattern.fullmatch(filename)
+        if match and (match.group(1), int(match.group(2))) not in all_ids:
+            all_ids.append((match.group(1), int(match.group(2))))
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
-        futures = [
-            executor.submit(extract_debug_info, pid, bid, num, dynamic=False, iteration=0, args=args)
-            for pid, bid, num in all_ids
-        ]
-        concurrent.futures.wait(futures)
+    # One worker per admissible job; admission decides how many of them run a JVM at a time
+    with concurrent.futures.ThreadPoolExecutor(max_workers=admission.max_jobs) as executor:
+        futures = {
+            executor.submit(extract_debug_info, pid, bid, dynamic=False, iteration=0, args=args): f"{pid}_{bid}b"
+            for pid, bid in all_ids
+        }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"[ERROR] Trace collection for {futures[future]} failed: {str(e)}")
+                traceback.print_exc()
+    print(f"[INFO] Admission: {admission.summary()}")
 
 finally:
     # ========== Restore original ant ==========
@@ -5,9 +5,16 @@ import traceback
 import os
 import eventlet
 import argparse
+import functools
+import threading
+import time
+import zipfile
 from filelock import FileLock
 import concurrent.futures
 from .Project import Project
+from .ScopePlanner import ScopePlanner
+from timing import span
+from admission import admit
 
 
 def parse_id_range(id_range_str):
@@ -25,6 +32,119 @@ def parse_id_range(id_range_str):
     return sorted(ids)
 
 
+BYTETRACE_JAR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "ByteTrace",
+                                              "ByteTrace.jar"))
+# Settings an agent build only understands when it contains the class that reads them
+AGENT_OPTION_CLASSES = {
+    'TraceConfig': ('trace.level', 'trace.method.sample.every', 'trace.method.max.events', 'trace.loop.max.events',
+                    'trace.debug'),
+    'TraceSink': ('trace.sink', 'trace.sink.max.bytes'),
+    'TransformCache': ('trace.cache.dir',),
+}
+_warned_options = set()
+
+
+@functools.lru_cache(maxsize=None)
+def agent_classes(jar_path):
+    """Simple names of the top-level classes in an agent jar, None when it cannot be read"""
+    try:
+        with zipfile.ZipFile(jar_path) as jar:
+            names = jar.namelist()
+    except (OSError, zipfile.BadZipFile):
+        return None
+    return {os.path.basename(name)[:-len(".class")] for name in names if name.endswith(".class") and "$" not in name}
+
+
+def supported_options(options, jar_path):
+    """Drop the settings the agent jar predates, so they are not silently ignored"""
+    classes = agent_classes(os.path.abspath(jar_path))
+    if classes is None:
+        return options
+    unsupported = {key for cls, keys in AGENT_OPTION_CLASSES.items() if cls not in classes for key in keys}
+    dropped = sorted(unsupported & options.keys())
+    if dropped and tuple(dropped) not in _warned_options:
+        _warned_options.add(tuple(dropped))
+        print(f"[WARNING] {jar_path} predates {', '.join(dropped)}, rebuild it from ByteTrace_code to use them")
+    return {key: value for key, value in options.items() if key not in unsupported}
+
+
+def prune_transform_cache(cache_dir, max_bytes, max_age_days):
+    """
+    Keep ByteTrace's instrumented class cache within max_bytes (0 = unlimited): entries older than max_age_days
+    (0 = no limit) go first, then the least recently used ones. The agent refreshes an entry's mtime on every hit.
+    """
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return
+    entries = []
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    cutoff = time.time() - max_age_days * 86400 if max_age_days else None
+    removed = 0
+    for mtime, size, path in entries:
+        if (cutoff is None or mtime >= cutoff) and (not max_bytes or total <= max_bytes):
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    if removed:
+        print(f"[INFO] Pruned {removed} entries from {cache_dir}, {total / 1024 ** 2:.0f} MB left")
+
+
+def trace_options(args):
+    """ByteTrace verbosity settings from the command line, None ones left to the agent defaults"""
+    options = {
+        'trace.level': getattr(args, 'trace_level', None),
+        'trace.method.sample.every': getattr(args, 'trace_sample_every', None),
+        'trace.method.max.events': getattr(args, 'trace_method_max_events', None),
+        'trace.loop.max.events': getattr(args, 'trace_loop_max_events', None),
+        'trace.debug': 'true' if getattr(args, 'trace_debug', False) else None,
+        'trace.sink': getattr(args, 'trace_sink', None),
+        'trace.sink.max.bytes': getattr(args, 'trace_max_bytes', None),
+        'trace.cache.dir': getattr(args, 'trace_cache_dir', None) or None,
+    }
+    options = {key: value for key, value in options.items() if value is not None}
+    return supported_options(options, getattr(args, 'bytetrace_jar', None) or BYTETRACE_JAR)
+
+
+def plan_instrumentation_scope(project, pid, bid, trigger_test_methods, d4j_executable, args):
+    """
+    Methods to instrument, planned from the stacks in the checkout's failing_tests file. Without one, the first
+    trigger test is run once with nothing instrumented to produce it.
+    """
+    failing_tests_path = os.path.join(project.base_dir, "failing_tests")
+    if not os.path.exists(failing_tests_path):
+        print(f"[INFO] No failing_tests for {pid}_{bid}b, running {trigger_test_methods[0]} to get the failing stack")
+        try:
+            with admit(pid, project.base_dir), eventlet.Timeout(900), \
+                    span("scope_scouting", test=trigger_test_methods[0]):
+                project.run_test(single_test=trigger_test_methods[0], pid=pid, bid=bid,
+                                 test_method=trigger_test_methods[0], d4j_exec=d4j_executable,
+                                 checkout_path=args.checkout_path, instrument=False)
+        except eventlet.Timeout:
+            print(f"[WARNING] Scouting run of {trigger_test_methods[0]} timed out")
+            return ""
+    if not os.path.exists(failing_tests_path):
+        return ""
+    with open(failing_tests_path, "r", encoding="utf-8", errors="replace") as f:
+        failing_tests = f.read()
+    planner = ScopePlanner(project, max_depth=getattr(args, "scope_depth", 2),
+                           max_methods=getattr(args, "scope_max_methods", 20))
+    methods = planner.plan(failing_tests)
+    print(f"[INFO] Instrumentation scope of {pid}_{bid}b: {', '.join(methods) or 'empty'}")
+    return ",".join(methods)
+
+
 def extract_debug_info(pid, bid, dynamic=False, width=0, iteration=0, args=None):
     """Extract debug info for the specified project and process method calls"""
     version_str = f"{pid}_{bid}b"
@@ -73,19 +193,6 @@ def extract_debug_info(pid, bid, dynamic=False, width=0, iteration=0, args=None)
         traceback.print_exc()
         return
 
-    _locate_file = os.path.join(args.input_path, f"{pid}_{bid}b.txt")
-    if not os.path.exists(_locate_file):
-        print(f"Method location file not found for {pid}_{bid}b: {_locate_file}")
-        return
-
-    try:
-        with open(_locate_file, "r") as _f:
-            _methods_located = ",".join(_f.read().strip().splitlines())
-    except Exception as e:
-        print(f"Failed to read method location file for {pid}_{bid}b: {str(e)}")
-        traceback.print_exc()
-        return
-
     print(f"Running tests for {version_str}")
     try:
         trigger_test_methods = project.trigger_test_methods().split(",")
@@ -97,10 +204,35 @@ def extract_debug_info(pid, bid, dynamic=False, width=0, iteration=0, args=None)
     d4j_root = os.path.dirname(args.major_root)
     d4j_executable = os.path.join(d4j_root, "framework", "bin", "defects4j")
 
+    scope = getattr(args, "scope", "file")
+    _locate_file = os.path.join(args.input_path, f"{pid}_{bid}b.txt")
+    if scope != "stack" and os.path.exists(_locate_file):
+        try:
+            with open(_locate_file, "r") as _f:
+                _methods_located = ",".join(_f.read().strip().splitlines())
+        except Exception as e:
+            print(f"Failed to read method location file for {pid}_{bid}b: {str(e)}")
+            traceback.print_exc()
+            return
+    elif scope != "file":
+        try:
+            _methods_located = plan_instrumentation_scope(project, pid, bid, trigger_test_methods, d4j_executable, args)
+        except Exception as e:
+            print(f"Failed to plan the instrumentation scope for {pid}_{bid}b: {str(e)}")
+            traceback.print_exc()
+            return
+        if not _methods_located:
+            print(f"No instrumentation scope found in the failing stacks of {version_str}")
+            return
+    else:
+        print(f"Method location file not found for {pid}_{bid}b: {_locate_file}")
+        return
+
     for method in trigger_test_methods:
         try:
             print(f"Running test method: {method}")
-            with eventlet.Timeout(900):
+            # Admission waits for memory before the timeout starts
+            with admit(pid, project.base_dir), eventlet.Timeout(900), span("traced_test", test=method):
                 project.run_test(
                     single_test=method,
                     pid=pid,
@@ -108,7 +240,8 @@ def extract_debug_info(pid, bid, dynamic=False, width=0, iteration=0, args=None)
                     test_method=method,
                     methods_located=_methods_located,
                     d4j_exec=d4j_executable,
-                    checkout_path=args.checkout_path
+                    checkout_path=args.checkout_path,
+                    trace_options=trace_options(args)
                 )
         except eventlet.Timeout:
             print(f"Test execution timed out for {method} in {version_str}")
@@ -131,7 +264,8 @@ def extract_debug_info(pid, bid, dynamic=False, width=0, iteration=0, args=None)
 
     # Extract method call information
     if os.path.exists(_debug_info_output):
-        extract_method_calls_with_source(_debug_info_output, _method_calls_output, checkout_path)
+        with span("method_call_extraction"):
+            extract_method_calls_with_source(_debug_info_output, _method_calls_output, checkout_path)
     else:
         print(f"Debug info file not found for {version_str}: {_debug_info_output}")
 
@@ -256,11 +390,21 @@ def extract_method_calls_with_source(debug_info_file, output_file, checkout_path
         traceback.print_exc()
 
 
+# Held from backing up ant until it is restored, so two threads never swap the same ant
+ANT_SWAP_LOCK = threading.Lock()
+
+
 def replace_ant_and_extract_debug_info(pid, bid, width, j, args):
     """
-    Replace ant and extract debug info (lock-free version)
-    Prerequisite: When calling this function, the directory pointed to by args.major_root is exclusive to the current process and not shared with other processes.
+    Replace ant and extract debug info
+    Prerequisite: the directory pointed to by args.major_root is not shared with other processes, and no other thread
+    of this process runs Defects4J while the swap lasts.
     """
+    with ANT_SWAP_LOCK:
+        _replace_ant_and_extract_debug_info(pid, bid, width, j, args)
+
+
+def _replace_ant_and_extract_debug_info(pid, bid, width, j, args):
     ant_dir = os.path.join(args.major_root, "bin")
     ant_original = os.path.join(ant_dir, "ant")
     _debug_ant_path = os.path.join(ant_dir, "ant_debug")
@@ -291,7 +435,8 @@ def replace_ant_and_extract_debug_info(pid, bid, width, j, args):
     # 3. Execute task and ensure restoration
     try:
         # Extract debug info
-        extract_debug_info(pid, bid, dynamic=True, width=width, iteration=j, args=args)
+        with span("trace_collection", slug=f"{pid}_{bid}", width=width, iteration=j):
+            extract_debug_info(pid, bid, dynamic=True, width=width, iteration=j, args=args)
     finally:
         # 4. Restore original ant (will execute regardless of errors above)
         if os.path.exists(ant_backup):
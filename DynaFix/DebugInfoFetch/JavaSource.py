@@ -0,0 +1,82 @@
+import re
+
+# Lexical helpers for Java source (top-level members, method signatures),
+# shared by the scope planner and the patch extractor
+HEADER_CALL_PATTERN = re.compile(r"(@?)\b([A-Za-z_$][\w$]*)\s*\(")
+NOT_METHOD_NAMES = {'if', 'for', 'while', 'switch', 'catch', 'synchronized', 'return', 'new', 'throw', 'super',
+                    'this'}
+
+
+def _skip_literal(code, i):
+    """Index just after the string/char literal or comment starting at i, or i if there is none"""
+    if code.startswith('//', i):
+        end = code.find('\n', i)
+        return len(code) if end == -1 else end + 1
+    if code.startswith('/*', i):
+        end = code.find('*/', i + 2)
+        return len(code) if end == -1 else end + 2
+    if code[i] in '"\'':
+        quote, j = code[i], i + 1
+        while j < len(code) and code[j] != quote and code[j] != '\n':
+            j += 2 if code[j] == '\\' else 1
+        return j + 1
+    return i
+
+
+def split_members(code):
+    """Split Java source into its top-level brace-balanced members (methods, or classes containing them)"""
+    members, depth, start, i = [], 0, 0, 0
+    while i < len(code):
+        j = _skip_literal(code, i)
+        if j != i:
+            i = j
+            continue
+        if code[i] == '{':
+            depth += 1
+        elif code[i] == '}':
+            depth -= 1
+            if depth == 0:
+                members.append(code[start:i + 1].strip())
+                start = i + 1
+            depth = max(depth, 0)
+        elif code[i] == ';' and depth == 0:
+            # Fields, imports and package statements between members
+            start = i + 1
+        i += 1
+    return [member for member in members if member]
+
+
+def strip_comments(code):
+    out, i = [], 0
+    while i < len(code):
+        j = _skip_literal(code, i)
+        if j != i:
+            if code[i] in '"\'':
+                out.append(code[i:j])
+            else:
+                out.append(' ')
+            i = j
+            continue
+        out.append(code[i])
+        i += 1
+    return ''.join(out)
+
+
+def signature(code):
+    """(name, parameter types) of the first method declared in code, None if there is none"""
+    header = strip_comments(code).split('{', 1)[0]
+    for match in reversed(list(HEADER_CALL_PATTERN.finditer(header))):
+        if match.group(1) or match.group(2) in NOT_METHOD_NAMES:
+            continue
+        params_text, depth, end = '', 1, match.end()
+        while end < len(header) and depth:
+            depth += {'(': 1, ')': -1}.get(header[end], 0)
+            end += 1
+        params_text = header[match.end():end - 1]
+        params = []
+        for param in re.split(r',(?![^<]*>)', params_text):
+            param = re.sub(r'@\w+(\([^)]*\))?|\bfinal\b', ' ', param).split()
+            if len(param) >= 2:
+                params.append(re.sub(r'\s+', '', ''.join(param[:-1])))
+        return match.group(2), tuple(params)
+    return None
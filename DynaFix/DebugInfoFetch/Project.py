@@ -1,7 +1,9 @@
 import os
-import subprocess
+import shutil
 import traceback
 from dotenv import dotenv_values, find_dotenv, load_dotenv
+from output_capture import run_captured, new_spool_path
+from .TraceReader import read_trace_events, STREAM_SMALL, STREAM_ORI, TRACE_MAGIC
 
 # Load environment variables
 _ = load_dotenv(find_dotenv())
@@ -22,6 +24,10 @@ D4J_TRIGGER_KEY = "d4j.tests.trigger"
 
 KEY_ARGS_USE_SPECIFIED = "args.use.specified"
 KEY_ARGS_METHODS = "args.methods"
+KEY_ARGS_CLASSES = "args.classes"
+# ByteTrace falls back to every relevant class when no class or method is specified, so a run that should not be
+# instrumented names a class that does not exist instead
+NO_INSTRUMENTATION_CLASS = "dynafix.NotInstrumented"
 
 
 class Project:
@@ -37,17 +43,24 @@ class Project:
         # Added: store dynamic log paths
         self._bug_detect_log = None
         self._bug_detect_ori_log = None
+        self._bug_detect_trace = None
 
     def trigger_test_methods(self):
         return self._trigger_test_methods
 
+    def d4j_config(self, key, default=""):
+        return self._d4j_configs.get(key) or default
+
     def run_test(self, single_test: str = None, relevant=True, pid: str = None, bid: int = None,
                  test_method: str = None, methods_located: str = None,
-                 d4j_exec: str = None, checkout_path: str = None):
+                 d4j_exec: str = None, checkout_path: str = None, trace_options: dict = None,
+                 instrument: bool = True):
         """
         Run test and generate dynamic trace logs.
         d4j_exec: Dynamically specified defects4j executable path
         checkout_path: Dynamically specified project checkout parent directory
+        trace_options: Extra ByteTrace settings written to temp.properties (trace.level, trace.loop.max.events ...)
+        instrument: False to run the test without instrumenting any class (methods_located is ignored)
         """
         # 1. Path decision: prioritize passed arguments, otherwise fallback to environment variables (compatible with old logic)
         _d4j_exec = d4j_exec if d4j_exec else D4J_EXEC
@@ -61,11 +74,13 @@ class Project:
         bug_detect_log = os.path.join(self.base_dir, f"bugDetect_{pid}_{bid}_{test_method.replace('::', '_')}.log")
         bug_detect_ori_log = os.path.join(self.base_dir,
                                           f"bugDetectOri_{pid}_{bid}_{test_method.replace('::', '_')}.log")
+        bug_detect_trace = os.path.join(self.base_dir, f"bugDetect_{pid}_{bid}_{test_method.replace('::', '_')}.trace")
         failing_tests_path = os.path.join(self.base_dir, "failing_tests")
 
         # Store log paths for subsequent raw_debug_info reading
         self._bug_detect_log = bug_detect_log
         self._bug_detect_ori_log = bug_detect_ori_log
+        self._bug_detect_trace = bug_detect_trace
 
         if not os.path.exists(current_checkout_path):
             print(f"[ERROR] Project {current_checkout_path} not found. Skipping...")
@@ -78,7 +93,8 @@ class Project:
         # 5. Clean up old traces
         try:
             files_to_clean = [bug_detect_log, bug_detect_ori_log, failing_tests_path,
-                              f"{bug_detect_log}.1", f"{bug_detect_ori_log}.1", temp_properties]
+                              f"{bug_detect_log}.1", f"{bug_detect_ori_log}.1", temp_properties,
+                              bug_detect_trace]
             for file in files_to_clean:
                 if os.path.exists(file):
                     os.remove(file)
@@ -89,10 +105,18 @@ class Project:
         try:
             with open(temp_properties, "w") as f:
                 f.write(f"{KEY_ARGS_USE_SPECIFIED}=true\n")
-                f.write(f"{KEY_ARGS_METHODS}={methods_located}\n")
+                if instrument:
+                    f.write(f"{KEY_ARGS_METHODS}={methods_located}\n")
+                else:
+                    f.write(f"{KEY_ARGS_METHODS}=\n")
+                    f.write(f"{KEY_ARGS_CLASSES}={NO_INSTRUMENTATION_CLASS}\n")
                 # Must use absolute paths to ensure Java Agent can accurately find the write location
                 f.write(f"log.file.path={os.path.abspath(bug_detect_log)}\n")
                 f.write(f"ori.log.file.path={os.path.abspath(bug_detect_ori_log)}\n")
+                for key, value in (trace_options or {}).items():
+                    f.write(f"{key}={value}\n")
+                if (trace_options or {}).get("trace.sink") == "binary":
+                    f.write(f"trace.sink.path={os.path.abspath(bug_detect_trace)}\n")
         except Exception as e:
             print(f"[ERROR] Failed to write temp.properties: {str(e)}")
             return "error"
@@ -105,46 +129,48 @@ class Project:
         else:
             cmd = f"{_d4j_exec} test"
 
-        # 8. Execute test process
+        # 8. Execute test process; console output is spooled to temp files instead of being held in memory
+        stdout_spool = new_spool_path(f"{pid}_{bid}_stdout")
+        stderr_spool = new_spool_path(f"{pid}_{bid}_stderr")
         try:
-            env = os.environ.copy()
-            # Inject configuration path into environment variables for ant script recognition
-            env["TEMP_PROPERTIES"] = temp_properties
-
-            print(f"[EXEC] Running: {cmd}")
-            result = subprocess.run(
-                cmd,
-                shell=True,
-                stderr=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                cwd=self.base_dir,
-                text=True,
-                env=env
-            )
-            stdout = result.stdout
-            stderr = result.stderr
-        except Exception as e:
-            print(f"[ERROR] Subprocess failed: {str(e)}")
-            traceback.print_exc()
-            return "error"
-
-        # 9. Fault tolerance: if instrumentation fails to generate logs, save console output to log file
-        has_trace_log = os.path.exists(bug_detect_log) and os.path.getsize(bug_detect_log) > 0
-        has_ori_log = os.path.exists(bug_detect_ori_log) and os.path.getsize(bug_detect_ori_log) > 0
-
-        # Modified logic: only fallback to stdout/stderr when neither log is generated
-        if not has_trace_log and not has_ori_log:
-            print(
-                f"[INFO] No instrumentation logs found ({bug_detect_log} or {bug_detect_ori_log}). Falling back to stdout/stderr.")
             try:
-                # Write stdout to log file only on complete failure for troubleshooting
-                with open(bug_detect_log, "w") as f:
-                    f.write("=== stdout ===\n")
-                    f.write(stdout)
-                    f.write("\n=== stderr ===\n")
-                    f.write(stderr)
+                env = os.environ.copy()
+                # Inject configuration path into environment variables for ant script recognition
+                env["TEMP_PROPERTIES"] = temp_properties
+
+                print(f"[EXEC] Running: {cmd}")
+                run_captured(cmd, stdout_spool, stderr_spool_path=stderr_spool, shell=True, cwd=self.base_dir,
+                             env=env)
             except Exception as e:
-                print(f"Failed to write fallback log: {str(e)}")
+                print(f"[ERROR] Subprocess failed: {str(e)}")
+                traceback.print_exc()
+                return "error"
+
+            # 9. Fault tolerance: if instrumentation fails to generate logs, save console output to log file
+            has_trace_log = os.path.exists(bug_detect_log) and os.path.getsize(bug_detect_log) > 0
+            has_ori_log = os.path.exists(bug_detect_ori_log) and os.path.getsize(bug_detect_ori_log) > 0
+            has_binary_trace = os.path.exists(bug_detect_trace) and \
+                os.path.getsize(bug_detect_trace) > len(TRACE_MAGIC) + 1
+
+            # Modified logic: only fallback to stdout/stderr when neither log is generated
+            if not has_trace_log and not has_ori_log and not has_binary_trace:
+                print(
+                    f"[INFO] No instrumentation logs found ({bug_detect_log} or {bug_detect_ori_log}). Falling back to stdout/stderr.")
+                try:
+                    # Write stdout to log file only on complete failure for troubleshooting
+                    with open(bug_detect_log, "wb") as f:
+                        f.write(b"=== stdout ===\n")
+                        with open(stdout_spool, "rb") as spool:
+                            shutil.copyfileobj(spool, f)
+                        f.write(b"\n=== stderr ===\n")
+                        with open(stderr_spool, "rb") as spool:
+                            shutil.copyfileobj(spool, f)
+                except Exception as e:
+                    print(f"Failed to write fallback log: {str(e)}")
+        finally:
+            for spool_path in (stdout_spool, stderr_spool):
+                if os.path.exists(spool_path):
+                    os.remove(spool_path)
 
         # Optional: if successful, print a hint here
         # else:
@@ -155,8 +181,17 @@ class Project:
     def raw_debug_info(self):
         _result = ""
 
+        # A binary trace (trace.sink=binary) is complete, the log files are capped at 5KB each
+        if self._bug_detect_trace:
+            _result, _events = read_trace_events(self._bug_detect_trace, STREAM_SMALL)
+            if _events == 0:
+                # Nothing but truncation markers in the changed-variables stream: use the full one
+                _ori_result, _ori_events = read_trace_events(self._bug_detect_trace, STREAM_ORI)
+                if _ori_events or not _result:
+                    _result = _ori_result
+
         # Read dynamic log file
-        if self._bug_detect_log and os.path.exists(self._bug_detect_log):
+        if len(_result) == 0 and self._bug_detect_log and os.path.exists(self._bug_detect_log):
             with open(self._bug_detect_log, "r") as f:
                 _result = f.read()
             if os.path.getsize(self._bug_detect_log) < 5 * 1024:
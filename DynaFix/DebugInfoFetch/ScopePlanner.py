@@ -0,0 +1,138 @@
+import os
+import re
+
+from .JavaSource import split_members, signature
+from .Project import D4J_RELEVANT_KEY, D4J_SRC_PATH_KEY, D4J_TEST_PATH_KEY
+
+# Instrumentation scope ('pkg.Class::method' entries for args.methods) derived from the failing tests' stacks
+FAILING_TEST_HEADER = re.compile(r"^--- (?P<test>\S+)")
+STACK_FRAME = re.compile(r"^\s*at (?P<cls>[\w$.]+)\.(?P<method>[\w$<>]+)\(")
+CALL_PATTERN = re.compile(r"(?:\bnew\s+(?P<new>[A-Z][\w$]*)|\b(?P<name>[a-z_$][\w$]*))\s*\(")
+SKIPPED_METHOD_PREFIXES = ("lambda$", "access$")
+NOT_CALLS = {'if', 'for', 'while', 'switch', 'catch', 'synchronized', 'return', 'throw', 'super', 'this', 'assert'}
+
+
+def parse_failing_stacks(text):
+    """{failing test: [(class, method)]} from a Defects4J failing_tests file, innermost frame first"""
+    stacks = {}
+    frames = None
+    for line in text.splitlines():
+        header = FAILING_TEST_HEADER.match(line)
+        if header:
+            frames = stacks.setdefault(header.group("test"), [])
+            continue
+        frame = STACK_FRAME.match(line)
+        if frame and frames is not None:
+            frames.append((frame.group("cls"), frame.group("method")))
+    return stacks
+
+
+def _class_file(root, class_name):
+    return os.path.join(root, class_name.split("$")[0].replace(".", "/") + ".java")
+
+
+def _class_methods(root, class_name):
+    """{method name: [code]} of the methods declared directly in a class, constructors as '<init>'"""
+    path = _class_file(root, class_name)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        source = f.read()
+    simple_name = class_name.split(".")[-1]
+    methods = {}
+    for member in split_members(source):
+        if "{" not in member:
+            continue
+        for method in split_members(member[member.index("{") + 1:member.rindex("}")]):
+            sig = signature(method)
+            if sig is None:
+                continue
+            name = "<init>" if sig[0] == simple_name else sig[0]
+            methods.setdefault(name, []).append(method)
+    return methods
+
+
+def _callees(code):
+    """Method names called in code, constructors as the class simple name"""
+    names = set()
+    for match in CALL_PATTERN.finditer(code.split("{", 1)[-1]):
+        if match.group("new"):
+            names.add(match.group("new"))
+        elif match.group("name") not in NOT_CALLS:
+            names.add(match.group("name"))
+    return names
+
+
+class ScopePlanner:
+    """
+    Choose the methods ByteTrace instruments for a bug, without a hand-made location file.
+    For every failing test, the frames of its stack trace that belong to d4j.classes.relevant are taken, innermost
+    first, up to max_depth. When the failure is raised in the test itself (assertions), the relevant methods it
+    calls are followed instead, max_depth levels down the call graph, matched by name.
+    """
+
+    def __init__(self, project, max_depth=2, max_methods=20):
+        self.project = project
+        self.max_depth = max_depth
+        self.max_methods = max_methods
+        self.relevant = {cls for cls in project.d4j_config(D4J_RELEVANT_KEY).split(",") if cls}
+        self.src_dir = os.path.join(project.base_dir, project.d4j_config(D4J_SRC_PATH_KEY))
+        self.test_dir = os.path.join(project.base_dir, project.d4j_config(D4J_TEST_PATH_KEY))
+        self._index = None
+
+    def is_relevant(self, class_name):
+        return class_name.split("$")[0] in self.relevant
+
+    def _method_index(self):
+        """{method name: [(class, code)]} over the relevant classes"""
+        if self._index is None:
+            self._index = {}
+            for class_name in sorted(self.relevant):
+                for name, codes in _class_methods(self.src_dir, class_name).items():
+                    for code in codes:
+                        self._index.setdefault(name, []).append((class_name, code))
+        return self._index
+
+    def _called_methods(self, codes):
+        index = self._method_index()
+        found = []
+        for code in codes:
+            for name in sorted(_callees(code)):
+                if name[:1].isupper():
+                    found.extend((cls, "<init>", body) for cls, body in index.get("<init>", [])
+                                 if cls.split(".")[-1] == name)
+                else:
+                    found.extend((cls, name, body) for cls, body in index.get(name, []))
+        return found
+
+    def plan(self, failing_tests_text):
+        """Ordered 'pkg.Class::method' entries, at most max_methods"""
+        scope = []
+
+        def add(entry):
+            if entry not in scope and len(scope) < self.max_methods:
+                scope.append(entry)
+
+        for test, frames in parse_failing_stacks(failing_tests_text).items():
+            relevant_frames = [(cls, method) for cls, method in frames
+                               if self.is_relevant(cls) and not method.startswith(SKIPPED_METHOD_PREFIXES)]
+            if relevant_frames:
+                for cls, method in relevant_frames[:self.max_depth]:
+                    add(f"{cls}::{method}")
+                continue
+
+            # Assertion in the test: follow what the test method calls
+            test_class, _, test_method = test.partition("::")
+            codes = _class_methods(self.test_dir, test_class).get(test_method, [])
+            seen = set()
+            for _ in range(self.max_depth):
+                next_codes = []
+                for cls, method, code in self._called_methods(codes):
+                    entry = f"{cls}::{method}"
+                    if entry in seen:
+                        continue
+                    seen.add(entry)
+                    add(entry)
+                    next_codes.append(code)
+                codes = next_codes
+        return scope
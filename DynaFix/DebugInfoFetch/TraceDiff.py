@@ -0,0 +1,163 @@
+import json
+import re
+from collections import OrderedDict
+
+# ByteTrace writes one event per line: "{class}:{method}:{line}->[{kind}] {payload}"
+TRACE_EVENT_PATTERN = re.compile(r"^(?P<cls>[^:\s]+):(?P<method>[^:\s]+):(?P<line>-?\d+)->\[(?P<kind>[^\]]+)\]\s?(?P<payload>.*)$")
+TEST_HEADER_PATTERN = re.compile(r"^=== Debug Info for Test: (?P<test>.+?) ===$")
+
+KIND_LOCAL_VARIABLES = "Local Variables"
+KIND_CONTROL_FLOW = "Control Flow"
+KIND_METHOD_CALL = "Method Call"
+
+
+def parse_trace(text):
+    """
+    Parse a debug info file into aligned trace events.
+    Every event is keyed on (test, method, line, kind, occurrence) so that two runs of the same test
+    can be compared even when the number of events differs.
+    Returns (events, anchors): events is an OrderedDict key -> payload, anchors holds the exception header lines.
+    """
+    events = OrderedDict()
+    anchors = []
+    occurrences = {}
+    test = ""
+
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+
+        header = TEST_HEADER_PATTERN.match(line)
+        if header:
+            test = header.group("test")
+            continue
+
+        if line.startswith("Exception:"):
+            anchors.append(line)
+            continue
+
+        match = TRACE_EVENT_PATTERN.match(line)
+        if not match:
+            continue
+
+        method = f"{match.group('cls')}:{match.group('method')}"
+        base_key = (test, method, int(match.group("line")), match.group("kind"))
+        occurrence = occurrences.get(base_key, 0)
+        occurrences[base_key] = occurrence + 1
+        events[base_key + (occurrence,)] = match.group("payload").strip()
+
+    return events, anchors
+
+
+def _load_variables(payload):
+    try:
+        variables = json.loads(payload)
+    except (json.JSONDecodeError, TypeError):
+        return None
+    return variables if isinstance(variables, dict) else None
+
+
+def _diff_variables(current_payload, previous_payload):
+    """Return only the variables whose value differs between two Local Variables payloads"""
+    current_vars = _load_variables(current_payload)
+    previous_vars = _load_variables(previous_payload)
+    if current_vars is None or previous_vars is None:
+        return None if current_payload == previous_payload else current_payload
+
+    changed = {name: value for name, value in current_vars.items()
+               if name not in previous_vars or previous_vars[name] != value}
+    if not changed:
+        return None
+    return json.dumps(changed, ensure_ascii=False)
+
+
+def diff_traces(current_events, previous_events):
+    """
+    Align two parsed traces and return the diverging events as a list of (key, status, current, previous).
+    status is 'changed', 'new' (only in the current trace) or 'gone' (only in the previous trace).
+    """
+    divergences = []
+
+    for key, payload in current_events.items():
+        if key not in previous_events:
+            divergences.append((key, "new", payload, None))
+            continue
+
+        previous_payload = previous_events[key]
+        if key[3] == KIND_LOCAL_VARIABLES:
+            changed = _diff_variables(payload, previous_payload)
+            if changed is not None:
+                divergences.append((key, "changed", changed, previous_payload))
+        elif payload != previous_payload:
+            divergences.append((key, "changed", payload, previous_payload))
+
+    for key, payload in previous_events.items():
+        if key not in current_events:
+            divergences.append((key, "gone", None, payload))
+
+    return divergences
+
+
+def _format_event(key, payload):
+    test, method, line, kind, occurrence = key
+    suffix = f" (#{occurrence + 1})" if occurrence else ""
+    return f"{method}:{line}{suffix} [{kind}] {payload}"
+
+
+def render_trace_delta(current_text, previous_text, original_text=None, anchor_context=1, max_events=200):
+    """
+    Render only the runtime events of the current trace that diverge from the previous iteration's trace.
+    Each divergence is preceded by up to `anchor_context` unchanged events of the same test, and annotated
+    with the original buggy run's value when that differs too. Returns None if the traces cannot be compared.
+    """
+    current_events, anchors = parse_trace(current_text)
+    previous_events, _ = parse_trace(previous_text)
+    if not current_events or not previous_events:
+        return None
+
+    original_events = parse_trace(original_text)[0] if original_text else {}
+    divergences = diff_traces(current_events, previous_events)
+
+    lines = list(OrderedDict.fromkeys(anchors))
+    if not divergences:
+        lines.append("No runtime difference from the previous attempt: the last patch did not change the "
+                     "observed variable values, branch outcomes or method calls.")
+        return "\n".join(lines)
+
+    diverging_keys = {key for key, _, _, _ in divergences}
+    current_keys = list(current_events.keys())
+    key_positions = {key: index for index, key in enumerate(current_keys)}
+    shown_context = set()
+    current_test = None
+
+    for count, (key, status, payload, previous_payload) in enumerate(divergences):
+        if count >= max_events:
+            lines.append(f"... {len(divergences) - max_events} more diverging events omitted")
+            break
+
+        if key[0] != current_test:
+            current_test = key[0]
+            lines.append(f"=== Runtime changes for Test: {current_test or 'unknown'} ===")
+
+        if status == "gone":
+            lines.append(f"[Gone] {_format_event(key, previous_payload)}")
+            continue
+
+        position = key_positions[key]
+        for anchor_key in current_keys[max(0, position - anchor_context):position]:
+            if anchor_key[0] != key[0] or anchor_key in diverging_keys or anchor_key in shown_context:
+                continue
+            shown_context.add(anchor_key)
+            lines.append(f"  {_format_event(anchor_key, current_events[anchor_key])}")
+
+        label = "[New]" if status == "new" else "[Changed]"
+        lines.append(f"{label} {_format_event(key, payload)}")
+        if status == "changed":
+            lines.append(f"    was: {previous_payload}")
+        original_payload = original_events.get(key)
+        if original_payload is not None and original_payload != current_events[key] \
+                and original_payload != previous_payload:
+            lines.append(f"    orig: {original_payload}")
+
+    return "\n".join(lines)
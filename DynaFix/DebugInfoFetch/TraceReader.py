@@ -0,0 +1,66 @@
+import mmap
+import os
+import struct
+
+# Binary traces written by ByteTrace with trace.sink=binary (see TraceSink.kt)
+TRACE_MAGIC = b"BTRC"
+TRACE_VERSION = 1
+RECORD_HEADER = struct.Struct(">IBB")
+
+STREAM_SMALL = 0
+STREAM_ORI = 1
+
+KIND_LOCAL_VARIABLES = 1
+KIND_CONTROL_FLOW = 2
+KIND_METHOD_CALL = 3
+KIND_TRUNCATED = 127
+
+
+def iter_records(buffer):
+    """
+    Yield (stream, kind, payload, end offset) for every record of a binary trace; payload is a memoryview into
+    buffer and is released once the next record is requested. A record cut short by a killed JVM ends the iteration.
+    """
+    view = memoryview(buffer)
+    try:
+        if bytes(view[:len(TRACE_MAGIC)]) != TRACE_MAGIC:
+            raise ValueError("Not a ByteTrace binary trace")
+        if view[len(TRACE_MAGIC)] != TRACE_VERSION:
+            raise ValueError(f"Unsupported ByteTrace trace version {view[len(TRACE_MAGIC)]}")
+        offset = len(TRACE_MAGIC) + 1
+        while offset + RECORD_HEADER.size <= len(view):
+            length, stream, kind = RECORD_HEADER.unpack_from(view, offset)
+            start = offset + RECORD_HEADER.size
+            if start + length > len(view):
+                return
+            offset = start + length
+            with view[start:offset] as payload:
+                yield stream, kind, payload, offset
+    finally:
+        view.release()
+
+
+def read_trace_events(path, stream=STREAM_SMALL):
+    """
+    (text, events) of one stream of a binary trace, read through mmap: its lines and how many of them are trace
+    events rather than truncation markers. Truncation markers are kept whatever their stream, and a record cut
+    short at the end of the file adds one. Returns ("", 0) for a missing or empty file.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) <= len(TRACE_MAGIC):
+        return "", 0
+    lines = []
+    events = 0
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        end = len(TRACE_MAGIC) + 1
+        for record_stream, kind, payload, end in iter_records(mapped):
+            if record_stream == stream or kind == KIND_TRUNCATED:
+                lines.append(str(payload, "utf-8", errors="replace"))
+                events += kind != KIND_TRUNCATED
+        if end != len(mapped):
+            lines.append("[Trace Truncated] the trace ends with an incomplete event, the test JVM did not exit cleanly")
+    return "\n".join(lines) + ("\n" if lines else ""), events
+
+
+def read_trace(path, stream=STREAM_SMALL):
+    """Lines of one stream of a binary trace, see read_trace_events"""
+    return read_trace_events(path, stream)[0]
@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import threading
+
+
+class CascadeTier:
+    def __init__(self, model, width, deep, input_price=0.0, output_price=0.0, name=None):
+        self.model = model
+        # Stats are kept per tier, the same model may serve several tiers
+        self.name = name or model
+        self.width = width
+        self.deep = deep
+        # USD per million tokens
+        self.input_price = input_price
+        self.output_price = output_price
+
+    def cost(self, input_tokens, output_tokens):
+        return (input_tokens * self.input_price + output_tokens * self.output_price) / 1e6
+
+
+def parse_cascade(spec):
+    """
+    Parse 'model:width:deep[:input_price:output_price],...' (prices in USD per million tokens), e.g.
+    'gpt-4o-mini:3:2:0.15:0.6,gpt-4o:4:5:2.5:10'. Model names may themselves contain ':'.
+    """
+    tiers = []
+    for entry in spec.split(','):
+        parts = entry.strip().split(':')
+        numbers = []
+        while parts and len(numbers) < 4:
+            try:
+                float(parts[-1])
+            except ValueError:
+                break
+            numbers.insert(0, parts.pop())
+        if len(numbers) == 3 or len(numbers) < 2 or not parts:
+            raise ValueError(f"Invalid cascade tier '{entry}', expected model:width:deep[:input_price:output_price]")
+        model = ':'.join(parts)
+        width, deep = int(numbers[0]), int(numbers[1])
+        prices = [float(n) for n in numbers[2:]] or [0.0, 0.0]
+        if width < 1 or deep < 1:
+            raise ValueError(f"Cascade tier '{entry}' needs at least one width and one deep attempt")
+        tiers.append(CascadeTier(model, width, deep, *prices, name=f"{len(tiers) + 1}:{model}"))
+    return tiers
+
+
+class ModelCascade:
+    """
+    Ordered model tiers, cheapest first. Each tier owns a consecutive range of width attempts of a slug and caps
+    the depth of its chains; a slug only reaches the next tier after the previous tier's attempts failed.
+    Requests, tokens, cost, latency and fixes are accumulated per tier and saved to stats_path.
+    """
+
+    def __init__(self, tiers, stats_path):
+        self.tiers = tiers
+        self.stats_path = stats_path
+        self.total_width = sum(tier.width for tier in tiers)
+        # Fan-out mode repairs several locations concurrently
+        self._lock = threading.Lock()
+        self.stats = {tier.name: {'requests': 0, 'failed_requests': 0, 'input_tokens': 0, 'output_tokens': 0,
+                                   'cost': 0.0, 'seconds': 0.0, 'fixes': 0} for tier in tiers}
+        if os.path.exists(stats_path):
+            with open(stats_path, 'r', encoding='utf-8') as f:
+                for name, saved in json.load(f).get('tiers', {}).items():
+                    if name in self.stats:
+                        self.stats[name].update(saved)
+
+    def tier_for(self, width_attempt):
+        """Tier serving the given width attempt of a slug"""
+        first = 0
+        for tier in self.tiers:
+            if width_attempt < first + tier.width:
+                return tier
+            first += tier.width
+        return self.tiers[-1]
+
+    def chat(self, debugger, tier, prompt, ID, slug, **kwargs):
+        """Send one request to the tier's model and account for it"""
+        start = time.time()
+        response = debugger.chat(prompt, ID, slug, model=tier.model, **kwargs)
+        with self._lock:
+            stats = self.stats[tier.name]
+            stats['seconds'] += time.time() - start
+            if response is None:
+                stats['failed_requests'] += 1
+            else:
+                input_tokens, output_tokens = debugger.last_usage
+                stats['requests'] += 1
+                stats['input_tokens'] += input_tokens
+                stats['output_tokens'] += output_tokens
+                stats['cost'] += tier.cost(input_tokens, output_tokens)
+            self.save()
+        return response
+
+    def record_fix(self, tier):
+        with self._lock:
+            self.stats[tier.name]['fixes'] += 1
+            self.save()
+
+    def save(self):
+        tmp_path = self.stats_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'tiers': self.stats, 'order': [tier.name for tier in self.tiers]}, f, indent=2)
+        os.replace(tmp_path, self.stats_path)
+
+    def summary(self):
+        lines = []
+        total_cost = sum(stats['cost'] for stats in self.stats.values())
+        total_fixes = sum(stats['fixes'] for stats in self.stats.values())
+        for tier in self.tiers:
+            stats = self.stats[tier.name]
+            latency = stats['seconds'] / max(stats['requests'] + stats['failed_requests'], 1)
+            lines.append(f"{tier.name}: {stats['requests']} requests, "
+                         f"{stats['input_tokens'] + stats['output_tokens']} tokens, ${stats['cost']:.4f}, "
+                         f"{latency:.1f}s/request, {stats['fixes']} fixes")
+        per_fix = f"${total_cost / total_fixes:.3f} per fixed bug" if total_fixes else "no fixes yet"
+        lines.append(f"total: ${total_cost:.4f}, {per_fix}")
+        return "\n".join(lines)
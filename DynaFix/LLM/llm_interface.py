@@ -4,25 +4,76 @@ import queue
 import tiktoken
 import csv
 from pathlib import Path
+import time
 from datetime import datetime
+from .rate_limiter import retry_after_seconds, is_rate_limit_error, is_final_error, backoff_delay
+from timing import span
+from .patch_extractor import CODE_BLOCK_PATTERN, complete_methods
+
+
+def response_complete(text, expected_methods=None):
+    """
+    True once a streamed response holds everything the parser needs: a complete method for each of the
+    expected_methods, whether they come in one code block, one block per method or without fences.
+    Without a method count, the first closed code block is taken as the answer.
+    """
+    if not expected_methods:
+        return bool(CODE_BLOCK_PATTERN.search(text))
+    return complete_methods(text) >= expected_methods
+
+
+USAGE_COLUMNS = ["slug", "ID", "model", "input_tokens", "output_tokens", "total_tokens", "cacheable_prefix_tokens"]
 
 
 class LLMInterface:
-    def __init__(self, api_key, model):
+    def __init__(self, api_key, model, rate_limiter=None, expected_output_tokens=1024, stream=False,
+                 base_url="https://api.openai.com/v1"):
         self.api_key = api_key
         self.model = model
-        self.client = OpenAI(api_key=api_key, base_url="https://api.openai.com/v1")
+        # Stream completions and close the stream as soon as the fixed methods are complete
+        self.stream = stream
+        # With a shared limiter, 429s are handled here instead of by the client's own immediate retries
+        self.rate_limiter = rate_limiter
+        self.expected_output_tokens = expected_output_tokens
+        client_retries = 0 if rate_limiter else 2
+        self.client = OpenAI(api_key=api_key, base_url=base_url, max_retries=client_retries)
         self.encoding = tiktoken.get_encoding("cl100k_base")
+        # Running totals of this client, e.g. for budget-aware scheduling
+        self.total_input_tokens = 0
+        self.total_output_tokens = 0
+        # (input_tokens, output_tokens) of the last successful request, per calling thread
+        self._local = threading.local()
+        self._usage_lock = threading.Lock()
 
         # Final CSV path
         self.csv_path = Path("./result/defects4j/token_usage_gpt4o.csv")
         self.csv_path.parent.mkdir(parents=True, exist_ok=True)
 
-        # Write header if file does not exist
+        self._ensure_usage_header()
+
+    @property
+    def last_usage(self):
+        return getattr(self._local, "last_usage", (0, 0))
+
+    @last_usage.setter
+    def last_usage(self, usage):
+        self._local.last_usage = usage
+
+    def _ensure_usage_header(self):
+        """Write the CSV header, upgrading usage files written before the cacheable prefix column existed"""
         if not self.csv_path.exists():
             with open(self.csv_path, "a", newline="", encoding="utf-8") as f:
                 writer = csv.writer(f)
-                writer.writerow(["slug", "ID", "model", "input_tokens", "output_tokens", "total_tokens"])
+                writer.writerow(USAGE_COLUMNS)
+            return
+
+        with open(self.csv_path, "r", newline="", encoding="utf-8") as f:
+            rows = list(csv.reader(f))
+        if rows and rows[0] != USAGE_COLUMNS and rows[0] == USAGE_COLUMNS[:len(rows[0])]:
+            missing = len(USAGE_COLUMNS) - len(rows[0])
+            rows = [USAGE_COLUMNS] + [row + [""] * missing for row in rows[1:]]
+            with open(self.csv_path, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerows(rows)
 
     def _tokens_for_messages(self, messages: list) -> int:
         """OpenAI official billing calculation, 0 error"""
@@ -34,58 +85,152 @@ class LLMInterface:
         tokens += 3
         return tokens
 
-    def _record_usage(self, slug: str, ID: int, messages: list, response_text: str):
+    def _tokens_for_prefix(self, messages: list, prefix_messages: int) -> int:
+        """Tokens of the leading messages shared by every request of a slug, i.e. what prompt caching can reuse"""
+        if prefix_messages <= 0:
+            return 0
+        return self._tokens_for_messages(messages[:prefix_messages]) - 3
+
+    def _record_usage(self, slug: str, ID: int, messages: list, response_text: str, prefix_messages: int = 0,
+                      model: str = None):
         input_tokens = self._tokens_for_messages(messages)
         output_tokens = len(self.encoding.encode(response_text))
+        prefix_tokens = self._tokens_for_prefix(messages, prefix_messages)
+        self.last_usage = (input_tokens, output_tokens)
 
         record = [
             slug,
             ID,
-            self.model,
+            model or self.model,
             input_tokens,
             output_tokens,
-            input_tokens + output_tokens
+            input_tokens + output_tokens,
+            prefix_tokens
         ]
 
-        with open(self.csv_path, "a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(record)
+        with self._usage_lock:
+            self.total_input_tokens += input_tokens
+            self.total_output_tokens += output_tokens
+            with open(self.csv_path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(record)
 
         print(
-            f"[TOKEN] {slug} | ID {ID} | in {input_tokens} -> out {output_tokens} = {input_tokens + output_tokens} tokens")
+            f"[TOKEN] {slug} | ID {ID} | in {input_tokens} -> out {output_tokens} = {input_tokens + output_tokens} tokens"
+            f" | cacheable prefix {prefix_tokens}")
+        return input_tokens + output_tokens
 
-    def _request_worker(self, prompt, temperature, out_queue):
+    def _request_worker(self, prompt, temperature, out_queue, headers=None, model=None):
         try:
             resp = self.client.chat.completions.create(
-                model=self.model,
+                model=model or self.model,
                 messages=prompt,
-                temperature=temperature
+                temperature=temperature,
+                extra_headers=headers
             )
             out_queue.put(resp)
         except Exception as e:
             out_queue.put(e)
 
-    def chat(self, prompt, ID, slug, max_retries=10, temperature=1.0, timeout=300):
+    def _stream_worker(self, prompt, temperature, out_queue, expected_methods, headers=None, model=None):
+        """Collect a streamed completion, closing the stream once response_complete() holds"""
+        try:
+            stream = self.client.chat.completions.create(
+                model=model or self.model,
+                messages=prompt,
+                temperature=temperature,
+                stream=True,
+                extra_headers=headers
+            )
+            parts = []
+            try:
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    parts.append(delta)
+                    # A fence or method can only close on a backtick or a brace
+                    if ('`' in delta or '}' in delta) and response_complete("".join(parts), expected_methods):
+                        break
+            finally:
+                stream.close()
+            out_queue.put("".join(parts))
+        except Exception as e:
+            out_queue.put(e)
+
+    def _refund(self, tokens):
+        if self.rate_limiter:
+            self.rate_limiter.refund(tokens)
+
+    def chat(self, prompt, ID, slug, max_retries=10, temperature=1.0, timeout=300, prefix_messages=0,
+             expected_methods=None, width=None, iteration=None, model=None):
+        """
+        Send a prompt and return the response text; model overrides self.model.
+        None if all retries failed, or at once when the request is rejected with a 4xx other than 408/409/429.
+        """
+        self.last_usage = (0, 0)
+        # Identify the attempt, e.g. for the offline replay server (LLM/replay_server.py)
+        headers = {"X-DynaFix-Slug": str(slug)}
+        if width is not None and iteration is not None:
+            headers["X-DynaFix-Width"] = str(width)
+            headers["X-DynaFix-Iteration"] = str(iteration)
+
+        estimated_tokens = 0
+        if self.rate_limiter:
+            estimated_tokens = self._tokens_for_messages(prompt) + self.expected_output_tokens
+
         for attempt in range(max_retries):
+            if self.rate_limiter:
+                with span("rate_limit_wait"):
+                    waited = self.rate_limiter.acquire(estimated_tokens, slug)
+                if waited > 0.5:
+                    print(f"[ID {ID} | {slug}] Waited {waited:.1f}s for rate limit budget")
             print(f"[ID {ID} | {slug}] Request {attempt + 1}...")
 
             q = queue.Queue()
-            t = threading.Thread(target=self._request_worker, args=(prompt, temperature, q), daemon=True)
+            if self.stream:
+                t = threading.Thread(target=self._stream_worker,
+                                     args=(prompt, temperature, q, expected_methods, headers, model), daemon=True)
+            else:
+                t = threading.Thread(target=self._request_worker, args=(prompt, temperature, q, headers, model),
+                                     daemon=True)
             t.start()
             t.join(timeout=timeout)
 
             if t.is_alive():
                 print(f"[ID {ID} | {slug}] Timeout, retrying...")
+                self._refund(estimated_tokens)
                 continue
 
             result = q.get()
             if isinstance(result, Exception):
                 print(f"[ID {ID} | {slug}] Exception: {result}")
+                # The next attempt acquires its estimate again
+                self._refund(estimated_tokens)
+                if is_final_error(result):
+                    # Retrying cannot help, e.g. a replay server without a saved record for this prompt
+                    print(f"[ID {ID} | {slug}] Request rejected, not retrying")
+                    return None
+                if attempt + 1 >= max_retries:
+                    continue
+                if is_rate_limit_error(result):
+                    retry_after = retry_after_seconds(result)
+                    delay = retry_after if retry_after is not None else backoff_delay(attempt)
+                    print(f"[ID {ID} | {slug}] Rate limited, backing off {delay:.1f}s")
+                    if self.rate_limiter:
+                        # Every worker sharing the limiter pauses, acquire() then waits out the delay
+                        self.rate_limiter.block(delay)
+                        continue
+                else:
+                    delay = backoff_delay(attempt)
+                time.sleep(delay)
                 continue
 
             # Simplest fix - add try-except in place
             try:
-                content = result.choices[0].message.content.strip()
+                content = result.strip() if isinstance(result, str) else result.choices[0].message.content.strip()
             except AttributeError:
                 # Log error and return empty string
                 print(f"Warning: Received None response at iteration {ID}")
@@ -93,7 +238,9 @@ class LLMInterface:
 
             print(f"[ID {ID} | {slug}] Success")
 
-            self._record_usage(slug, ID, prompt, content)
+            used_tokens = self._record_usage(slug, ID, prompt, content, prefix_messages, model)
+            # Negative when the response was longer than estimated: the overage is charged
+            self._refund(estimated_tokens - used_tokens)
 
             return content
 
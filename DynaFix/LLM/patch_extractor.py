@@ -0,0 +1,106 @@
+import re
+from DebugInfoFetch.JavaSource import split_members, strip_comments, signature
+
+CODE_BLOCK_PATTERN = re.compile(r"```[^\n`]*\n(.*?)```", re.DOTALL)
+# `// Fixed Method 2`, `// Method 2`, `// Fixed method 2:` ...
+MARKER_PATTERN = re.compile(r"^[ \t]*//[ \t]*(?:Fixed[ \t]+)?Method[ \t]*#?(\d+)\b[^\n]*\n?", re.IGNORECASE | re.MULTILINE)
+MATCH_FAILED = 'Match failed'
+
+
+def _members_with_classes(code):
+    """Top-level members, descending into class bodies so their methods are found too"""
+    methods = []
+    for member in split_members(code):
+        header = strip_comments(member).split('{', 1)[0]
+        if re.search(r'\b(class|interface|enum)\b', header):
+            methods.extend(_members_with_classes(member[member.index('{') + 1:member.rindex('}')]))
+        else:
+            methods.append(member)
+    return methods
+
+
+def _trim_to_declaration(member):
+    """Drop prose before a method found outside a code block, keeping its annotations and comments"""
+    lines = member.split('\n')
+    for k, line in enumerate(lines):
+        if '(' in line and signature('\n'.join(lines[k:])) == signature(member):
+            start = k
+            while start > 0 and lines[start - 1].strip().startswith(('@', '/*', '*', '//')):
+                start -= 1
+            return '\n'.join(lines[start:]).strip()
+    return member
+
+
+def _sections(response):
+    """Candidate fixed methods as (marker number or None, code)"""
+    blocks = CODE_BLOCK_PATTERN.findall(response)
+    text = "\n".join(blocks) if blocks else response
+    markers = list(MARKER_PATTERN.finditer(text))
+    if markers:
+        sections = []
+        for k, marker in enumerate(markers):
+            end = markers[k + 1].start() if k + 1 < len(markers) else len(text)
+            code = text[marker.end():end].strip()
+            if code:
+                sections.append((int(marker.group(1)), code))
+        return sections
+    if not blocks:
+        # Without fences or markers, only brace-balanced methods in the prose are usable
+        return [(None, _trim_to_declaration(member)) for member in _members_with_classes(response)
+                if signature(member)]
+    return [(None, member) for member in _members_with_classes(text)]
+
+
+def complete_methods(response):
+    """Number of sections of a (possibly still streaming) response that hold a complete method"""
+    return sum(1 for _, code in _sections(response) if any(signature(member) for member in split_members(code)))
+
+
+def _normalized(code):
+    return " ".join(code.split())
+
+
+def extract_fixed_methods(response, current_codes):
+    """
+    Match the fixed methods of a response to the methods being repaired.
+    Handles several fenced blocks, missing or renumbered `// Fixed Method N` markers and methods in a different
+    order: sections are matched by signature first, then by marker number, then by position.
+    Returns a list with the fixed code of each method, or None where the response has none.
+    """
+    fixed = [None] * len(current_codes)
+    if not response:
+        return fixed
+    sections = _sections(response)
+    if not sections:
+        return fixed
+
+    targets = [signature(code) for code in current_codes]
+    names = [target[0] if target else None for target in targets]
+    candidates = [[] for _ in current_codes]
+    unplaced = []
+    for number, code in sections:
+        sig = signature(code)
+        slot = None
+        if sig is not None and targets.count(sig) == 1:
+            slot = targets.index(sig)
+        elif sig is not None and names.count(sig[0]) == 1:
+            slot = names.index(sig[0])
+        elif number is not None and 1 <= number <= len(current_codes) and (sig is None or sig[0] not in names):
+            slot = number - 1
+        if slot is None:
+            unplaced.append(code)
+        else:
+            candidates[slot].append(code)
+
+    # Several versions of the same method: prefer the last one that actually changes the code
+    for idx, codes in enumerate(candidates):
+        changed = [code for code in codes if _normalized(code) != _normalized(current_codes[idx])]
+        if changed or codes:
+            fixed[idx] = (changed or codes)[-1]
+
+    # Sections nothing could be matched to fill the remaining methods in order, if they line up
+    empty = [idx for idx, code in enumerate(fixed) if code is None]
+    if unplaced and len(unplaced) == len(empty):
+        for idx, code in zip(empty, unplaced):
+            fixed[idx] = code
+    return fixed
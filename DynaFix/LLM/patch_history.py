@@ -0,0 +1,100 @@
+import difflib
+
+
+class PatchHistory:
+    """
+    Previous repair attempts of one search chain (breadth or deep) as they are pasted into the next prompt.
+    The last keep_last attempts are kept verbatim; older ones are compressed into a unified diff of each fixed
+    method against the original method plus the test result. If token_budget is set, the rendered history is
+    kept within that many tokens by compressing further, then dropping the oldest attempts, then truncating.
+    keep_last=None and token_budget=None reproduce the plain verbatim history.
+    """
+
+    def __init__(self, label, original_codes, keep_last=None, token_budget=None, encoding=None):
+        self.label = label
+        self.original_codes = [code.strip() for code in original_codes]
+        self.keep_last = keep_last
+        self.token_budget = token_budget
+        self.encoding = encoding
+        if token_budget and encoding is None:
+            import tiktoken
+            self.encoding = tiktoken.get_encoding("cl100k_base")
+        self._attempts = []
+
+    def __len__(self):
+        return len(self._attempts)
+
+    def add(self, index, response, fixed_codes, submission_result):
+        self._attempts.append({
+            "index": index,
+            "response": (response or "").strip(),
+            "fixed_codes": list(fixed_codes),
+            "submission_result": submission_result,
+        })
+
+    def _verbatim(self, attempt):
+        return (
+            f"[{self.label} {attempt['index']}] Attempted fix:\n{attempt['response']}\n"
+            f"[{self.label} {attempt['index']}] Test result: {attempt['submission_result']}"
+        )
+
+    def _compressed(self, attempt):
+        diffs = []
+        for idx, fixed_code in enumerate(attempt["fixed_codes"]):
+            if fixed_code == 'Match failed':
+                diffs.append(f"// Method {idx + 1}: no fixed code could be extracted")
+                continue
+            original = self.original_codes[idx] if idx < len(self.original_codes) else ""
+            diff = difflib.unified_diff(original.splitlines(), fixed_code.strip().splitlines(),
+                                        fromfile=f"original Method {idx + 1}", tofile=f"fixed Method {idx + 1}",
+                                        lineterm="", n=1)
+            diffs.append("\n".join(diff) or f"// Method {idx + 1}: unchanged")
+        return (
+            f"[{self.label} {attempt['index']}] Attempted fix (summarized as a diff against the original method):\n"
+            + "\n".join(diffs) + "\n"
+            f"[{self.label} {attempt['index']}] Test result: {attempt['submission_result']}"
+        )
+
+    def _count_tokens(self, contents):
+        return sum(len(self.encoding.encode(content)) for content in contents)
+
+    def _truncate(self, content, budget):
+        tokens = self.encoding.encode(content)
+        if len(tokens) <= budget:
+            return content
+        return self.encoding.decode(tokens[:max(budget, 0)]) + "\n... [truncated to fit the history token budget]"
+
+    def contents(self):
+        """Render the history entries, oldest first"""
+        total = len(self._attempts)
+        keep_last = total if self.keep_last is None else self.keep_last
+        verbatim_from = max(total - keep_last, 0)
+        contents = [self._verbatim(attempt) if idx >= verbatim_from else self._compressed(attempt)
+                    for idx, attempt in enumerate(self._attempts)]
+
+        if not self.token_budget or not contents:
+            return contents
+
+        # 1. compress the remaining verbatim attempts, oldest first
+        while self._count_tokens(contents) > self.token_budget and verbatim_from < total:
+            contents[verbatim_from] = self._compressed(self._attempts[verbatim_from])
+            verbatim_from += 1
+
+        # 2. drop the oldest attempts, keeping a note of how many were dropped
+        dropped = 0
+        while self._count_tokens(contents) > self.token_budget and len(contents) > 1:
+            contents.pop(0)
+            dropped += 1
+        if dropped:
+            note = f"[{dropped} earlier attempt(s) omitted to fit the history token budget]"
+            contents.insert(0, note)
+            if self._count_tokens(contents) > self.token_budget and len(contents) > 1:
+                contents.pop(0)
+
+        # 3. a single attempt that is still too long is truncated
+        if self._count_tokens(contents) > self.token_budget:
+            contents[-1] = self._truncate(contents[-1], self.token_budget - self._count_tokens(contents[:-1]))
+        return contents
+
+    def messages(self):
+        return [{"role": "system", "content": content} for content in self.contents()]
@@ -0,0 +1,267 @@
+import os
+import re
+import json
+from itertools import islice
+from .prompts import *
+from DebugInfoFetch.TraceDiff import render_trace_delta
+
+# Few-shot prefixes are shared by every prompt and never modified
+FEW_SHOT_PREFIXES = {
+    'debuginfo': tuple(HISTORY_DEBUG_D4J),
+    'pure': tuple(HISTORY_PURE_D4J),
+    'exception': tuple(HISTORY_EXCEPTION_D4J),
+}
+
+QUERY_TEMPLATES = {
+    'debuginfo': DEBUG_PROMPT,
+    'pure': USER_PROMPT,
+    'exception': EXCEPTION_PROMPT,
+}
+
+PLACEHOLDER_PATTERN = re.compile(r"\{(BUGGY_CODE|DEBUG_INFO|CALL_INFO|EXCEPTION_INFO|MISSING_METHODS)\}")
+
+
+def read_debug_info(debug_file_path, max_size=50 * 1024, max_lines=300):
+    try:
+        file_size = os.path.getsize(debug_file_path)
+
+        with open(debug_file_path, 'r', encoding='utf-8') as f:
+            if file_size <= max_size:
+                content = f.read().strip()
+            else:
+                content = '\n'.join(line.strip() for line in islice(f, max_lines))
+
+            return content
+    except FileNotFoundError:
+        return f"Failed to read debug info: File not found"
+    except Exception as e:
+        return f"Failed to read debug info: {str(e)}"
+
+
+def read_method_calls(method_calls_file_path, max_size=50 * 1024, max_entries=300):
+    try:
+        file_size = os.path.getsize(method_calls_file_path)
+
+        with open(method_calls_file_path, 'r', encoding='utf-8') as f:
+            if file_size <= max_size:
+                data = json.load(f)
+            else:
+                data = []
+                for i, line in enumerate(islice(f, max_entries)):
+                    try:
+                        entry = json.loads(line.strip())
+                        data.append(entry)
+                    except json.JSONDecodeError:
+                        f.seek(0)
+                        full_data = json.load(f)
+                        data = full_data[:max_entries]
+                        break
+
+        result = ""
+        for entry in data:
+            result += f"Method: {entry.get('method', 'Unknown')}\n"
+            result += f"Comment:\n    {entry.get('doc', 'No comment')}\n"
+            result += f"Source Code:\n    {entry.get('code', 'No code')}\n\n"
+
+        return result.strip()
+    except FileNotFoundError:
+        return f"Failed to read method calls: File not found"
+    except json.JSONDecodeError as e:
+        return f"Failed to read method calls: Invalid JSON format"
+    except Exception as e:
+        return f"Failed to read method calls: {str(e)}"
+
+
+def read_trace_text(trace_file_path):
+    try:
+        with open(trace_file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except Exception:
+        return None
+
+
+def get_exception_info(msg_data, slug):
+    """Get exception_info for specified slug from msg_data (a BugDataset of the exception CSV)"""
+    try:
+        row = msg_data.first(slug)
+        if row is not None:
+            return row['exception_info'].strip()
+        return "No exception info available"
+    except Exception as e:
+        return f"Failed to read exception info: {str(e)}"
+
+
+def fill_template(template, values):
+    """Substitute all placeholders in a single pass, so inserted text is never substituted again"""
+    return PLACEHOLDER_PATTERN.sub(lambda m: values.get(m.group(1), m.group(0)), template)
+
+
+def format_buggy_code(samples, indices=None):
+    """Number the buggy methods from 1; with indices, only those methods keep their original numbers"""
+    indices = range(len(samples)) if indices is None else indices
+    return "\n\n".join([f"// Method {i + 1}\n{samples[i]['buggy_code'].strip()}" for i in indices])
+
+
+class PromptBuilder:
+    """
+    Assemble repair prompts for one run.
+    Debug info, method calls and exception info are read once per slug and kept in memory; file-backed sections
+    are re-read only when the file changes. With prefix_stable=True the few-shot examples and the original bug
+    report form a byte-identical prefix for every attempt of a slug, and previous attempts follow as separate
+    messages, so the provider's prompt caching can reuse it.
+    """
+
+    def __init__(self, args, msg_data=None, prefix_stable=False):
+        self.args = args
+        self.msg_data = msg_data
+        self.prefix_stable = prefix_stable
+        if args.mode not in FEW_SHOT_PREFIXES:
+            raise ValueError("mode must be 'debuginfo', 'pure', or 'exception'")
+        self.few_shot = FEW_SHOT_PREFIXES[args.mode]
+        self.template = QUERY_TEMPLATES[args.mode]
+        self._file_sections = {}
+        self._exception_sections = {}
+        self._trace_deltas = {}
+
+    def _file_section(self, path, reader):
+        """Return the section read from path, cached on (path, mtime, size)"""
+        try:
+            stat = os.stat(path)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            version = None
+
+        cached = self._file_sections.get((reader, path))
+        if cached is not None and version is not None and cached[0] == version:
+            return cached[1]
+
+        content = reader(path)
+        if version is not None:
+            self._file_sections[(reader, path)] = (version, content)
+        return content
+
+    def forget(self, slug):
+        """Drop the cached sections of a slug once it is done"""
+        prefix = f"{slug}b"
+        pid, bid = slug.rsplit('_', 1)
+        dynamic_prefix = f"{pid}_{bid}_"
+        for key in list(self._file_sections):
+            name = os.path.basename(key[1])
+            if name.startswith(prefix) or name.startswith(dynamic_prefix):
+                del self._file_sections[key]
+        for key in list(self._trace_deltas):
+            if key[0] == slug:
+                del self._trace_deltas[key]
+        self._exception_sections.pop(slug, None)
+
+    def debug_file_path(self, slug, width, iteration, pid, bid):
+        """Debug info file of the original buggy run (iteration 0) or of a deep iteration"""
+        if iteration == 0:
+            return os.path.join(self.args.debug_info_dir, f"{slug}b.txt")
+        return os.path.join(self.args.dynamic_output_path, "DebugInfo",
+                            f"{pid}_{bid}_width{width}_iter{iteration}.txt")
+
+    def method_calls_file_path(self, slug, width, iteration, pid, bid):
+        """Method calls file of the original buggy run (iteration 0) or of a deep iteration"""
+        if iteration == 0:
+            return os.path.join(self.args.method_calls_dir, f"{slug}b_method_calls.json")
+        return os.path.join(self.args.dynamic_output_path, "MethodCalls",
+                            f"{pid}_{bid}_width{width}_iter{iteration}_method_calls.json")
+
+    def debug_info(self, slug, width, iteration, pid, bid):
+        if getattr(self.args, 'trace_delta', False):
+            delta = self.trace_delta(slug, width, iteration, pid, bid)
+            if delta is not None:
+                return delta
+        return self._file_section(self.debug_file_path(slug, width, iteration, pid, bid), read_debug_info)
+
+    def trace_delta(self, slug, width, iteration, pid, bid):
+        """Render only the runtime events that changed since the previous iteration, None if not applicable"""
+        if iteration == 0:
+            return None
+
+        current_path = self.debug_file_path(slug, width, iteration, pid, bid)
+        previous_path = self.debug_file_path(slug, width, iteration - 1, pid, bid)
+        original_path = self.debug_file_path(slug, width, 0, pid, bid)
+        if not os.path.exists(current_path) or not os.path.exists(previous_path):
+            return None
+
+        current_text = self._file_section(current_path, read_trace_text)
+        previous_text = self._file_section(previous_path, read_trace_text)
+        if current_text is None or previous_text is None:
+            print(f"[WARNING] Failed to read traces for delta of {slug}, iteration {iteration}")
+            return None
+        original_text = None
+        if original_path != previous_path and os.path.exists(original_path):
+            original_text = self._file_section(original_path, read_trace_text)
+
+        key = (slug, width, iteration, hash(current_text), hash(previous_text))
+        if key not in self._trace_deltas:
+            delta = render_trace_delta(current_text, previous_text, original_text,
+                                       anchor_context=self.args.trace_delta_context)
+            self._trace_deltas[key] = None if delta is None else TRACE_DELTA_HEADER + delta
+        return self._trace_deltas[key]
+
+    def method_calls(self, slug, width, iteration, pid, bid):
+        return self._file_section(self.method_calls_file_path(slug, width, iteration, pid, bid), read_method_calls)
+
+    def exception_info(self, slug):
+        if slug not in self._exception_sections:
+            self._exception_sections[slug] = get_exception_info(self.msg_data, slug)
+        return self._exception_sections[slug]
+
+    def query(self, samples, width, iteration, pid, bid):
+        """Fill the mode's query template for the given samples and iteration"""
+        slug = samples[0]['slug']
+        values = {"BUGGY_CODE": format_buggy_code(samples)}
+        if self.args.mode == 'debuginfo':
+            values["DEBUG_INFO"] = self.debug_info(slug, width, iteration, pid, bid)
+            values["CALL_INFO"] = self.method_calls(slug, width, iteration, pid, bid)
+        elif self.args.mode == 'exception':
+            values["EXCEPTION_INFO"] = self.exception_info(slug)
+        return fill_template(self.template, values)
+
+    def build(self, samples, width, iteration, pid, bid, history=None, search='breadth', current_samples=None):
+        """
+        Construct the prompt for one attempt.
+        samples are the original buggy methods, current_samples the methods of the most recent attempt in a deep
+        search. history is the list of previous attempt messages and search selects the breadth or deep preamble.
+        Returns (prompt, prefix_messages): prefix_messages is the number of leading messages shared by every
+        attempt of this slug.
+        """
+        current_samples = current_samples if current_samples is not None else samples
+        if search == 'deep':
+            preamble, history_intro, query_intro = DEEP_PREAMBLE, DEEP_HISTORY_INTRO, DEEP_QUERY_INTRO
+        else:
+            preamble, history_intro, query_intro = BREADTH_PREAMBLE, BREADTH_HISTORY_INTRO, BREADTH_QUERY_INTRO
+
+        if not self.prefix_stable:
+            prompt = list(self.few_shot)
+            query = self.query(current_samples, width, iteration, pid, bid)
+            if history:
+                history_patches_str = "\n\n".join([msg["content"] for msg in history])
+                query = preamble + history_intro + history_patches_str + query_intro + query + OUTPUT_REMINDER
+            prompt.append({"role": "user", "content": query})
+            return prompt, len(self.few_shot)
+
+        # Few-shot examples and the original bug report never change for a slug
+        prompt = list(self.few_shot)
+        prompt.append({"role": "user", "content": self.query(samples, width, 0, pid, bid)})
+        prefix_messages = len(prompt)
+        if not history and iteration == 0:
+            return prompt, prefix_messages
+
+        # Previous attempts only ever grow at the end, so each chain also shares its earlier messages
+        prompt.extend({"role": msg["role"], "content": msg["content"]} for msg in history or [])
+        if iteration == 0 and current_samples is samples:
+            query = preamble + STABLE_HISTORY_INTRO + STABLE_ORIGINAL_QUERY_INTRO
+        else:
+            query = preamble + STABLE_HISTORY_INTRO + query_intro + \
+                    self.query(current_samples, width, iteration, pid, bid)
+        prompt.append({"role": "user", "content": query + OUTPUT_REMINDER})
+        return prompt, prefix_messages
+
+    def followup(self, prompt, response, samples, missing):
+        """Prompt asking only for the methods (indices into samples) the previous response left out"""
+        query = fill_template(FOLLOWUP_MISSING_PROMPT, {"MISSING_METHODS": format_buggy_code(samples, missing)})
+        return list(prompt) + [{"role": "assistant", "content": response}, {"role": "user", "content": query}]
@@ -349,4 +349,58 @@ Exception Information:
 {EXCEPTION_INFO}
 
 Please provide the fixed versions of all buggy functions in a single code block, with each fixed function preceded by a comment `// Fixed Method X` (where X is the method number starting from 1).
-"""
\ No newline at end of file
+"""
+
+# Header for trace delta mode: only the runtime events that diverge from the previous iteration are sent
+TRACE_DELTA_HEADER = """Runtime changes caused by the most recent patch (only diverging events are shown):
+- [Changed]: the value/outcome differs from the previous attempt, `was` is the previous value and `orig` the value in the original buggy run.
+- [New]: the event only happened in this run. [Gone]: the event no longer happens.
+- Indented lines are unchanged events given as context.
+"""
+
+# Breadth search: each width attempt should try a different repair strategy
+BREADTH_PREAMBLE = """You are performing breadth-based program repair, where each attempt should try a different strategy to fix the bug. Your goal is to propose a patch that changes the actual program logic and has a meaningful chance of resolving the issue.
+
+ Do NOT make cosmetic changes such as modifying comments, reformatting code, or adjusting error messages — these are not valid fixes.
+Avoid repeating any previous fix exactly, even with minor rewording or refactoring. Repetition wastes exploration.
+Think diversely: Your new patch should be different in its repair logic. 
+"""
+
+BREADTH_HISTORY_INTRO = """Below are previous fix attempts in this breadth search. Study them to avoid overlap and improve diversity:
+
+"""
+
+BREADTH_QUERY_INTRO = """
+The following is the original buggy code and its debugging information. Use this information to guide your fix:
+"""
+
+# Deep search: each iteration refines the most recent attempt
+DEEP_PREAMBLE = """You are performing iterative program repair.
+
+Your task is to **analyze the previous patches and their test outcomes**, understand why they failed, and produce an **improved fix**. 
+Do NOT repeat previous fixes verbatim — this includes identical control flow, clone/add logic, or unchanged loops. Superficial edits (like renaming, formatting, or rephrased error messages) are also unacceptable.
+Instead, make meaningful changes to the program logic that could plausibly fix the remaining test failures.
+You may slightly revise the logic structure, change loop boundaries, add filtering, handle special cases, or introduce helper methods to make your fix more robust.
+
+"""
+
+DEEP_HISTORY_INTRO = ""
+
+DEEP_QUERY_INTRO = """The following is the most recent attempted fix and its debugging results. Use this information to guide your fix:
+"""
+
+OUTPUT_REMINDER = """Output only the fixed functions in a single code block, with each function preceded by a comment `// Fixed Method X` (where X is the method number). Do not include any other text or explanations."""
+
+# Prefix-stable layout: previous attempts are sent as separate messages after the original bug report
+STABLE_HISTORY_INTRO = """The original buggy code and its debugging information are given above, followed by the previous fix attempts and their test results.
+"""
+
+STABLE_ORIGINAL_QUERY_INTRO = """Use the original buggy code and its debugging information above to guide your fix.
+"""
+
+# Follow-up when a response left some methods out: only the missing ones are asked for again
+FOLLOWUP_MISSING_PROMPT = """Your answer did not include a fixed version of the following method(s):
+
+{MISSING_METHODS}
+
+Output only the fixed versions of these methods in a single code block, with each function preceded by a comment `// Fixed Method X` (where X is the method number above). Do not repeat the other methods or include any other text."""
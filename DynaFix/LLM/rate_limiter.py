@@ -0,0 +1,176 @@
+import os
+import csv
+import json
+import time
+import random
+import threading
+from pathlib import Path
+from filelock import FileLock
+
+
+class TokenBucketRateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limiter shared by all threads and all local processes.
+    Both buckets live in a small JSON state file guarded by a file lock, so several LLM_Fix.py workers pointed at
+    the same state_path share one provider budget. A 429 pauses every worker until the Retry-After time.
+    Queue waits are appended to metrics_path.
+    """
+
+    def __init__(self, rpm=0, tpm=0, state_path="./result/rate_limiter_state.json",
+                 metrics_path="./result/defects4j/rate_limiter_metrics.csv"):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.state_path = state_path
+        self.metrics_path = Path(metrics_path)
+        Path(state_path).parent.mkdir(parents=True, exist_ok=True)
+        self.metrics_path.parent.mkdir(parents=True, exist_ok=True)
+        self._file_lock = FileLock(state_path + ".lock")
+        self._thread_lock = threading.Lock()
+        self._waits = []
+
+        if not self.metrics_path.exists():
+            with open(self.metrics_path, "a", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow(["time", "pid", "slug", "tokens", "wait_seconds", "reason"])
+
+    def _load_state(self, now):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {}
+        state.setdefault("requests", float(self.rpm))
+        state.setdefault("tokens", float(self.tpm))
+        state.setdefault("updated", now)
+        state.setdefault("blocked_until", 0.0)
+        return state
+
+    def _save_state(self, state):
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _refill(self, state, now):
+        elapsed = max(now - state["updated"], 0.0)
+        if self.rpm:
+            state["requests"] = min(float(self.rpm), state["requests"] + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            state["tokens"] = min(float(self.tpm), state["tokens"] + elapsed * self.tpm / 60.0)
+        state["updated"] = now
+
+    def _try_acquire(self, tokens):
+        """Take one request and `tokens` tokens if available, otherwise return the seconds to wait"""
+        with self._thread_lock, self._file_lock:
+            now = time.time()
+            state = self._load_state(now)
+            self._refill(state, now)
+
+            wait = max(state["blocked_until"] - now, 0.0)
+            if self.rpm and state["requests"] < 1:
+                wait = max(wait, (1 - state["requests"]) * 60.0 / self.rpm)
+            # A single prompt larger than the whole minute budget only waits for a full bucket
+            needed = min(tokens, self.tpm)
+            if self.tpm and state["tokens"] < needed:
+                wait = max(wait, (needed - state["tokens"]) * 60.0 / self.tpm)
+
+            if wait <= 0:
+                if self.rpm:
+                    state["requests"] -= 1
+                if self.tpm:
+                    state["tokens"] -= needed
+            self._save_state(state)
+            return wait
+
+    def acquire(self, tokens, slug=""):
+        """Block until the request fits both budgets, return the time spent waiting"""
+        if not self.rpm and not self.tpm:
+            return 0.0
+
+        start = time.time()
+        reason = "ok"
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                break
+            reason = "throttled"
+            # Wake up a little early and with jitter, so waiting workers do not all retry at the same moment
+            time.sleep(min(wait, 5.0) * random.uniform(0.8, 1.0) + 0.05)
+
+        waited = time.time() - start
+        self._record_wait(slug, tokens, waited, reason)
+        return waited
+
+    def refund(self, tokens):
+        """
+        Settle the estimate taken by acquire(): give back what a request did not use, or charge what it used on top
+        (negative tokens), which may leave the bucket below zero until it refills
+        """
+        if not self.tpm or not tokens:
+            return
+        with self._thread_lock, self._file_lock:
+            now = time.time()
+            state = self._load_state(now)
+            self._refill(state, now)
+            state["tokens"] = min(float(self.tpm), state["tokens"] + tokens)
+            self._save_state(state)
+
+    def block(self, seconds):
+        """Pause all workers sharing this limiter, e.g. after a 429 with Retry-After"""
+        with self._thread_lock, self._file_lock:
+            now = time.time()
+            state = self._load_state(now)
+            self._refill(state, now)
+            state["blocked_until"] = max(state["blocked_until"], now + seconds)
+            # The provider says the minute budget is used up: start refilling from empty
+            state["requests"] = min(state["requests"], 0.0)
+            self._save_state(state)
+
+    def _record_wait(self, slug, tokens, waited, reason):
+        self._waits.append(waited)
+        with open(self.metrics_path, "a", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerow([time.strftime("%Y-%m-%d %H:%M:%S"), os.getpid(), slug, tokens,
+                                    round(waited, 3), reason])
+
+    def metrics(self):
+        """Queue-wait summary of this process"""
+        if not self._waits:
+            return {"requests": 0, "total_wait": 0.0, "mean_wait": 0.0, "p95_wait": 0.0, "max_wait": 0.0}
+        waits = sorted(self._waits)
+        return {
+            "requests": len(waits),
+            "total_wait": round(sum(waits), 3),
+            "mean_wait": round(sum(waits) / len(waits), 3),
+            "p95_wait": round(waits[min(int(len(waits) * 0.95), len(waits) - 1)], 3),
+            "max_wait": round(waits[-1], 3),
+        }
+
+
+def retry_after_seconds(error):
+    """Retry-After of a rate-limit error in seconds, None if the error carries no such header"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers.get("retry-after-ms")) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+def is_rate_limit_error(error):
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_final_error(error):
+    """A client error that the same request gets again (bad request, auth, no replay record), unlike 408/409/429"""
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in (408, 409, 429)
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
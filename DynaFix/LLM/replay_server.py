@@ -0,0 +1,240 @@
+"""
+Offline stand-in for the chat-completions API, answering from the prompt/response records that
+save_response_record() writes under result/defects4j/*_records_*/.
+
+    python -m LLM.replay_server --records_dir result/defects4j/gpt-4o-2024-11-20_debuginfo_records_GPT4o
+    python LLM_Fix.py --base_url http://127.0.0.1:8765/v1 ...
+
+Requests are matched by the X-DynaFix-Slug/-Width/-Iteration headers LLMInterface sends, then by a hash of the
+prompt messages. Latency and errors (500, 429 with Retry-After, hanging requests) can be injected.
+"""
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RECORD_NAME_PATTERN = re.compile(r"^(?P<slug>.+)_width(?P<width>\d+)_iter(?P<iteration>\d+)\.txt$")
+PROMPT_SEPARATOR = "==== Prompt ====\n"
+RESPONSE_SEPARATOR = "\n\n==== Response ====\n"
+
+
+def prompt_hash(messages):
+    """Hash of the role/content pairs of a prompt, independent of formatting and extra fields"""
+    canonical = [{"role": m.get("role", ""), "content": m.get("content", "")} for m in messages]
+    return hashlib.sha256(json.dumps(canonical, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def parse_record(record_path):
+    """Return (prompt messages, response text) of one saved record"""
+    with open(record_path, "r", encoding="utf-8") as f:
+        content = f.read()
+    if not content.startswith(PROMPT_SEPARATOR) or RESPONSE_SEPARATOR not in content:
+        raise ValueError(f"Not a response record: {record_path}")
+    prompt_text, response = content[len(PROMPT_SEPARATOR):].split(RESPONSE_SEPARATOR, 1)
+    return json.loads(prompt_text), response
+
+
+class RecordStore:
+    """Index of saved records by (slug, width, iteration) and by prompt hash"""
+
+    def __init__(self, records_dirs):
+        self.by_key = {}
+        self.by_hash = {}
+        for records_dir in records_dirs:
+            for name in sorted(os.listdir(records_dir)):
+                match = RECORD_NAME_PATTERN.match(name)
+                if not match:
+                    continue
+                try:
+                    prompt, response = parse_record(os.path.join(records_dir, name))
+                except Exception as e:
+                    print(f"[WARNING] Skipping record {name}: {str(e)}")
+                    continue
+                key = (match.group("slug"), int(match.group("width")), int(match.group("iteration")))
+                self.by_key[key] = response
+                self.by_hash[prompt_hash(prompt)] = response
+        print(f"[INFO] Loaded {len(self.by_key)} records")
+
+    def lookup(self, messages, slug=None, width=None, iteration=None):
+        if slug is not None and width is not None and iteration is not None:
+            response = self.by_key.get((slug, int(width), int(iteration)))
+            if response is not None:
+                return response, "key"
+        response = self.by_hash.get(prompt_hash(messages))
+        if response is not None:
+            return response, "hash"
+        return None, None
+
+
+class ReplayConfig:
+    def __init__(self, latency_ms=0, latency_jitter_ms=0, error_rate=0.0, rate_limit_rate=0.0, retry_after=1,
+                 hang_rate=0.0, hang_seconds=600, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "hits_key": 0, "hits_hash": 0, "misses": 0, "errors": 0, "rate_limited": 0,
+                      "hangs": 0}
+
+    def draw(self):
+        with self.lock:
+            return self.random.random()
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+
+def _completion_body(model, content):
+    tokens = max(len(content) // 4, 1)
+    return {
+        "id": f"chatcmpl-replay-{int(time.time() * 1000)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+def _stream_chunk(model, delta, finish_reason=None):
+    return {
+        "id": "chatcmpl-replay",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def make_handler(store, config):
+    class ReplayHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_stream(self, model, content):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            events = [_stream_chunk(model, {"role": "assistant", "content": ""})]
+            events += [_stream_chunk(model, {"content": content[i:i + 16]}) for i in range(0, len(content), 16)]
+            events.append(_stream_chunk(model, {}, "stop"))
+            try:
+                for event in events:
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # The client closed the stream early, which is what streaming mode is for
+                pass
+            self.close_connection = True
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                self._send_json(200, config.stats)
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            config.count("requests")
+
+            latency = config.latency_ms + config.random.uniform(0, config.latency_jitter_ms)
+            if latency:
+                time.sleep(latency / 1000.0)
+
+            draw = config.draw()
+            if draw < config.hang_rate:
+                config.count("hangs")
+                time.sleep(config.hang_seconds)
+            elif draw < config.hang_rate + config.rate_limit_rate:
+                config.count("rate_limited")
+                self._send_json(429, {"error": {"message": "Rate limit reached (replay)", "type": "requests",
+                                                "code": "rate_limit_exceeded"}},
+                                headers={"Retry-After": str(config.retry_after)})
+                return
+            elif draw < config.hang_rate + config.rate_limit_rate + config.error_rate:
+                config.count("errors")
+                self._send_json(500, {"error": {"message": "Injected server error (replay)", "type": "server_error"}})
+                return
+
+            content, matched_by = store.lookup(request.get("messages", []), self.headers.get("X-DynaFix-Slug"),
+                                               self.headers.get("X-DynaFix-Width"),
+                                               self.headers.get("X-DynaFix-Iteration"))
+            if content is None:
+                config.count("misses")
+                self._send_json(404, {"error": {"message": "No saved record matches this request",
+                                                "type": "invalid_request_error"}})
+                return
+            config.count(f"hits_{matched_by}")
+
+            model = request.get("model", "replay")
+            if request.get("stream"):
+                self._send_stream(model, content)
+            else:
+                self._send_json(200, _completion_body(model, content))
+
+    return ReplayHandler
+
+
+def serve(records_dirs, host="127.0.0.1", port=8765, config=None):
+    """Start the replay server in a background thread and return it; call shutdown() to stop"""
+    store = RecordStore(records_dirs)
+    server = ThreadingHTTPServer((host, port), make_handler(store, config or ReplayConfig()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay saved LLM responses through an OpenAI-compatible API")
+    parser.add_argument('--records_dir', nargs='+', required=True, type=str,
+                        help="Directories with prompt/response records written by LLM_Fix.py")
+    parser.add_argument('--host', default="127.0.0.1", type=str)
+    parser.add_argument('--port', default=8765, type=int)
+    parser.add_argument('--latency_ms', default=0, type=float, help="Fixed latency added to every request")
+    parser.add_argument('--latency_jitter_ms', default=0, type=float, help="Uniform random extra latency")
+    parser.add_argument('--error_rate', default=0.0, type=float, help="Fraction of requests answered with a 500")
+    parser.add_argument('--rate_limit_rate', default=0.0, type=float,
+                        help="Fraction of requests answered with a 429 and Retry-After")
+    parser.add_argument('--retry_after', default=1, type=int, help="Retry-After seconds sent with injected 429s")
+    parser.add_argument('--hang_rate', default=0.0, type=float, help="Fraction of requests that hang")
+    parser.add_argument('--hang_seconds', default=600, type=float, help="How long a hanging request hangs")
+    parser.add_argument('--seed', default=None, type=int, help="Random seed for repeatable error injection")
+    args = parser.parse_args()
+
+    replay_config = ReplayConfig(args.latency_ms, args.latency_jitter_ms, args.error_rate, args.rate_limit_rate,
+                                 args.retry_after, args.hang_rate, args.hang_seconds, args.seed)
+    replay_server = ThreadingHTTPServer((args.host, args.port),
+                                        make_handler(RecordStore(args.records_dir), replay_config))
+    print(f"[INFO] Replay server listening on http://{args.host}:{args.port}/v1")
+    try:
+        replay_server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"[INFO] Stats: {replay_config.stats}")
@@ -7,64 +7,31 @@ import os
 import json
 import re
 import copy
+import time
+import socket
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv, find_dotenv
-from LLM.llm_interface_gpt4o import LLMInterface
-from itertools import islice
+from LLM.llm_interface import LLMInterface
 from LLM.prompts import *
+from LLM.prompt_builder import PromptBuilder
+from LLM.patch_history import PatchHistory
+from LLM.rate_limiter import TokenBucketRateLimiter
+from LLM.cascade import ModelCascade, parse_cascade
+from LLM.patch_extractor import extract_fixed_methods, MATCH_FAILED
+from LLM.replay_server import prompt_hash
 from validator.defects4j_validator import *
+from validator.stop_policy import PlateauStopPolicy
 from DebugInfoFetch.ExtractDebugInfo import *
 from DebugInfoFetch.Project import *
-
-
-def read_debug_info(debug_file_path, max_size=50 * 1024, max_lines=300):
-    try:
-        file_size = os.path.getsize(debug_file_path)
-
-        with open(debug_file_path, 'r', encoding='utf-8') as f:
-            if file_size <= max_size:
-                content = f.read().strip()
-            else:
-                content = '\n'.join(line.strip() for line in islice(f, max_lines))
-
-            return content
-    except FileNotFoundError:
-        return f"Failed to read debug info: File not found"
-    except Exception as e:
-        return f"Failed to read debug info: {str(e)}"
-
-
-def read_method_calls(method_calls_file_path, max_size=50 * 1024, max_entries=300):
-    try:
-        file_size = os.path.getsize(method_calls_file_path)
-
-        with open(method_calls_file_path, 'r', encoding='utf-8') as f:
-            if file_size <= max_size:
-                data = json.load(f)
-            else:
-                data = []
-                for i, line in enumerate(islice(f, max_entries)):
-                    try:
-                        entry = json.loads(line.strip())
-                        data.append(entry)
-                    except json.JSONDecodeError:
-                        f.seek(0)
-                        full_data = json.load(f)
-                        data = full_data[:max_entries]
-                        break
-
-        result = ""
-        for entry in data:
-            result += f"Method: {entry.get('method', 'Unknown')}\n"
-            result += f"Comment:\n    {entry.get('doc', 'No comment')}\n"
-            result += f"Source Code:\n    {entry.get('code', 'No code')}\n\n"
-
-        return result.strip()
-    except FileNotFoundError:
-        return f"Failed to read method calls: File not found"
-    except json.JSONDecodeError as e:
-        return f"Failed to read method calls: Invalid JSON format"
-    except Exception as e:
-        return f"Failed to read method calls: {str(e)}"
+from scheduler import BudgetScheduler
+from journal import RepairJournal
+from ram_workspace import RamWorkspaceCache
+from fanout import BugFanout, FanoutState, group_locations, prepare_workspace, rebase_class_path
+from dataset import BugDataset
+from workqueue import open_queue, LeaseKeeper
+from timing import configure as configure_spans, span
+from admission import configure as configure_admission, summary as admission_summary, GB
 
 
 def save_checkpoint(checkpoint_file, current_id):
@@ -82,17 +49,6 @@ def load_checkpoint(checkpoint_file):
     return 0
 
 
-def get_exception_info(msg_data, slug):
-    """Get exception_info for specified slug from msg_data"""
-    try:
-        row = msg_data[msg_data['slug'] == slug]
-        if not row.empty:
-            return row['exception_info'].iloc[0].strip()
-        return "No exception info available"
-    except Exception as e:
-        return f"Failed to read exception info: {str(e)}"
-
-
 def merge_samples(samples):
     """Merge duplicate buggy_code samples (inline standardization logic)"""
     if not samples:
@@ -109,47 +65,56 @@ def merge_samples(samples):
     return list(standardized.values())
 
 
-def build_prompt(args, samples, msg_data, width, iteration, pid, bid):
-    """Construct prompt based on mode, select debug info source based on iteration"""
-    slug = samples[0]['slug']
-    prompt = []
-
-    buggy_codes = [sample['buggy_code'].strip() for sample in samples]
-    buggy_code_str = "\n\n".join([f"// Method {i + 1}\n{code}" for i, code in enumerate(buggy_codes)])
-
-    if iteration == 0:
-        debug_file_path = os.path.join(args.debug_info_dir, f"{slug}b.txt")
-        method_calls_file_path = os.path.join(args.method_calls_dir, f"{slug}b_method_calls.json")
-    else:
-        debug_file_path = os.path.join(args.dynamic_output_path, "DebugInfo",
-                                       f"{pid}_{bid}_width{width}_iter{iteration}.txt")
-        method_calls_file_path = os.path.join(args.dynamic_output_path, "MethodCalls",
-                                              f"{pid}_{bid}_iter{iteration}_method_calls.json")
-
-    if args.mode == 'debuginfo':
-        prompt = copy.deepcopy(HISTORY_DEBUG_D4J)
-        debug_info = read_debug_info(debug_file_path)
-        method_calls = read_method_calls(method_calls_file_path)
-
-        query = DEBUG_PROMPT
-        query = query.replace("{BUGGY_CODE}", buggy_code_str)
-        query = query.replace("{DEBUG_INFO}", debug_info)
-        query = query.replace("{CALL_INFO}", method_calls)
-    elif args.mode == 'pure':
-        prompt = copy.deepcopy(HISTORY_PURE_D4J)
-        query = USER_PROMPT
-        query = query.replace("{BUGGY_CODE}", buggy_code_str)
-    elif args.mode == 'exception':
-        prompt = copy.deepcopy(HISTORY_EXCEPTION_D4J)
-        exception_info = get_exception_info(msg_data, slug)
-        query = EXCEPTION_PROMPT
-        query = query.replace("{BUGGY_CODE}", buggy_code_str)
-        query = query.replace("{EXCEPTION_INFO}", exception_info)
-    else:
-        raise ValueError("mode must be 'debuginfo', 'pure', or 'exception'")
-
-    prompt.append({"role": "user", "content": query})
-    return prompt
+def new_patch_history(args, label, original_codes, debugger):
+    """History of one search chain, verbatim unless a history budget is configured"""
+    return PatchHistory(label, original_codes, keep_last=args.history_keep_last,
+                        token_budget=args.history_token_budget or None, encoding=debugger.encoding)
+
+
+def record_test_outcomes(args, slug, width_attempt, iteration, base_dir=None):
+    """Append the per-test results of the last validation to a JSONL file, return the failing tests or None"""
+    outcomes = read_test_outcomes(slug, base_dir or args.base_dir)
+    if not outcomes:
+        return None
+
+    record_file = os.path.join('result/defects4j',
+                               f"{args.remote_model.split('/')[-1]}_{args.mode}_test_outcomes.jsonl")
+    with open(record_file, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'slug': slug, 'width_attempt': width_attempt, 'iteration': iteration,
+                            'outcomes': outcomes}) + '\n')
+    return {test_name for test_name, outcome in outcomes.items() if outcome == 'FAIL'}
+
+
+def extract_patch(ctx, search, prompt, prefix_messages, response, current_samples, width_attempt, iteration):
+    """
+    Match the fixed methods of a response to current_samples, asking once more for the methods it left out.
+    Returns (fixed_codes, response): methods that are still missing keep their current code, and every entry is
+    MATCH_FAILED when the response has no usable method at all. response includes the follow-up answer.
+    """
+    current_codes = [sample['buggy_code'].strip() for sample in current_samples]
+    fixed_codes = extract_fixed_methods(response, current_codes)
+    missing = [idx for idx, code in enumerate(fixed_codes) if code is None]
+    if missing and response:
+        print(f"[WARNING] ID {search.i}, width attempt {width_attempt}, iteration {iteration}: "
+              f"{len(missing)} of {len(current_codes)} fixed methods missing, asking for them again")
+        followup_prompt = ctx.prompt_builder.followup(prompt, response, current_samples, missing)
+        with span("chat_followup", width=width_attempt, iteration=iteration):
+            followup = ctx.chat(search, followup_prompt, prefix_messages, max(missing) + 1, width_attempt, iteration,
+                                followup=True)
+        if followup:
+            recovered = extract_fixed_methods(followup, current_codes)
+            for idx in missing:
+                fixed_codes[idx] = recovered[idx]
+            response = f"{response}\n\n{followup}"
+        missing = [idx for idx, code in enumerate(fixed_codes) if code is None]
+
+    if len(missing) == len(current_codes):
+        print(f"[WARNING] ID {search.i}, width attempt {width_attempt}, iteration {iteration}: No fixed method in response")
+        return [MATCH_FAILED] * len(current_codes), response or ""
+    if missing:
+        print(f"[WARNING] ID {search.i}, width attempt {width_attempt}, iteration {iteration}: "
+              f"keeping the current code of methods {[idx + 1 for idx in missing]}")
+    return [code if code is not None else current_codes[idx] for idx, code in enumerate(fixed_codes)], response
 
 
 def save_response_record(slug, width_attempt, iteration, prompt, response):
@@ -168,331 +133,649 @@ def save_response_record(slug, width_attempt, iteration, prompt, response):
         f.write(response)
 
 
-def debug(args):
-    if not os.path.exists('result/defects4j'):
-        os.makedirs('result/defects4j')
+class SlugSearch:
+    """Search state of one slug, carried across calls to repair_slug"""
+
+    def __init__(self, args, i, slug, samples, debugger, base_dir=None, checkout=None):
+        self.i = i
+        self.slug = slug
+        self.samples = samples
+        self.pid, self.bid = slug.rsplit('_', 1)
+        # Directory holding the '<slug>_buggy' workspace the patches are validated in, and the name of the
+        # Defects4J checkout the class paths of the samples point into
+        self.base_dir = base_dir or args.base_dir
+        self.checkout = checkout or slug
+        self.class_paths = [sample['class_path'] for sample in samples]
+        self.original_codes = [sample['buggy_code'] for sample in samples]
+        self.width_patch_history = new_patch_history(args, "Width Attempt", self.original_codes, debugger)
+        self.stop_policy = PlateauStopPolicy(read_trigger_tests(self.checkout, args.base_dir),
+                                             patience=args.plateau_patience,
+                                             stop_on_regression=args.stop_on_regression)
+        self.next_width = 0
+        self.repair_success = False
+        self.finished = False
+        self.attempts = []
+        # Set by a sibling search (fan-out mode) to stop this one
+        self.cancelled = None
+        # {(width, iteration): event} of attempts a previous run already made, replayed instead of redone
+        self.journaled = {}
+
+    def is_cancelled(self):
+        return self.cancelled is not None and self.cancelled.is_set()
+
+    def use_workspace(self, base_dir):
+        """Validate in '<base_dir>/<slug>_buggy', a copy of the checkout, from now on"""
+        self.base_dir = base_dir
+        work_dir = os.path.join(base_dir, f"{self.slug}_buggy")
+        for sample, class_path in zip(self.samples, self.class_paths):
+            sample['class_path'] = rebase_class_path(class_path, self.checkout, work_dir)
+
+    def replay_width_history(self):
+        """Rebuild the breadth history of the width attempts before next_width from the journal"""
+        for width_attempt in range(self.next_width):
+            event = self.journaled.get((width_attempt, 0))
+            if event is not None:
+                self.width_patch_history.add(width_attempt, event['response'], event['fixed_codes'],
+                                             event['submission_result'])
+
+
+class RepairContext:
+    """Data, result tables and LLM client shared by all slugs of a run"""
+
+    def __init__(self, args, use_checkpoint=True):
+        self.args = args
+        if not os.path.exists('result/defects4j'):
+            os.makedirs('result/defects4j')
+
+        self.checkpoint_file = os.path.join('result/defects4j', f'checkpoint_{args.mode}_gpt4o.json') \
+            if use_checkpoint else None
+
+        self.data = BugDataset(args.data_path)
+        msg_data = BugDataset(args.msg_path) if args.mode == 'exception' else None
+
+        self.unique_slugs = self.data.slugs
+
+        total_unique = len(self.unique_slugs)
+        print(f"Total number of unique slugs: {total_unique}")
+
+        if os.path.exists(args.result_path):
+            self.df_results = pd.read_csv(args.result_path, sep=',', encoding='utf-8', engine='python')
+        else:
+            self.df_results = pd.DataFrame(columns=['ID', 'slug', 'bug', 'fix', 'width_attempt', 'iteration'])
+
+        if os.path.exists(args.eval_path):
+            self.df_eval = pd.read_csv(args.eval_path, sep=',', encoding='utf-8', engine='python')
+        else:
+            self.df_eval = pd.DataFrame(
+                columns=['ID', 'slug', 'reward', 'submission_result', 'width_attempt', 'iteration'])
+
+        rate_limiter = None
+        if args.rpm or args.tpm:
+            rate_limiter = TokenBucketRateLimiter(rpm=args.rpm, tpm=args.tpm, state_path=args.rate_limit_state)
+        self.debugger = LLMInterface(args.api_key, args.remote_model, rate_limiter=rate_limiter, stream=args.stream,
+                                     base_url=args.base_url)
+        self.prompt_builder = PromptBuilder(args, msg_data, prefix_stable=args.prefix_stable_prompt)
+
+        self._record_lock = threading.Lock()
+        self.journal = RepairJournal(os.path.splitext(args.eval_path)[0] + '_journal.jsonl')
+        self.ram_cache = None
+        if args.ram_workspace:
+            self.ram_cache = RamWorkspaceCache(args.ram_workspace, int(args.ram_workspace_capacity * 1024 ** 3))
+
+        # Set in worker mode: attempts are also sent to the campaign's result store
+        self.work_queue = None
+        self.worker_id = None
+
+        self.cascade = None
+        if args.cascade_tiers:
+            model_alias = args.remote_model.split('/')[-1]
+            self.cascade = ModelCascade(args.cascade_tiers,
+                                        os.path.join('result/defects4j', f'cascade_{model_alias}_{args.mode}.json'))
+
+    def load_checkpoint(self):
+        return load_checkpoint(self.checkpoint_file) if self.checkpoint_file else 0
+
+    def save_checkpoint(self, current_id):
+        if self.checkpoint_file:
+            save_checkpoint(self.checkpoint_file, current_id)
+
+    def print_summary(self):
+        if self.cascade:
+            print(f"[CASCADE]\n{self.cascade.summary()}")
+        if self.ram_cache:
+            print(f"[RAM WORKSPACE] {self.ram_cache.summary()}")
+        if self.debugger.rate_limiter:
+            print(f"[RATE LIMIT] {self.debugger.rate_limiter.metrics()}")
+
+    def chain_depth(self, width_attempt, deep_try):
+        """Deep iterations allowed for a width attempt, capped by its cascade tier"""
+        if self.cascade:
+            return min(deep_try, self.cascade.tier_for(width_attempt).deep)
+        return deep_try
+
+    def chat(self, search, prompt, prefix_messages, expected_methods, width_attempt, iteration, followup=False):
+        """
+        Send an attempt's prompt to the remote model, or to its cascade tier's model.
+        A follow-up is not tagged with the attempt, so a replay server matches it by its prompt instead.
+        """
+        kwargs = dict(max_retries=10, temperature=self.args.temperature, prefix_messages=prefix_messages,
+                      expected_methods=expected_methods, width=None if followup else width_attempt,
+                      iteration=None if followup else iteration)
+        if self.cascade:
+            tier = self.cascade.tier_for(width_attempt)
+            return self.cascade.chat(self.debugger, tier, prompt, search.i, search.slug, **kwargs)
+        return self.debugger.chat(prompt, search.i, search.slug, **kwargs)
+
+    def new_search(self, i, slug, checkout=None):
+        samples = self.data.rows(slug)
+        samples = merge_samples(samples)
+        search = SlugSearch(self.args, i, slug, samples, self.debugger, checkout=checkout)
+        search.journaled = self.journal.attempts(slug)
+        return search
+
+    def lease_workspace(self, search):
+        """Move a search to a RAM copy of its checkout, if RAM workspaces are enabled and it fits"""
+        if self.ram_cache:
+            work_dir = self.ram_cache.lease(search.slug, os.path.join(self.args.base_dir, f"{search.checkout}_buggy"))
+            if work_dir:
+                search.use_workspace(os.path.dirname(work_dir))
+
+    def release_workspace(self, search):
+        if self.ram_cache:
+            self.ram_cache.release(search.slug, os.path.join(self.args.base_dir, f"{search.checkout}_buggy"))
+
+    def record_attempt(self, search, samples, fixed_codes, reward, submission_result, width_attempt, iteration,
+                       failing_tests=None, replayed=False):
+        """
+        Append one validated attempt to the prediction and evaluation CSVs. A replayed attempt is normally there
+        already, unless the run crashed between journaling it and writing the CSVs.
+        """
+        if not replayed or not self._has_attempt(search.slug, width_attempt, iteration):
+            with self._record_lock:
+                self._record_attempt(search, samples, fixed_codes, reward, submission_result, width_attempt,
+                                     iteration)
+            if self.work_queue:
+                self.work_queue.add_result(self.worker_id, search.slug, {
+                    'ID': search.i,
+                    'slug': search.slug,
+                    'width_attempt': width_attempt,
+                    'iteration': iteration,
+                    'reward': bool(reward),
+                    'submission_result': submission_result,
+                    'fixed_codes': list(fixed_codes),
+                })
+        search.attempts.append({
+            'width_attempt': width_attempt,
+            'iteration': iteration,
+            'reward': bool(reward),
+            'submission_result': submission_result,
+            'failing_tests': None if failing_tests is None else len(failing_tests),
+        })
+
+    def _has_attempt(self, slug, width_attempt, iteration):
+        with self._record_lock:
+            df = self.df_eval
+            return bool(((df['slug'] == slug) & (df['width_attempt'] == width_attempt)
+                         & (df['iteration'] == iteration)).any())
+
+    def _record_attempt(self, search, samples, fixed_codes, reward, submission_result, width_attempt, iteration):
+        for idx, (sample, fixed_code) in enumerate(zip(samples, fixed_codes)):
+            result_idx = len(self.df_results)
+            self.df_results.loc[result_idx] = {
+                'ID': search.i,
+                'slug': sample['slug'],
+                'bug': sample['buggy_code'],
+                'fix': fixed_code,
+                'width_attempt': width_attempt,
+                'iteration': iteration
+            }
+        self.df_results.to_csv(self.args.result_path, sep=',', encoding='utf-8', index=False)
+
+        self.df_eval.loc[len(self.df_eval)] = {
+            'ID': search.i,
+            'slug': search.slug,
+            'reward': reward,
+            'submission_result': submission_result,
+            'width_attempt': width_attempt,
+            'iteration': iteration
+        }
+        self.df_eval.to_csv(self.args.eval_path, sep=',', encoding='utf-8', index=False)
+
+
+def collect_iteration_trace(ctx, search, width_attempt, iteration, replayed):
+    """
+    Trace the patched checkout for the next deep iteration's debug info (and --trace_delta).
+    The patch is still applied after test(); a replayed attempt has no patch applied and is not traced.
+    """
+    if not ctx.args.collect_iteration_traces or replayed:
+        return
+    trace_args = copy.copy(ctx.args)
+    trace_args.checkout_path = search.base_dir
+    try:
+        replace_ant_and_extract_debug_info(search.pid, search.bid, width_attempt, iteration, trace_args)
+    except Exception as e:
+        print(f"Thread {threading.get_ident()} error during ant replacement or debug info extraction: {str(e)}")
+
+
+def run_attempt(ctx, search, current_samples, width_attempt, iteration, history, search_type):
+    """
+    Generate and validate one attempt, or replay it from the journal if a previous run already made it.
+    Returns (fixed_codes, response, reward, submission_result, failing_tests, replayed).
+    """
+    args, slug, samples = ctx.args, search.slug, search.samples
+    with span("build_prompt", width=width_attempt, iteration=iteration):
+        prompt, prefix_messages = ctx.prompt_builder.build(samples, width_attempt, iteration, search.pid, search.bid,
+                                                           history=history, search=search_type,
+                                                           current_samples=current_samples)
+
+    event = search.journaled.get((width_attempt, iteration))
+    if event is not None and event['prompt_hash'] == prompt_hash(prompt):
+        print(f"[INFO] ID {search.i}, width attempt {width_attempt}, iteration {iteration} replayed from the journal: "
+              f"{event['submission_result']}")
+        failing_tests = None if event['failing_tests'] is None else set(event['failing_tests'])
+        return (event['fixed_codes'], event['response'], event['reward'], event['submission_result'], failing_tests,
+                True)
+    if event is not None:
+        # The inputs changed since the journaled run (data, traces, options): its answer is not for this prompt
+        print(f"[WARNING] ID {search.i}, width attempt {width_attempt}, iteration {iteration}: prompt differs from "
+              f"the journaled one, running it again")
+
+    with span("chat", width=width_attempt, iteration=iteration):
+        response = ctx.chat(search, prompt, prefix_messages, len(current_samples), width_attempt, iteration)
+    # No answer after all retries (outage, rejected request): a restart must ask again instead of replaying it
+    answered = response is not None
+
+    fixed_codes, response = extract_patch(ctx, search, prompt, prefix_messages, response, current_samples,
+                                          width_attempt, iteration)
+
+    # Save prompt and response records
+    save_response_record(slug, width_attempt, iteration, prompt, response)
+
+    file_replacements = {}
+    for idx, (sample, fixed_code) in enumerate(zip(samples, fixed_codes)):
+        class_path = sample['class_path']
+        buggy_code = sample['buggy_code'].strip()
+        if class_path not in file_replacements:
+            file_replacements[class_path] = []
+        file_replacements[class_path].append((buggy_code, fixed_code))
 
-    checkpoint_file = os.path.join('result/defects4j', f'checkpoint_{args.mode}_gpt4o.json')
+    if fixed_codes[0] == MATCH_FAILED:
+        # Nothing to validate: a patch of unchanged methods would only cost a test run
+        reward, submission_result, failing_tests = False, f'{MATCH_FAILED}: no fixed method in response', None
+    else:
+        with span("validate", width=width_attempt, iteration=iteration):
+            reward, submission_result = test(slug, file_replacements, base_dir=search.base_dir)
+        failing_tests = record_test_outcomes(args, slug, width_attempt, iteration, search.base_dir)
+    print("Test result:", submission_result)
+
+    if answered:
+        ctx.journal.record(slug, width_attempt, iteration, prompt_hash(prompt), response, fixed_codes, reward,
+                           submission_result, failing_tests)
+    return fixed_codes, response, reward, submission_result, failing_tests, False
+
+
+def repair_slug(ctx, search, width_count, deep_try):
+    """Run up to width_count more width attempts of a slug, each with at most deep_try iterations"""
+    args, debugger = ctx.args, ctx.debugger
+    i, slug, samples = search.i, search.slug, search.samples
+    pid, bid = search.pid, search.bid
+    original_codes = search.original_codes
+    width_patch_history = search.width_patch_history
+    stop_policy = search.stop_policy
+    repair_success = search.repair_success
+
+    for width_attempt in range(search.next_width, search.next_width + width_count):
+        if repair_success or search.is_cancelled():
+            break
+        search.next_width = width_attempt + 1
+
+        print(f"[INFO] Start width attempt {width_attempt + 1}/{args.width_try} for slug {slug}")
+        if ctx.cascade:
+            print(f"[INFO] Cascade tier: {ctx.cascade.tier_for(width_attempt).name}")
+        last_fixed_codes = [sample['buggy_code'].strip() for sample in samples]
+        deep_patch_history = new_patch_history(args, "Iteration", original_codes, debugger)
+        stop_policy.reset()
+
+        try:
+            j = 0
+            fixed_codes, response, reward, submission_result, failing_tests, replayed = run_attempt(
+                ctx, search, samples, width_attempt, j, width_patch_history.messages(), 'breadth')
+            deep_patch_history.add(j, response, fixed_codes, submission_result)
+            width_patch_history.add(width_attempt, response, fixed_codes, submission_result)
+
+            ctx.record_attempt(search, samples, fixed_codes, reward, submission_result, width_attempt, j,
+                               failing_tests, replayed)
+
+            if 'Compile failed' in submission_result:
+                print(f"[INFO] ID {i}, width attempt {width_attempt}, iteration {j} compile failed, abandoning this width attempt")
+                continue
+
+            if MATCH_FAILED in submission_result:
+                print(f"[INFO] ID {i}, width attempt {width_attempt}, iteration {j} no fixed method, abandoning this width attempt")
+                continue
+
+            if "Time out" in submission_result:
+                print(
+                    f"[FATAL] Time out detected at ID {i}, iteration {j}, stopping further attempts.")
+                search.finished = True
+                break
 
-    data = pd.read_csv(args.data_path, sep=',', encoding='utf-8', engine='python')
-    msg_data = pd.read_csv(args.msg_path, sep=',', encoding='utf-8', engine='python')
+            elif 'Failing tests:' in submission_result:
+                try:
+                    failing_count = int(submission_result.split('Failing tests:')[1].strip().split()[0])
+                except Exception:
+                    print(f"[ERROR] ID {i}, width attempt {width_attempt}, iteration {j} unable to parse Failing tests count, abandoning this width attempt")
+                    search.finished = True
+                    break
 
-    grouped_data = data.groupby('slug')
-    unique_slugs = list(grouped_data.groups.keys())
+                if failing_count == 0:
+                    print(f"[SUCCESS] ID {i}, width attempt {width_attempt}, iteration {j} repair successful")
+                    repair_success = True
+                    break
+                else:
+                    collect_iteration_trace(ctx, search, width_attempt, j + 1, replayed)
 
-    total_unique = len(unique_slugs)
-    print(f"Total number of unique slugs: {total_unique}")
+                    last_fixed_codes = fixed_codes
+                    print(f"[INFO] ID {i}, width attempt {width_attempt}, iteration {j} compile success but test failed, starting deep attempt")
 
-    if os.path.exists(args.result_path):
-        df_results = pd.read_csv(args.result_path, sep=',', encoding='utf-8', engine='python')
-    else:
-        df_results = pd.DataFrame(columns=['ID', 'slug', 'bug', 'fix', 'width_attempt', 'iteration'])
+            else:
+                print(f"[ERROR] ID {i}, width attempt {width_attempt}, iteration {j} unknown status, abandoning this width attempt")
+                continue
 
-    if os.path.exists(args.eval_path):
-        df_eval = pd.read_csv(args.eval_path, sep=',', encoding='utf-8', engine='python')
-    else:
-        df_eval = pd.DataFrame(columns=['ID', 'slug', 'reward', 'submission_result', 'width_attempt', 'iteration'])
+            stop_reason = stop_policy.observe(failing_tests)
+            if stop_reason:
+                print(f"[INFO] ID {i}, width attempt {width_attempt}, iteration {j} skipping deep attempts: {stop_reason}")
+                continue
 
-    row_num = load_checkpoint(checkpoint_file)
-    print(f"Resuming from ID: {row_num}")
+            for j in range(1, ctx.chain_depth(width_attempt, deep_try)):
+                if search.is_cancelled():
+                    print(f"[INFO] ID {i}, width attempt {width_attempt}: cancelled, a sibling location was repaired")
+                    break
+                try:
+                    current_samples = copy.deepcopy(samples)
+                    for idx, code in enumerate(last_fixed_codes):
+                        current_samples[idx]['buggy_code'] = code
 
-    debugger = LLMInterface(args.api_key, args.remote_model)
+                    print(f"[INFO] ID {i}, Deep attempt {j}")
+                    fixed_codes, response, reward, submission_result, failing_tests, replayed = run_attempt(
+                        ctx, search, current_samples, width_attempt, j, deep_patch_history.messages(), 'deep')
 
-    for i, slug in tqdm(enumerate(unique_slugs), total=len(unique_slugs), initial=row_num):
-        if i < row_num:
-            continue
+                    deep_patch_history.add(j, response, fixed_codes, submission_result)
 
-        samples = grouped_data.get_group(slug).to_dict('records')
-        samples = merge_samples(samples)
-        pid, bid = slug.rsplit('_', 1)
-        deep_patch_history = []
-        width_patch_history = []
-        repair_success = False
-        eval_index = len(df_eval)
-
-        for width_attempt in range(args.width_try):
-            if repair_success:
-                break
+                    ctx.record_attempt(search, current_samples, fixed_codes, reward, submission_result, width_attempt, j,
+                                       failing_tests, replayed)
 
-            print(f"[INFO] Start width attempt {width_attempt + 1}/{args.width_try} for slug {slug}")
-            last_fixed_codes = [sample['buggy_code'].strip() for sample in samples]
-            deep_patch_history = []
+                    if submission_result != 'Compile failed':
+                        last_fixed_codes = [fixed_code if fixed_code != MATCH_FAILED else last_fixed_codes[idx]
+                                            for idx, fixed_code in enumerate(fixed_codes)]
 
-            try:
-                j = 0
-                prompt = build_prompt(args, samples, msg_data, width_attempt, j, pid, bid)
-
-                if width_patch_history:
-                    history_patches_str = "\n\n".join([msg["content"] for msg in width_patch_history])
-                    prompt[-1]["content"] = (
-                                                "You are performing breadth-based program repair, where each attempt "
-                                                "should try a different strategy to fix the bug. Your goal is to "
-                                                "propose a patch that changes the actual program logic and has a "
-                                                "meaningful chance of resolving the issue.\n\n "
-                                                "Do NOT make cosmetic changes such as modifying comments, reformatting code, or adjusting error messages — these are not valid fixes.\n"
-                                                "Avoid repeating any previous fix exactly, even with minor rewording or refactoring. Repetition wastes exploration.\n"
-                                                "Think diversely: Your new patch should be different in its repair logic. \n"
-                                                "Below are previous fix attempts in this breadth search. Study them to avoid overlap and improve diversity:\n\n"
-                                                f"{history_patches_str}\n"
-                                                "The following is the original buggy code and its debugging information. "
-                                                "Use this information to guide your fix:\n"
-                                            ) + prompt[-1][
-                                                "content"] + "Output only the fixed functions in a single code block, with each function preceded by a comment `// Fixed Method X` (where X is the method number). Do not include any other text or explanations."
-
-                response = debugger.chat(prompt, i, slug, max_retries=10, temperature=args.temperature)
-
-                # Save prompt and response records
-                save_response_record(slug, width_attempt, j, prompt, response)
-
-                pattern = r"```.*?\n(.*?)```"
-                pattern2 = r"(?:// Fixed Method \d+\n.*?)(?=(?:// Fixed Method \d+\n|$))"
-                codeblocks_1 = re.findall(pattern, response, flags=re.DOTALL)
-                codeblocks_2 = re.findall(pattern2, response, flags=re.DOTALL)
-
-                if not codeblocks_1 and not codeblocks_2:
-                    print(f"[WARNING] ID {i}, width attempt {width_attempt}, iteration {j} No code block")
-                    fixed_codes = ['Match failed'] * len(samples)
-                else:
-                    if not codeblocks_1 and codeblocks_2:
-                        # Markdown not matched, but comment style matched
-                        code_content = response
-                    else:
-                        code_content = codeblocks_1[0].strip()
-                    pattern = r'(?:// Fixed Method \d+\n.*?)(?=(?:// Fixed Method \d+\n|$))'
-                    fixed_codes = [code.strip() for code in re.findall(pattern, code_content, re.DOTALL) if
-                                   code.strip()]
-                    fixed_codes = [re.sub(r'^// Fixed Method \d+\n', '', code).strip() for code in fixed_codes]
-                    if len(fixed_codes) != len(samples):
+                    if "Locate failed" in submission_result:
                         print(
-                            f"[WARNING] ID {i}, width attempt {width_attempt}, iteration {j}: Mismatch in number of fixed methods, expected {len(samples)}, actual {len(fixed_codes)}")
-                        fixed_codes = ['Match failed'] * len(samples)
-
-                file_replacements = {}
-                for idx, (sample, fixed_code) in enumerate(zip(samples, fixed_codes)):
-                    class_path = sample['class_path']
-                    buggy_code = sample['buggy_code'].strip()
-                    if class_path not in file_replacements:
-                        file_replacements[class_path] = []
-                    file_replacements[class_path].append((buggy_code, fixed_code))
-
-                reward, submission_result = test(slug, file_replacements, base_dir=args.base_dir)
-                print("Test result:", submission_result)
-                history_msg = (
-                    f"[Iteration {j}] Attempted fix:\n{response.strip()}\n"
-                    f"[Iteration {j}] Test result: {submission_result}"
-                )
-                deep_patch_history.append({"role": "system", "content": history_msg})
-
-                width_history_msg = (
-                    f"[Width Attempt {width_attempt}] Attempted fix:\n{response.strip()}\n"
-                    f"[Width Attempt {width_attempt}] Test result: {submission_result}"
-                )
-                width_patch_history.append({"role": "system", "content": width_history_msg})
-
-                for idx, (sample, fixed_code) in enumerate(zip(samples, fixed_codes)):
-                    result_idx = len(df_results)
-                    df_results.loc[result_idx] = {
-                        'ID': i,
-                        'slug': sample['slug'],
-                        'bug': sample['buggy_code'],
-                        'fix': fixed_code,
-                        'width_attempt': width_attempt,
-                        'iteration': j
-                    }
-                df_results.to_csv(args.result_path, sep=',', encoding='utf-8', index=False)
-
-                df_eval.loc[eval_index] = {
-                    'ID': i,
-                    'slug': slug,
-                    'reward': reward,
-                    'submission_result': submission_result,
-                    'width_attempt': width_attempt,
-                    'iteration': j
-                }
-                eval_index += 1  # Increment index
-                df_eval.to_csv(args.eval_path, sep=',', encoding='utf-8', index=False)
+                            f"[FATAL] Locate failed detected at ID {i}, iteration {j}, stopping further attempts.")
+                        break
 
-                save_checkpoint(checkpoint_file, i + 1)
+                    if "Compile failed" in submission_result:
+                        print(
+                            f"[FATAL] Compile failed detected at ID {i}, iteration {j}, stopping further attempts.")
+                        break
 
-                if 'Compile failed' in submission_result:
-                    print(f"[INFO] ID {i}, width attempt {width_attempt}, iteration {j} compile failed, abandoning this width attempt")
-                    continue
+                    if "Time out" in submission_result:
+                        print(
+                            f"[FATAL] Time out detected at ID {i}, iteration {j}, stopping further attempts.")
+                        break
 
-                if "Time out" in submission_result:
-                    print(
-                        f"[FATAL] Time out detected at ID {i}, iteration {j}, stopping further attempts.")
-                    break
+                    if not reward and submission_result != 'Compile failed':
+                        print(
+                            f"Generating new debug info, ID {i}, iteration {j}, thread {threading.get_ident()}, because reward=False and submission_result={submission_result}")
+                        collect_iteration_trace(ctx, search, width_attempt, j + 1, replayed)
 
-                elif 'Failing tests:' in submission_result:
-                    try:
-                        failing_count = int(submission_result.split('Failing tests:')[1].strip().split()[0])
-                    except Exception:
-                        print(f"[ERROR] ID {i}, width attempt {width_attempt}, iteration {j} unable to parse Failing tests count, abandoning this width attempt")
+                    if args.early_stop and reward:
+                        repair_success = True
+                        print(f"[SUCCESS] ID {i}, iteration {j} repair successful")
                         break
 
-                    if failing_count == 0:
-                        print(f"[SUCCESS] ID {i}, width attempt {width_attempt}, iteration {j} repair successful")
-                        repair_success = True
+                    stop_reason = stop_policy.observe(failing_tests)
+                    if stop_reason:
+                        print(f"[INFO] ID {i}, width attempt {width_attempt}, iteration {j} stopping deep attempts: {stop_reason}")
                         break
-                    else:
-                        # try:
-                        #     replace_ant_and_extract_debug_info(pid, bid, width_attempt, j + 1, args)
-                        # except Exception as e:
-                        #     print(
-                        #         f"Thread {threading.get_ident()} error during ant replacement or debug info extraction: {str(e)}")
 
-                        last_fixed_codes = fixed_codes
-                        print(f"[INFO] ID {i}, width attempt {width_attempt}, iteration {j} compile success but test failed, starting deep attempt")
+                except Exception as e:
+                    print(f"Error processing ID {i}, try {j}: {str(e)}")
+                    traceback.print_exc()
+                    continue
 
+        finally:
+            print(f"[INFO] Restoring repo for slug {slug} after processing (ID {i})")
+            try:
+                with span("restore_file", width=width_attempt):
+                    success = restore_file(slug, base_dir=search.base_dir)
+                if success:
+                    print(f"[INFO] Successfully restored repo for slug {slug}")
                 else:
-                    print(f"[ERROR] ID {i}, width attempt {width_attempt}, iteration {j} unknown status, abandoning this width attempt")
-                    continue
+                    print(f"[WARNING] Failed to restore repo for slug {slug}")
+            except Exception as restore_error:
+                print(f"[ERROR] Exception while restoring repo for slug {slug}: {restore_error}")
 
-                for j in range(1, args.deep_try):
-                    try:
-                        current_samples = copy.deepcopy(samples)
-                        for idx, code in enumerate(last_fixed_codes):
-                            current_samples[idx]['buggy_code'] = code
-
-                        # [Modification 2] Pass current_samples
-                        prompt = build_prompt(args, current_samples, msg_data, width_attempt, j, pid, bid)
-
-                        print(f"[INFO] ID {i}, Deep attempt {j}")
-                        if deep_patch_history:
-                            history_patches_str = "\n\n".join([msg["content"] for msg in deep_patch_history])
-                            prompt[-1]["content"] = (
-                                                        "You are performing iterative program repair.\n\n"
-                                                        "Your task is to **analyze the previous patches and their test outcomes**, understand why they failed, and produce an **improved fix**. \n"
-                                                        "Do NOT repeat previous fixes verbatim — this includes identical control flow, clone/add logic, or unchanged loops. Superficial edits (like renaming, formatting, or rephrased error messages) are also unacceptable.\n"
-                                                        "Instead, make meaningful changes to the program logic that could plausibly fix the remaining test failures.\n"
-                                                        "You may slightly revise the logic structure, change loop boundaries, add filtering, handle special cases, or introduce helper methods to make your fix more robust.\n\n"
-                                                        f"{history_patches_str}"
-                                                        "The following is the most recent attempted fix and its debugging results. "
-                                                        "Use this information to guide your fix:\n"
-                                                    ) + prompt[-1][
-                                                        "content"] + "Output only the fixed functions in a single code block, with each function preceded by a comment `// Fixed Method X` (where X is the method number). Do not include any other text or explanations."
-
-                        response = debugger.chat(prompt, i, slug, max_retries=10, temperature=args.temperature)
-
-                        # Save prompt and response records
-                        save_response_record(slug, width_attempt, j, prompt, response)
-
-                        pattern = r"```.*?\n(.*?)```"
-                        pattern2 = r"(?:// Fixed Method \d+\n.*?)(?=(?:// Fixed Method \d+\n|$))"
-                        codeblocks_1 = re.findall(pattern, response, flags=re.DOTALL)
-                        codeblocks_2 = re.findall(pattern2, response, flags=re.DOTALL)
-
-                        if not codeblocks_1 and not codeblocks_2:
-                            print(f"[WARNING] ID {i}, deep attempt {width_attempt}, iteration {j} No code block")
-                            fixed_codes = ['Match failed'] * len(current_samples)
-                        else:
-                            if not codeblocks_1 and codeblocks_2:
-                                # Markdown not matched, but comment style matched
-                                code_content = response
-                            else:
-                                code_content = codeblocks_1[0].strip()
-                            pattern = r'(?:// Fixed Method \d+\n.*?)(?=(?:// Fixed Method \d+\n|$))'
-                            fixed_codes = [code.strip() for code in re.findall(pattern, code_content, re.DOTALL) if
-                                           code.strip()]
-                            fixed_codes = [re.sub(r'^// Fixed Method \d+\n', '', code).strip() for code in fixed_codes]
-                            if len(fixed_codes) != len(current_samples):
-                                print(
-                                    f"Mismatch in number of fixed methods for ID {i}, iteration {j}: expected {len(current_samples)}, got {len(fixed_codes)}")
-                                fixed_codes = ['Match failed'] * len(current_samples)
-
-                        file_replacements = {}
-                        for idx, (sample, fixed_code) in enumerate(zip(samples, fixed_codes)):
-                            class_path = sample['class_path']
-                            buggy_code = sample['buggy_code'].strip()
-                            print(
-                                f"[INFO] ID {i}, iteration {j}, using buggy_code from: {'last_fixed_codes' if j > 0 else 'sample'}")
-                            if class_path not in file_replacements:
-                                file_replacements[class_path] = []
-                            file_replacements[class_path].append((buggy_code, fixed_code))
-
-                        reward, submission_result = test(slug, file_replacements, base_dir=args.base_dir)
-
-                        history_msg = (
-                            f"[Iteration {j}] Attempted fix:\n{response.strip()}\n"
-                            f"[Iteration {j}] Test result: {submission_result}"
-                        )
-                        deep_patch_history.append({"role": "system", "content": history_msg})
-
-                        for idx, (sample, fixed_code) in enumerate(zip(current_samples, fixed_codes)):
-                            result_idx = len(df_results)
-                            df_results.loc[result_idx] = {
-                                'ID': i,
-                                'slug': sample['slug'],
-                                'bug': sample['buggy_code'],
-                                'fix': fixed_code,
-                                'width_attempt': width_attempt,
-                                'iteration': j
-                            }
-                        df_results.to_csv(args.result_path, sep=',', encoding='utf-8', index=False)
-
-                        df_eval.loc[eval_index] = {
-                            'ID': i,
-                            'slug': slug,
-                            'reward': reward,
-                            'submission_result': submission_result,
-                            'width_attempt': width_attempt,
-                            'iteration': j
-                        }
-                        eval_index += 1
-                        df_eval.to_csv(args.eval_path, sep=',', encoding='utf-8', index=False)
-
-                        save_checkpoint(checkpoint_file, i + 1)
-
-                        if submission_result != 'Compile failed':
-                            last_fixed_codes = [fixed_code if fixed_code != 'Match failed' else last_fixed_codes[idx]
-                                                for idx, fixed_code in enumerate(fixed_codes)]
-
-                        if "Locate failed" in submission_result:
-                            print(
-                                f"[FATAL] Locate failed detected at ID {i}, iteration {j}, stopping further attempts.")
-                            break
-
-                        if "Compile failed" in submission_result:
-                            print(
-                                f"[FATAL] Compile failed detected at ID {i}, iteration {j}, stopping further attempts.")
-                            break
-
-                        if "Time out" in submission_result:
-                            print(
-                                f"[FATAL] Time out detected at ID {i}, iteration {j}, stopping further attempts.")
-                            break
-
-                        if not reward and submission_result != 'Compile failed':
-                            print(
-                                f"Generating new debug info, ID {i}, iteration {j}, thread {threading.get_ident()}, because reward=False and submission_result={submission_result}")
-                            # try:
-                            #     replace_ant_and_extract_debug_info(pid, bid, width_attempt, j + 1, args)
-                            # except Exception as e:
-                            #     print(
-                            #         f"Thread {threading.get_ident()} error during ant replacement or debug info extraction: {str(e)}")
-
-                        if args.early_stop and reward:
-                            repair_success = True
-                            print(f"[SUCCESS] ID {i}, iteration {j} repair successful")
-                            break
+    if repair_success and not search.repair_success and ctx.cascade:
+        ctx.cascade.record_fix(ctx.cascade.tier_for(search.next_width - 1))
+    search.repair_success = repair_success
+    if repair_success or search.next_width >= args.width_try:
+        search.finished = True
+    return search
+
+
+def debug(args):
+    ctx = RepairContext(args)
+    row_num = ctx.load_checkpoint()
+    print(f"Resuming from ID: {row_num}")
+
+    for i, slug in tqdm(enumerate(ctx.unique_slugs), total=len(ctx.unique_slugs), initial=row_num):
+        if i < row_num:
+            continue
+
+        search = ctx.new_search(i, slug)
+        ctx.lease_workspace(search)
+        try:
+            with span("repair_slug", slug=slug):
+                repair_slug(ctx, search, args.width_try, args.deep_try)
+        finally:
+            ctx.release_workspace(search)
+        ctx.prompt_builder.forget(slug)
+        ctx.save_checkpoint(i + 1)
+
+    ctx.print_summary()
+
+
+def scheduled_debug(args):
+    """Repair all slugs under a global budget, handing out width/deep attempts in rounds"""
+    ctx = RepairContext(args, use_checkpoint=False)
+    model_alias = args.remote_model.split('/')[-1]
+    scheduler = BudgetScheduler(
+        os.path.join('result/defects4j', f'scheduler_{model_alias}_{args.mode}.json'),
+        os.path.join('result/defects4j', f'scheduler_{model_alias}_{args.mode}_rounds.jsonl'),
+        token_budget=args.token_budget, time_budget=args.time_budget * 3600,
+        max_width=args.width_try, max_deep=args.deep_try, min_deep=args.scheduler_min_deep,
+        cutoff_chains=args.scheduler_cutoff)
+
+    searches = {}
+    for i, slug in enumerate(ctx.unique_slugs):
+        searches[slug] = ctx.new_search(i, slug)
+        scheduler.register(slug, i, len(searches[slug].stop_policy.original_failing))
+        # Resume: continue after the width attempts already spent before a restart
+        searches[slug].next_width = scheduler.state['bugs'][slug]['widths_used']
+        searches[slug].repair_success = scheduler.state['bugs'][slug]['repaired']
+        searches[slug].replay_width_history()
+
+    while True:
+        grants = scheduler.plan_round()
+        if not grants:
+            break
+        print(f"[SCHEDULER] Round {scheduler.state['round']}: {len(grants)} grants")
+        for slug, width_count, deep_try in grants:
+            search = searches[slug]
+            search.attempts = []
+            tokens_before = ctx.debugger.total_input_tokens + ctx.debugger.total_output_tokens
+            start_time = time.time()
+            ctx.lease_workspace(search)
+            try:
+                with span("repair_slug", slug=slug, round=scheduler.state['round']):
+                    repair_slug(ctx, search, width_count, deep_try)
+            except Exception as e:
+                print(f"[ERROR] Scheduled repair of {slug} failed: {str(e)}")
+                traceback.print_exc()
+            finally:
+                ctx.release_workspace(search)
+            tokens = ctx.debugger.total_input_tokens + ctx.debugger.total_output_tokens - tokens_before
+            scheduler.report(slug, search.attempts, search.next_width, search.repair_success, tokens,
+                             time.time() - start_time, finished=search.finished)
+            if search.finished or search.repair_success:
+                ctx.prompt_builder.forget(slug)
 
+    print(f"[SCHEDULER] {scheduler.summary()}")
+    ctx.print_summary()
+
+
+def repair_location(ctx, fanout, search):
+    """Spend width attempts of the bug's shared budget on one location until it is repaired or cancelled"""
+    try:
+        while not search.finished and fanout.take_width():
+            with span("repair_slug", slug=search.slug, bug=fanout.bug):
+                repair_slug(ctx, search, 1, ctx.args.deep_try)
+            if search.repair_success:
+                print(f"[SUCCESS] {fanout.bug}: plausible patch at {search.slug}, cancelling sibling locations")
+                fanout.report_success(search.slug)
+    finally:
+        ctx.release_workspace(search)
+    ctx.prompt_builder.forget(search.slug)
+    return search
+
+
+def fanout_debug(args):
+    """Repair the top-k SBFL locations of each bug concurrently, each in its own workspace"""
+    ctx = RepairContext(args, use_checkpoint=False)
+    model_alias = args.remote_model.split('/')[-1]
+    state = FanoutState(os.path.join('result/defects4j', f'fanout_{model_alias}_{args.mode}.json'))
+    workspace_root = args.fanout_workspace or args.base_dir
+    os.makedirs(workspace_root, exist_ok=True)
+
+    scores = {}
+    for slug in ctx.unique_slugs:
+        row = ctx.data.first(slug)
+        score = row.get('suspiciousness') or row.get('score')
+        if score:
+            scores[slug] = float(score)
+    index = {slug: i for i, slug in enumerate(ctx.unique_slugs)}
+    bugs = group_locations(ctx.unique_slugs, args.fanout, scores)
+    print(f"[INFO] Fan-out over {len(bugs)} bugs, top {args.fanout} locations each")
+
+    with ThreadPoolExecutor(max_workers=args.fanout) as executor:
+        for bug, locations in tqdm(bugs):
+            if state.done(bug):
+                continue
+            start_time = time.time()
+            fanout = BugFanout(bug, locations, args.fanout_budget or args.width_try)
+            searches = []
+            for slug in locations:
+                search = ctx.new_search(index[slug], slug, checkout=bug)
+                ctx.lease_workspace(search)
+                if search.base_dir == args.base_dir:
+                    try:
+                        prepare_workspace(args.base_dir, bug, slug, workspace_root)
                     except Exception as e:
-                        print(f"Error processing ID {i}, try {j}: {str(e)}")
-                        import traceback
-                        traceback.print_exc()
-                        save_checkpoint(checkpoint_file, i)
+                        print(f"[ERROR] Could not prepare a workspace for {slug}: {str(e)}")
+                        ctx.release_workspace(search)
                         continue
+                    search.use_workspace(workspace_root)
+                search.cancelled = fanout.cancelled
+                searches.append(search)
 
-            finally:
-                print(f"[INFO] Restoring repo for slug {slug} after processing (ID {i})")
+            futures = [executor.submit(repair_location, ctx, fanout, search) for search in searches]
+            for future in futures:
                 try:
-                    success = restore_file(slug, base_dir=args.base_dir)
-                    if success:
-                        print(f"[INFO] Successfully restored repo for slug {slug}")
-                    else:
-                        print(f"[WARNING] Failed to restore repo for slug {slug}")
-                except Exception as restore_error:
-                    print(f"[ERROR] Exception while restoring repo for slug {slug}: {restore_error}")
+                    future.result()
+                except Exception as e:
+                    print(f"[ERROR] Fan-out repair of {bug} failed: {str(e)}")
+                    traceback.print_exc()
+            state.finish(fanout, time.time() - start_time)
+            print(f"[INFO] {bug}: {'repaired at ' + fanout.repaired_by if fanout.repaired_by else 'not repaired'}, "
+                  f"{fanout.widths_used} width attempts")
+
+    print(f"[FANOUT] {state.summary()}")
+    ctx.print_summary()
+
+
+def coordinate(args):
+    """
+    Queue every slug of the data file in the campaign queue, then report progress until all are done, or until no
+    worker has leased, heartbeaten or finished a slug for --queue_stall_timeout seconds
+    """
+    queue = open_queue(args.queue, args.lease_seconds, args.queue_max_attempts)
+    slugs = BugDataset(args.data_path).slugs
+    new = queue.enqueue(list(enumerate(slugs)))
+    print(f"[QUEUE] {new} of {len(slugs)} slugs added to {args.queue}")
+    stall_timeout = args.queue_stall_timeout or 2 * args.lease_seconds
+    start_time = time.time()
+
+    while True:
+        counts = queue.counts()
+        print(f"[QUEUE] {counts}")
+        if counts['pending'] == 0 and counts['leased'] == 0:
+            break
+        idle = time.time() - max(queue.last_activity() or 0, start_time)
+        if idle > stall_timeout:
+            print(f"[WARNING] No worker activity for {idle:.0f}s with {counts['pending']} slugs pending and "
+                  f"{counts['leased']} leased, writing the results collected so far")
+            break
+        time.sleep(args.queue_poll)
+
+    results = queue.results()
+    campaign_path = os.path.splitext(args.eval_path)[0] + '_campaign.csv'
+    pd.DataFrame(results, columns=['ID', 'slug', 'reward', 'submission_result', 'width_attempt', 'iteration',
+                                   'worker']).to_csv(campaign_path, index=False, encoding='utf-8')
+    repaired = len({result['slug'] for result in results if result['reward']})
+    print(f"[QUEUE] Campaign finished: {repaired} slugs repaired, {len(results)} attempts written to {campaign_path}")
+
+
+def work(args):
+    """Lease slugs from the campaign queue and repair them until the queue is drained"""
+    queue = open_queue(args.queue, args.lease_seconds, args.queue_max_attempts)
+    ctx = RepairContext(args, use_checkpoint=False)
+    ctx.work_queue = queue
+    ctx.worker_id = args.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    print(f"[QUEUE] Worker {ctx.worker_id} on {args.queue}")
+
+    while True:
+        item = queue.lease(ctx.worker_id)
+        if item is None:
+            counts = queue.counts()
+            if counts['pending'] == 0 and counts['leased'] == 0:
+                break
+            # Leases of other workers may still expire and come back
+            time.sleep(args.queue_poll)
+            continue
+
+        i, slug = item
+        print(f"[QUEUE] Leased {slug} (ID {i})")
+        search = ctx.new_search(i, slug)
+        ctx.lease_workspace(search)
+        try:
+            with LeaseKeeper(queue, ctx.worker_id, slug) as keeper:
+                search.cancelled = keeper.lost
+                with span("repair_slug", slug=slug, worker=ctx.worker_id):
+                    repair_slug(ctx, search, args.width_try, args.deep_try)
+            if not keeper.lost.is_set():
+                queue.complete(ctx.worker_id, slug, {'repaired': search.repair_success,
+                                                     'attempts': len(search.attempts)})
+        except Exception as e:
+            print(f"[ERROR] Repair of {slug} failed: {str(e)}")
+            traceback.print_exc()
+            queue.release(ctx.worker_id, slug, str(e))
+        finally:
+            ctx.release_workspace(search)
+        ctx.prompt_builder.forget(slug)
+
+    print(f"[QUEUE] Worker {ctx.worker_id} finished, queue: {queue.counts()}")
+    ctx.print_summary()
 
 
 if __name__ == '__main__':
@@ -500,6 +783,8 @@ if __name__ == '__main__':
     parser.add_argument('--api_key', default="sk-xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx", type=str,
                         help="API key for LLM")
     parser.add_argument('--remote_model', default="gpt-4o-2024-11-20", type=str, help="Remote LLM model name")
+    parser.add_argument('--base_url', default="https://api.openai.com/v1", type=str,
+                        help="OpenAI-compatible API endpoint, e.g. the offline replay server")
     parser.add_argument('--data_path',
                         default="./data/test_data/Defects4j_v1.2_single_function/Defects4J_v1.2_single_function.csv",
                         type=str, help="Path to Defects4J code data")
@@ -528,11 +813,115 @@ if __name__ == '__main__':
     parser.add_argument('--width_try', default=7, type=int, help="Maximum width attempts")
     parser.add_argument('--deep_try', default=5, type=int, help="Maximum deep attempts")
     parser.add_argument('--temperature', default=1.0, type=float, help="LLM temperature for generation")
+    parser.add_argument('--trace_delta', action='store_true',
+                        help="In deep iterations, send only the runtime events that changed since the previous iteration")
+    parser.add_argument('--collect_iteration_traces', action='store_true',
+                        help="Trace the patched checkout after a failing attempt for the next deep iteration "
+                             "(swaps in ant_debug, so --major_root must not be shared with other processes, "
+                             "and it cannot be combined with --fanout)")
+    parser.add_argument('--bytetrace_jar', default=BYTETRACE_JAR, type=str,
+                        help="ByteTrace.jar used by ant_debug; trace options it predates are not passed on")
+    parser.add_argument('--trace_delta_context', default=1, type=int,
+                        help="Number of unchanged trace events shown before each diverging event")
+    parser.add_argument('--prefix_stable_prompt', action='store_true',
+                        help="Keep few-shot examples and the original bug report as a fixed prompt prefix and send "
+                             "previous attempts as separate messages, so provider prompt caching can reuse the prefix")
+    parser.add_argument('--history_keep_last', default=None, type=int,
+                        help="Keep only the last K attempts verbatim in the prompt, older ones are summarized as diffs")
+    parser.add_argument('--history_token_budget', default=0, type=int,
+                        help="Hard token budget for each attempt history section of the prompt (0 = unlimited)")
+    parser.add_argument('--plateau_patience', default=0, type=int,
+                        help="Stop a deep chain when its failing tests have not shrunk for N iterations (0 = disabled)")
+    parser.add_argument('--stop_on_regression', action='store_true',
+                        help="Stop a deep chain when a test fails that the original bug did not break")
+    parser.add_argument('--scheduler', action='store_true',
+                        help="Distribute width/deep attempts across bugs in rounds under a global budget")
+    parser.add_argument('--token_budget', default=0, type=int,
+                        help="Global token budget of the scheduler (0 = unlimited)")
+    parser.add_argument('--time_budget', default=0, type=float,
+                        help="Global time budget of the scheduler in hours (0 = unlimited)")
+    parser.add_argument('--scheduler_min_deep', default=2, type=int,
+                        help="Deep attempts granted to bugs that have not shown progress yet")
+    parser.add_argument('--scheduler_cutoff', default=2, type=int,
+                        help="Cut off a bug after this many consecutive chains that failed to compile or locate")
+    parser.add_argument('--rpm', default=0, type=int, help="Requests-per-minute limit shared by all workers (0 = none)")
+    parser.add_argument('--tpm', default=0, type=int, help="Tokens-per-minute limit shared by all workers (0 = none)")
+    parser.add_argument('--rate_limit_state', default="./result/rate_limiter_state.json", type=str,
+                        help="State file of the shared rate limiter; workers using the same file share the limits")
+    parser.add_argument('--stream', action='store_true',
+                        help="Stream completions and stop generation as soon as the fixed methods are complete")
+    parser.add_argument('--span_log', default=None, type=str,
+                        help="Write per-stage timing spans to this JSONL file (summarize with `python timing.py`)")
+    parser.add_argument('--cascade', default=None, type=str,
+                        help="Model cascade 'model:width:deep[:input_price:output_price],...' (cheapest first, "
+                             "prices in USD per 1M tokens); overrides --width_try/--deep_try")
+    parser.add_argument('--fanout', default=0, type=int,
+                        help="Repair the top-k SBFL locations of each bug concurrently, each in its own workspace, "
+                             "and cancel the others once one yields a plausible patch (0 = disabled)")
+    parser.add_argument('--fanout_budget', default=0, type=int,
+                        help="Width attempts shared by the locations of one bug (0 = --width_try)")
+    parser.add_argument('--fanout_workspace', default=None, type=str,
+                        help="Directory for the per-location workspaces (default: --base_dir)")
+    parser.add_argument('--ram_workspace', default=None, type=str,
+                        help="Validate in copies of the checkouts on this RAM-backed directory, e.g. /dev/shm/dynafix")
+    parser.add_argument('--ram_workspace_capacity', default=0, type=float,
+                        help="GB of RAM workspaces kept cached, least recently used evicted first "
+                             "(0 = 80%% of the free space)")
+    parser.add_argument('--queue', default=None, type=str,
+                        help="Campaign queue shared by several nodes: a SQLite file on a shared filesystem or "
+                             "redis://host:port/db[#campaign]")
+    parser.add_argument('--queue_role', default='worker', choices=['worker', 'coordinator'],
+                        help="A coordinator fills the queue and collects the results, workers repair leased slugs")
+    parser.add_argument('--worker_id', default=None, type=str, help="Worker name in the queue (default: host-pid)")
+    parser.add_argument('--lease_seconds', default=600, type=int,
+                        help="Lease time of a slug, extended by heartbeats; an expired lease is requeued")
+    parser.add_argument('--queue_max_attempts', default=3, type=int,
+                        help="Leases of a slug lost or released before it is marked failed")
+    parser.add_argument('--queue_poll', default=30, type=float, help="Seconds between queue polls when idle")
+    parser.add_argument('--queue_stall_timeout', default=0, type=float,
+                        help="Seconds without any worker activity after which the coordinator stops waiting "
+                             "(0 = twice --lease_seconds)")
+    parser.add_argument('--admission', action='store_true',
+                        help="Start a validation's tests only when the host has the memory and CPU for its JVMs")
+    parser.add_argument('--max_jobs', default=0, type=int,
+                        help="With --admission, most validations running at once (0 = number of CPUs)")
+    parser.add_argument('--memory_reserve', default=0.1, type=float,
+                        help="With --admission, fraction of the host memory never given to validations")
+    parser.add_argument('--jvm_peak_default', default=1.5, type=float,
+                        help="With --admission, expected peak GB of a project's JVMs until one has been measured")
+    parser.add_argument('--max_load', default=1.5, type=float,
+                        help="With --admission, 1-minute load average per CPU above which no validation starts")
+    parser.add_argument('--admission_state', default=os.path.expanduser("~/.cache/dynafix/jvm_peaks.json"),
+                        type=str, help="File keeping the learned peak memory of each project's JVMs across runs")
     parser.add_argument('--early_stop', default=True, type=bool, help="Stop early if repair is successful")
     args = parser.parse_args()
+    if args.collect_iteration_traces and args.fanout:
+        # The swapped ant would instrument the validations of the sibling threads
+        parser.error("--collect_iteration_traces cannot be combined with --fanout")
+
+    args.cascade_tiers = parse_cascade(args.cascade) if args.cascade else None
+    if args.cascade_tiers:
+        args.width_try = sum(tier.width for tier in args.cascade_tiers)
+        args.deep_try = max(tier.deep for tier in args.cascade_tiers)
 
     remote_mode_alias = args.remote_model.split('/')[-1]
     args.result_path = f"{args.result_path}_{remote_mode_alias}_{args.mode}_{args.deep_try}_deep_try_{args.width_try}_width_try.csv"
     args.eval_path = f"{args.eval_path}_{remote_mode_alias}_{args.mode}_{args.deep_try}_deep_try_{args.width_try}_width_try.csv"
 
-    debug(args)
\ No newline at end of file
+    configure_spans(args.span_log)
+    if args.admission:
+        os.makedirs(os.path.dirname(os.path.abspath(args.admission_state)), exist_ok=True)
+        configure_admission(args.admission_state, max_jobs=args.max_jobs, default_peak=args.jvm_peak_default * GB,
+                            memory_reserve=args.memory_reserve, max_load=args.max_load)
+    if args.queue and args.queue_role == 'coordinator':
+        coordinate(args)
+    elif args.queue:
+        work(args)
+    elif args.fanout:
+        fanout_debug(args)
+    elif args.scheduler:
+        scheduled_debug(args)
+    else:
+        debug(args)
+    if args.admission:
+        print(f"[INFO] Admission: {admission_summary()}")
@@ -0,0 +1,180 @@
+"""
+Admission control for the jobs that start JVMs (traced test runs, patch validations).
+
+    with admit("Closure", checkout_dir):
+        project.run_test(...)
+
+A job is admitted only when the memory it is expected to need fits in what the host has available, after what
+the already running jobs are still expected to grow by, and the load average leaves room for it. The expected
+need of a project is learned from the peak RSS of the JVMs running in its checkout, sampled with psutil, and kept
+in a state file for later runs. Nothing is limited until configure() is called; until then admit() returns a
+shared no-op context.
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+import psutil
+
+_NO_ADMISSION = nullcontext()
+_controller = None
+
+GB = 1024 ** 3
+
+
+class AdmissionController:
+    def __init__(self, state_path=None, max_jobs=0, default_peak=1.5 * GB, memory_reserve=0.1, max_load=1.5,
+                 poll=2.0, exit_wait=10.0):
+        """
+        max_jobs: hard ceiling on concurrent jobs (0 = number of CPUs)
+        default_peak: expected RSS of a project not seen yet, in bytes
+        memory_reserve: fraction of the total memory never handed out
+        max_load: 1-minute load average per CPU above which no new job starts
+        exit_wait: seconds a finished job waits for the JVMs left in its checkout before its slot is freed
+        """
+        self.state_path = state_path
+        self.cpus = psutil.cpu_count() or 1
+        self.max_jobs = max_jobs or self.cpus
+        self.default_peak = default_peak
+        self.reserve = psutil.virtual_memory().total * memory_reserve
+        self.max_load = max_load
+        self.poll = poll
+        self.exit_wait = exit_wait
+        self.peaks = {}
+        self._jobs = {}
+        self._ids = 0
+        self._condition = threading.Condition()
+        self.stats = {'admitted': 0, 'waited': 0, 'wait_seconds': 0.0, 'max_running': 0}
+        if state_path and os.path.exists(state_path):
+            with open(state_path, 'r', encoding='utf-8') as f:
+                self.peaks = json.load(f)
+        self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+        self._sampler.start()
+
+    def expected_peak(self, key):
+        return self.peaks.get(key, self.default_peak)
+
+    def _headroom(self):
+        """Bytes the running jobs may still grow by, from their current JVM RSS to their expected peak"""
+        return sum(max(job['expected'] - job['rss'], 0) for job in self._jobs.values())
+
+    def _fits(self, key):
+        if not self._jobs:
+            # A job always runs alone, even when the host is already busy
+            return True
+        if len(self._jobs) >= self.max_jobs:
+            return False
+        available = psutil.virtual_memory().available - self._headroom() - self.reserve
+        if available < self.expected_peak(key):
+            return False
+        return psutil.getloadavg()[0] / self.cpus < self.max_load
+
+    @contextmanager
+    def admit(self, key, work_dir):
+        work_dir = os.path.abspath(work_dir)
+        start = time.time()
+        waited = False
+        with self._condition:
+            while not self._fits(key):
+                waited = True
+                self._condition.wait(self.poll)
+            self._ids += 1
+            job_id = self._ids
+            self._jobs[job_id] = {'key': key, 'work_dir': work_dir, 'expected': self.expected_peak(key),
+                                  'rss': 0, 'peak': 0}
+            self.stats['admitted'] += 1
+            self.stats['max_running'] = max(self.stats['max_running'], len(self._jobs))
+            if waited:
+                self.stats['waited'] += 1
+                self.stats['wait_seconds'] += time.time() - start
+        try:
+            yield
+        finally:
+            # run_captured reaps the process group of a test run, but a JVM started outside of it may linger
+            self._wait_for_exit(work_dir)
+            with self._condition:
+                job = self._jobs.pop(job_id)
+                if job['peak']:
+                    self._learn(key, job['peak'])
+                self._condition.notify_all()
+
+    def _learn(self, key, peak):
+        old = self.peaks.get(key)
+        # Follow increases at once, decreases slowly
+        self.peaks[key] = peak if old is None else max(peak, int(0.7 * old + 0.3 * peak))
+        if self.state_path:
+            tmp_path = self.state_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.peaks, f, indent=2)
+            os.replace(tmp_path, self.state_path)
+
+    def _jvm_rss_in(self, work_dir, rss_by_dir):
+        prefix = work_dir + os.sep
+        return sum(rss for cwd, rss in rss_by_dir.items() if cwd == work_dir or cwd.startswith(prefix))
+
+    def _wait_for_exit(self, work_dir):
+        deadline = time.time() + self.exit_wait
+        while True:
+            try:
+                if not self._jvm_rss_in(work_dir, self._jvm_rss_by_dir()):
+                    return
+            except Exception as e:
+                print(f"[WARNING] Could not sample JVM memory: {str(e)}")
+                return
+            if time.time() >= deadline:
+                print(f"[WARNING] JVMs still running in {work_dir} after {self.exit_wait:.0f}s, releasing its slot")
+                return
+            time.sleep(0.5)
+
+    def _jvm_rss_by_dir(self):
+        """Summed RSS of the running JVMs per working directory"""
+        rss = {}
+        for process in psutil.process_iter(['name', 'cwd', 'memory_info']):
+            info = process.info
+            if not info['name'] or 'java' not in info['name'] or not info['cwd'] or not info['memory_info']:
+                continue
+            rss[info['cwd']] = rss.get(info['cwd'], 0) + info['memory_info'].rss
+        return rss
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.poll)
+            with self._condition:
+                if not self._jobs:
+                    continue
+            try:
+                rss_by_dir = self._jvm_rss_by_dir()
+            except Exception as e:
+                print(f"[WARNING] Could not sample JVM memory: {str(e)}")
+                continue
+            with self._condition:
+                for job in self._jobs.values():
+                    job['rss'] = self._jvm_rss_in(job['work_dir'], rss_by_dir)
+                    job['peak'] = max(job['peak'], job['rss'])
+                # Memory may have been freed by the jobs or by other processes
+                self._condition.notify_all()
+
+    def summary(self):
+        learned = ", ".join(f"{key} {peak / GB:.2f} GB" for key, peak in sorted(self.peaks.items()))
+        return (f"{self.stats['admitted']} jobs admitted, {self.stats['waited']} waited "
+                f"{self.stats['wait_seconds']:.0f}s in total, at most {self.stats['max_running']} at once; "
+                f"learned peaks: {learned or 'none'}")
+
+
+def configure(state_path=None, **kwargs):
+    """Start limiting the jobs passed to admit(); returns the controller"""
+    global _controller
+    _controller = AdmissionController(state_path, **kwargs)
+    return _controller
+
+
+def admit(key, work_dir):
+    if _controller is None:
+        return _NO_ADMISSION
+    return _controller.admit(key, work_dir)
+
+
+def summary():
+    return _controller.summary() if _controller else None
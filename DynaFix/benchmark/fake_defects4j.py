@@ -0,0 +1,117 @@
+"""
+Stand-in for the `defects4j` command on the benchmark fixtures. Supports `compile` and `test [-t test] [-r]`,
+printing the same progress lines and failing_tests/all_tests files as Defects4J.
+
+A fixture fails to compile when a source file contains /*BENCH:COMPILE_ERROR*/ and passes all tests when it
+contains /*BENCH:FIXED*/; otherwise the trigger tests fail. Delays (seconds) come from FAKE_D4J_COMPILE_DELAY
+and FAKE_D4J_TEST_DELAY.
+"""
+import os
+import sys
+import time
+import argparse
+
+COMPILE_OK = "Running ant (compile)....................................................... OK"
+COMPILE_TESTS_OK = "Running ant (compile.tests)................................................ OK"
+COMPILE_TESTS_FAIL = "Running ant (compile.tests)................................................ FAIL"
+RUN_TESTS_OK = "Running ant (run.dev.tests)................................................ OK"
+
+
+def read_properties(work_dir):
+    properties = {}
+    with open(os.path.join(work_dir, "defects4j.build.properties"), "r", encoding="utf-8") as f:
+        for line in f:
+            if "=" in line and not line.startswith("#"):
+                key, value = line.strip().split("=", 1)
+                properties[key] = value
+    return properties
+
+
+def source_markers(work_dir, src_dir):
+    """Return (compile_error, fixed) for the sources under src_dir"""
+    compile_error, fixed = False, False
+    for root, _, files in os.walk(os.path.join(work_dir, src_dir)):
+        for file in files:
+            if not file.endswith(".java"):
+                continue
+            with open(os.path.join(root, file), "r", encoding="utf-8", errors="replace") as f:
+                content = f.read()
+            compile_error = compile_error or "/*BENCH:COMPILE_ERROR*/" in content
+            fixed = fixed or "/*BENCH:FIXED*/" in content
+    return compile_error, fixed
+
+
+def delay(name):
+    seconds = float(os.environ.get(name, "0") or 0)
+    if seconds > 0:
+        time.sleep(seconds)
+
+
+def compile_command(work_dir, properties):
+    delay("FAKE_D4J_COMPILE_DELAY")
+    compile_error, _ = source_markers(work_dir, properties["d4j.dir.src.classes"])
+    if compile_error:
+        print("Running ant (compile)....................................................... FAIL")
+        print("    [javac] error: ';' expected")
+        return 1
+    print(COMPILE_OK)
+    print(COMPILE_TESTS_OK)
+    return 0
+
+
+def test_command(work_dir, properties, single_test=None):
+    delay("FAKE_D4J_COMPILE_DELAY")
+    compile_error, fixed = source_markers(work_dir, properties["d4j.dir.src.classes"])
+    print(COMPILE_OK)
+    if compile_error:
+        print(COMPILE_TESTS_FAIL)
+        print("    [javac] error: ';' expected")
+        return 1
+    print(COMPILE_TESTS_OK)
+
+    delay("FAKE_D4J_TEST_DELAY")
+    triggers = [t for t in properties.get("d4j.tests.trigger", "").split(",") if t]
+    all_tests = triggers + [f"{properties['d4j.tests.all']}::testHelper"]
+    if single_test:
+        all_tests = [t for t in all_tests if t == single_test or t.startswith(single_test + "::")]
+    failing = [] if fixed else [t for t in all_tests if t in triggers]
+
+    with open(os.path.join(work_dir, "all_tests"), "w", encoding="utf-8") as f:
+        for name in all_tests:
+            test_class, method = name.split("::", 1)
+            f.write(f"{method}({test_class})\n")
+    with open(os.path.join(work_dir, "failing_tests"), "w", encoding="utf-8") as f:
+        for name in failing:
+            f.write(f"--- {name}\njunit.framework.AssertionFailedError: expected:<100> but was:<0>\n"
+                    f"\tat {name.replace('::', '.')}(Test.java:12)\n")
+
+    print(RUN_TESTS_OK)
+    print(f"Failing tests: {len(failing)}")
+    for name in failing:
+        print(f"  - {name}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="defects4j")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compile_parser = subparsers.add_parser("compile")
+    compile_parser.add_argument("-w", dest="work_dir", default=".")
+    test_parser = subparsers.add_parser("test")
+    test_parser.add_argument("-w", dest="work_dir", default=".")
+    test_parser.add_argument("-t", dest="single_test", default=None)
+    test_parser.add_argument("-r", dest="relevant", action="store_true")
+    args = parser.parse_args()
+
+    work_dir = os.path.abspath(args.work_dir)
+    if not os.path.exists(os.path.join(work_dir, "defects4j.build.properties")):
+        print(f"Error: {work_dir} is not a valid working directory!", file=sys.stderr)
+        return 1
+    properties = read_properties(work_dir)
+    if args.command == "compile":
+        return compile_command(work_dir, properties)
+    return test_command(work_dir, properties, args.single_test)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
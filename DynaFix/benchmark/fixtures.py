@@ -0,0 +1,143 @@
+"""
+Synthetic Defects4J-like bugs for the benchmark: one small git repository per bug with a
+defects4j.build.properties file, a Java class of configurable size, and matching trace logs.
+"""
+import os
+import json
+import random
+import subprocess
+
+PACKAGE = "org.bench"
+SOURCE_DIR = "src/main/java"
+TEST_DIR = "src/test/java"
+BUGGY_METHOD = """    public int clamp(int value, int low, int high) {
+        if (value < low) {
+            return low;
+        }
+        if (value > high) {
+            return low;
+        }
+        return value;
+    }"""
+FIXED_METHOD = """    public int clamp(int value, int low, int high) {
+        /*BENCH:FIXED*/
+        if (value < low) {
+            return low;
+        }
+        if (value > high) {
+            return high;
+        }
+        return value;
+    }"""
+COMPILE_ERROR_METHOD = """    public int clamp(int value, int low, int high) {
+        /*BENCH:COMPILE_ERROR*/
+        return value < low ? low : (value > high ? high : value)
+    }"""
+
+
+def _filler_method(index):
+    return f"""    /**
+     * Helper number {index}.
+     */
+    public int helper{index}(int value) {{
+        int result = value;
+        for (int i = 0; i < {index % 7 + 1}; i++) {{
+            result = result * 31 + i;
+        }}
+        return result;
+    }}"""
+
+
+def java_source(class_name, methods):
+    """Class with `methods` filler methods and the buggy clamp() method in the middle"""
+    fillers = [_filler_method(i) for i in range(methods)]
+    body = fillers[:methods // 2] + [BUGGY_METHOD] + fillers[methods // 2:]
+    return f"package {PACKAGE};\n\npublic class {class_name} {{\n\n" + "\n\n".join(body) + "\n}\n"
+
+
+def _git(repo_dir, *command):
+    subprocess.run(["git", *command], cwd=repo_dir, check=True, capture_output=True, text=True)
+
+
+def create_fixture(root, pid, bid, methods=100, trigger_tests=2):
+    """
+    Create {root}/{pid}_{bid}_buggy and return the data CSV row of its bug (slug, class_path, buggy_code).
+    """
+    slug = f"{pid}_{bid}"
+    repo_dir = os.path.join(root, f"{slug}_buggy")
+    class_name = f"{pid}Range{bid}"
+    package_dir = PACKAGE.replace(".", "/")
+    class_path = os.path.join(repo_dir, SOURCE_DIR, package_dir, f"{class_name}.java")
+    test_path = os.path.join(repo_dir, TEST_DIR, package_dir, f"{class_name}Test.java")
+    os.makedirs(os.path.dirname(class_path), exist_ok=True)
+    os.makedirs(os.path.dirname(test_path), exist_ok=True)
+
+    with open(class_path, "w", encoding="utf-8") as f:
+        f.write(java_source(class_name, methods))
+
+    tests = [f"testClamp{i}" for i in range(trigger_tests)] + ["testHelper"]
+    with open(test_path, "w", encoding="utf-8") as f:
+        f.write(f"package {PACKAGE};\n\npublic class {class_name}Test {{\n" +
+                "".join(f"    public void {name}() {{}}\n" for name in tests) + "}\n")
+
+    test_class = f"{PACKAGE}.{class_name}Test"
+    with open(os.path.join(repo_dir, "defects4j.build.properties"), "w", encoding="utf-8") as f:
+        f.write(f"#File automatically generated by the benchmark\n"
+                f"d4j.bug.id={bid}\n"
+                f"d4j.project.id={pid}\n"
+                f"d4j.classes.modified={PACKAGE}.{class_name}\n"
+                f"d4j.classes.relevant={PACKAGE}.{class_name}\n"
+                f"d4j.dir.src.classes={SOURCE_DIR}\n"
+                f"d4j.dir.src.tests={TEST_DIR}\n"
+                f"d4j.tests.all={test_class}\n"
+                f"d4j.tests.trigger=" + ",".join(f"{test_class}::{name}" for name in tests[:-1]) + "\n")
+
+    if not os.path.isdir(os.path.join(repo_dir, ".git")):
+        _git(repo_dir, "init", "-q")
+        _git(repo_dir, "add", "-A")
+        _git(repo_dir, "-c", "user.name=bench", "-c", "user.email=bench@localhost", "commit", "-q", "-m", "buggy")
+
+    return {"slug": slug, "class_path": class_path, "buggy_code": BUGGY_METHOD}
+
+
+def trace_lines(class_name, events, seed=0, shift=0):
+    """
+    Synthetic ByteTrace log lines of clamp(): local variables, control flow and method calls, in the format
+    DetectMonitor writes.
+    A different shift changes some variable values, like the next iteration of a deep chain would.
+    """
+    rng = random.Random(seed)
+    owner = f"{PACKAGE}.{class_name}"
+    lines = []
+    for n in range(events):
+        line_number = 10 + n % 9
+        kind = n % 3
+        if kind == 0:
+            value = n + (shift if n % 5 == 0 else 0)
+            payload = json.dumps({"value": value, "low": 0, "high": rng.randint(1, 100)})
+            lines.append(f"{owner}:clamp:{line_number}->[Local Variables] {payload}")
+        elif kind == 1:
+            lines.append(f"{owner}:clamp:{line_number}->[Control Flow] Branch Info: Line: {line_number}, "
+                         f"Condition: value > high, Executed: {n % 2 == 0}")
+        else:
+            lines.append(f"{owner}:clamp:{line_number}->[Method Call] Call Stack: {owner}.clamp:{line_number} "
+                         f"-> {owner}.helper{n % 50}")
+    return lines
+
+
+def write_debug_info(path, class_name, events, tests=2, seed=0, shift=0):
+    """Debug info file in the layout ExtractDebugInfo writes for one bug"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Exception: java.lang.AssertionError: expected:<100> but was:<0>\n\n")
+        for t in range(tests):
+            f.write(f"=== Debug Info for Test: {PACKAGE}.{class_name}Test::testClamp{t} ===\n")
+            f.write("\n".join(trace_lines(class_name, events // tests, seed + t, shift)) + "\n\n")
+    return path
+
+
+def fixed_response(methods=1, fenced=True):
+    """An LLM response in the format the prompts ask for"""
+    body = "\n\n".join(f"// Fixed Method {i + 1}\n{FIXED_METHOD}" for i in range(methods))
+    text = "The second branch returns the wrong bound.\n\n"
+    return text + (f"```java\n{body}\n```\n" if fenced else body + "\n")
@@ -0,0 +1,245 @@
+"""
+Time the stages of a repair attempt on synthetic bugs with a fake `defects4j`, no API calls and no real
+Defects4J checkout needed:
+
+    python -m benchmark.run_benchmark --methods 50 500 2000 --bugs 1 5 --output_dir result/benchmark
+    python -m benchmark.run_benchmark --baseline result/benchmark/baseline.json --threshold 1.25
+
+Writes benchmark.json (per-stage statistics) and benchmark_samples.csv (every measurement). With --baseline,
+stages whose median got slower than threshold x the baseline are reported and the exit code is 1.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+from types import SimpleNamespace
+
+from benchmark.fixtures import create_fixture, write_debug_info, fixed_response, FIXED_METHOD, \
+    COMPILE_ERROR_METHOD, BUGGY_METHOD
+from LLM.prompt_builder import PromptBuilder, read_debug_info, read_trace_text
+from DebugInfoFetch.TraceDiff import render_trace_delta
+from DebugInfoFetch.ExtractDebugInfo import extract_method_calls_with_source
+from validator.defects4j_validator import replace_file, restore_file, run_JUnit
+from LLM.patch_extractor import extract_fixed_methods
+
+STAT_COLUMNS = ["methods", "bugs", "stage", "count", "mean", "p50", "p95", "max", "total"]
+
+
+def install_fake_defects4j(work_dir):
+    """Put a `defects4j` wrapper around fake_defects4j.py first on PATH"""
+    bin_dir = os.path.join(work_dir, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    wrapper = os.path.join(bin_dir, "defects4j")
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_defects4j.py")
+    with open(wrapper, "w", encoding="utf-8") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+    os.chmod(wrapper, 0o755)
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = []
+
+    def time(self, config, stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.samples.append({"methods": config[0], "bugs": config[1], "stage": stage,
+                             "seconds": time.perf_counter() - start})
+        return result
+
+    def statistics(self):
+        grouped = {}
+        for sample in self.samples:
+            grouped.setdefault((sample["methods"], sample["bugs"], sample["stage"]), []).append(sample["seconds"])
+        rows = []
+        for (methods, bugs, stage), values in grouped.items():
+            values = sorted(values)
+            rows.append({
+                "methods": methods,
+                "bugs": bugs,
+                "stage": stage,
+                "count": len(values),
+                "mean": round(sum(values) / len(values), 6),
+                "p50": round(values[len(values) // 2], 6),
+                "p95": round(values[min(int(len(values) * 0.95), len(values) - 1)], 6),
+                "max": round(values[-1], 6),
+                "total": round(sum(values), 6),
+            })
+        return rows
+
+
+def check(checks, name, ok, detail=""):
+    checks.append({"check": name, "ok": bool(ok), "detail": detail})
+    if not ok:
+        print(f"[WARNING] Benchmark check failed: {name} {detail}")
+
+
+def run_bug(timer, config, builder, args, sample, repo_root, checks):
+    """One breadth attempt and one deep attempt of a bug, stage by stage"""
+    slug = sample["slug"]
+    pid, bid = slug.rsplit("_", 1)
+    class_name = os.path.splitext(os.path.basename(sample["class_path"]))[0]
+    samples = [sample]
+    test_config = {"time_out": args.test_timeout}
+
+    debug_file = write_debug_info(builder.debug_file_path(slug, 1, 0, pid, bid), class_name, args.trace_events)
+    next_debug_file = write_debug_info(builder.debug_file_path(slug, 1, 1, pid, bid), class_name,
+                                       args.trace_events, shift=3)
+    builder.forget(slug)
+
+    # Trace ingestion and method-call extraction, as done once per iteration; a stage that finds nothing in its
+    # fixture would time an empty path
+    debug_info = timer.time(config, "trace_read", read_debug_info, debug_file)
+    check(checks, f"{slug} trace_read", debug_info)
+    current_text, previous_text = read_trace_text(next_debug_file), read_trace_text(debug_file)
+    delta = timer.time(config, "trace_delta", render_trace_delta, current_text, previous_text)
+    check(checks, f"{slug} trace_delta", delta)
+    method_calls_file = builder.method_calls_file_path(slug, 1, 0, pid, bid)
+    timer.time(config, "method_call_extraction", extract_method_calls_with_source, debug_file, method_calls_file,
+               os.path.join(repo_root, f"{slug}_buggy"))
+    with open(method_calls_file, "r", encoding="utf-8") as f:
+        method_calls = json.load(f)
+    check(checks, f"{slug} method_call_extraction", method_calls and all(call["code"] for call in method_calls),
+          f"{len(method_calls)} methods")
+
+    # Prompt construction and response parsing
+    prompt, _ = timer.time(config, "build_prompt", builder.build, samples, 1, 0, pid, bid)
+    check(checks, f"{slug} build_prompt", prompt)
+    response = fixed_response()
+    fixed_codes = timer.time(config, "parse_response", extract_fixed_methods, response,
+                             [sample["buggy_code"] for sample in samples])
+    check(checks, f"{slug} parse_response", fixed_codes == [FIXED_METHOD.strip()])
+    history = [{"role": "assistant", "content": response}]
+    timer.time(config, "build_prompt_deep", builder.build, samples, 1, 1, pid, bid, history, "deep")
+
+    # Validation: buggy, fixed and non-compiling versions of the class
+    timer.time(config, "restore_file", restore_file, slug, repo_root)
+    reward, result = timer.time(config, "run_JUnit", run_JUnit, slug, test_config, repo_root)
+    check(checks, f"{slug} buggy run", not reward and result.startswith("Failing tests:") and result != "Failing tests: 0",
+          result)
+
+    timer.time(config, "replace_file", replace_file, sample["class_path"], [(BUGGY_METHOD, fixed_codes[0])])
+    reward, result = timer.time(config, "run_JUnit", run_JUnit, slug, test_config, repo_root)
+    check(checks, f"{slug} fixed run", reward and result == "Failing tests: 0", result)
+
+    timer.time(config, "restore_file", restore_file, slug, repo_root)
+    timer.time(config, "replace_file", replace_file, sample["class_path"], [(BUGGY_METHOD, COMPILE_ERROR_METHOD)])
+    # Timed apart: a failed compilation skips the test run that run_JUnit measures
+    reward, result = timer.time(config, "run_JUnit_compile_error", run_JUnit, slug, test_config, repo_root)
+    check(checks, f"{slug} compile error run", not reward and result == "Compile failed", result)
+    timer.time(config, "restore_file", restore_file, slug, repo_root)
+
+
+def run_config(timer, args, methods, bug_count, work_dir, checks):
+    config = (methods, bug_count)
+    config_dir = os.path.join(work_dir, f"methods{methods}_bugs{bug_count}")
+    repo_root = os.path.join(config_dir, "defects4j_buggy")
+    os.makedirs(repo_root, exist_ok=True)
+    builder_args = SimpleNamespace(mode="debuginfo", trace_delta=False, trace_delta_context=1,
+                                   debug_info_dir=os.path.join(config_dir, "DebugInfo"),
+                                   method_calls_dir=os.path.join(config_dir, "MethodCalls"),
+                                   dynamic_output_path=os.path.join(config_dir, "Dynamic"))
+    builder = PromptBuilder(builder_args)
+
+    bug_samples = [timer.time(config, "create_fixture", create_fixture, repo_root, "Bench", bid, methods)
+                   for bid in range(1, bug_count + 1)]
+    start = time.perf_counter()
+    for _ in range(args.repeats):
+        for sample in bug_samples:
+            run_bug(timer, config, builder, args, sample, repo_root, checks)
+    elapsed = time.perf_counter() - start
+    print(f"[INFO] methods={methods} bugs={bug_count}: {elapsed:.2f}s for {args.repeats} repeat(s)")
+    return {"methods": methods, "bugs": bug_count, "repeats": args.repeats, "seconds": round(elapsed, 6)}
+
+
+def compare_with_baseline(rows, baseline_path, threshold, min_delta):
+    """Return the stages whose median is more than threshold x the baseline median"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(row["methods"], row["bugs"], row["stage"]): row for row in json.load(f)["stages"]}
+    regressions = []
+    for row in rows:
+        old = baseline.get((row["methods"], row["bugs"], row["stage"]))
+        if old and row["p50"] > old["p50"] * threshold and row["p50"] - old["p50"] > min_delta:
+            regressions.append({"methods": row["methods"], "bugs": row["bugs"], "stage": row["stage"],
+                                "baseline_p50": old["p50"], "p50": row["p50"],
+                                "ratio": round(row["p50"] / old["p50"], 2) if old["p50"] else None})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the DynaFix pipeline stages on synthetic bugs")
+    parser.add_argument('--methods', nargs='+', default=[50, 500, 2000], type=int,
+                        help="Number of methods in each synthetic class (file size)")
+    parser.add_argument('--bugs', nargs='+', default=[1, 5], type=int, help="Number of synthetic bugs")
+    parser.add_argument('--repeats', default=3, type=int, help="Attempts per bug")
+    parser.add_argument('--trace_events', default=3000, type=int, help="Trace lines per debug info file")
+    parser.add_argument('--test_delay', default=0.0, type=float, help="Seconds the fake `defects4j test` runs")
+    parser.add_argument('--compile_delay', default=0.0, type=float, help="Seconds the fake compilation takes")
+    parser.add_argument('--test_timeout', default=1200, type=int)
+    parser.add_argument('--work_dir', default=None, type=str, help="Fixture directory (default: a temp dir)")
+    parser.add_argument('--keep_work_dir', action='store_true', help="Do not delete the fixtures afterwards")
+    parser.add_argument('--output_dir', default="./result/benchmark", type=str)
+    parser.add_argument('--baseline', default=None, type=str, help="benchmark.json of an earlier run to compare with")
+    parser.add_argument('--threshold', default=1.25, type=float, help="Allowed slowdown of a stage's median")
+    parser.add_argument('--min_delta', default=0.001, type=float,
+                        help="Ignore slowdowns smaller than this many seconds")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="dynafix_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    os.makedirs(args.output_dir, exist_ok=True)
+    install_fake_defects4j(work_dir)
+    os.environ["FAKE_D4J_TEST_DELAY"] = str(args.test_delay)
+    os.environ["FAKE_D4J_COMPILE_DELAY"] = str(args.compile_delay)
+
+    timer, checks, configs = StageTimer(), [], []
+    try:
+        for methods in args.methods:
+            for bug_count in args.bugs:
+                configs.append(run_config(timer, args, methods, bug_count, work_dir, checks))
+    finally:
+        if not args.keep_work_dir and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    rows = timer.statistics()
+    report = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "settings": {key: value for key, value in vars(args).items() if key not in ("baseline", "work_dir")},
+        "configs": configs,
+        "stages": rows,
+        "checks": checks,
+    }
+    exit_code = 0 if all(c["ok"] for c in checks) else 1
+    if args.baseline:
+        report["regressions"] = compare_with_baseline(rows, args.baseline, args.threshold, args.min_delta)
+        for regression in report["regressions"]:
+            print(f"[WARNING] Regression in {regression['stage']} (methods={regression['methods']}, "
+                  f"bugs={regression['bugs']}): p50 {regression['baseline_p50']}s -> {regression['p50']}s")
+        if report["regressions"]:
+            exit_code = 1
+
+    with open(os.path.join(args.output_dir, "benchmark.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    with open(os.path.join(args.output_dir, "benchmark_samples.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["methods", "bugs", "stage", "seconds"])
+        writer.writeheader()
+        writer.writerows(timer.samples)
+
+    print(f"{'methods':>8} {'bugs':>5} {'stage':<24} {'p50 (ms)':>10} {'p95 (ms)':>10}")
+    for row in sorted(rows, key=lambda r: (r["methods"], r["bugs"], r["stage"])):
+        print(f"{row['methods']:>8} {row['bugs']:>5} {row['stage']:<24} {row['p50'] * 1000:>10.2f} "
+              f"{row['p95'] * 1000:>10.2f}")
+    print(f"[INFO] Report written to {os.path.join(args.output_dir, 'benchmark.json')}")
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,26 +1,22 @@
 """
 DATA PROCESS SCRIPTS
 FOR DEFECTS4J V2.0
-"""
-import os
 
+Check out the buggy versions in parallel and compile each checkout once, so the first validation of a bug
+does not pay the full build. Progress is kept in a manifest: finished workspaces are skipped on the next run,
+failed ones are retried.
 
-def get_repos(root_dir, proj_list, id_list):
-    repos_dir = root_dir + 'defects4j_buggy/'
-    for i in range(len(proj_list)):
-        project = proj_list[i]
-        for j in id_list[i]:
-            unique_id = project + '_' + str(j)
-            try:
-                print("in processing: " + project + '_' + str(j))
-                cmd = 'defects4j checkout -p ' + project + ' -v ' + str(j) + 'b -w ' + repos_dir + unique_id + '_buggy'
-                os.system(cmd)
-                # print(cmd)
-            except (RuntimeError, TypeError, NameError, FileNotFoundError) as e:
-                print(e)
-
+    python checkout.py --workers 8
+    python checkout.py --projects Chart Lang --no_compile
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-root_dir = os.getcwd() + '/'
 proj_list = [
     'Chart',
     'Math',
@@ -59,10 +55,165 @@ id_range = [
     '2-16',
     '2-22',
 ]
-id_list = []
-for i in range(len(id_range)):
-    rangeStart = id_range[i].split('-')[0]
-    rangeEnd = id_range[i].split('-')[1]
-    id_list.append(range(int(rangeStart), int(rangeEnd) + 1))
 
-get_repos(root_dir, proj_list, id_list)
+DONE_STATUSES = ('compiled', 'checked_out')
+
+
+def bug_list(projects=None):
+    bugs = []
+    for project, ids in zip(proj_list, id_range):
+        if projects and project not in projects:
+            continue
+        range_start, range_end = ids.split('-')
+        bugs.extend((project, bid) for bid in range(int(range_start), int(range_end) + 1))
+    return bugs
+
+
+def load_manifest(manifest_path):
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(manifest_path, manifest):
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def _run(cmd, timeout):
+    """Run a defects4j command, return (ok, last lines of its output)"""
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return False, f"Timed out after {timeout}s"
+    except OSError as e:
+        return False, str(e)
+    tail = '\n'.join(result.stdout.strip().splitlines()[-10:])
+    return result.returncode == 0, tail
+
+
+def intact_checkout(work_dir):
+    """A complete Defects4J checkout: its build properties and a readable git HEAD"""
+    if not os.path.exists(os.path.join(work_dir, 'defects4j.build.properties')):
+        return False
+    result = subprocess.run(['git', 'rev-parse', '--verify', '-q', 'HEAD'], cwd=work_dir,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return result.returncode == 0
+
+
+def provision(project, bid, repos_dir, compile_workspace=True, checked_out=False, timeout=1800):
+    """Check out one bug (unless already checked out) and compile it; runs in a worker process"""
+    unique_id = f"{project}_{bid}"
+    work_dir = os.path.join(repos_dir, unique_id + '_buggy')
+    entry = {'project': project, 'bid': bid, 'work_dir': work_dir}
+    start = time.time()
+
+    if not checked_out:
+        # Intact checkouts were adopted by pending_bugs, what is left is an interrupted or corrupt checkout
+        if os.path.exists(work_dir):
+            shutil.rmtree(work_dir)
+        ok, output = _run(['defects4j', 'checkout', '-p', project, '-v', f'{bid}b', '-w', work_dir], timeout)
+        entry['checkout_seconds'] = round(time.time() - start, 1)
+        if not ok or not os.path.exists(os.path.join(work_dir, 'defects4j.build.properties')):
+            entry.update(status='checkout_failed', error=output)
+            return unique_id, entry
+
+    entry['status'] = 'checked_out'
+    if compile_workspace:
+        compile_start = time.time()
+        ok, output = _run(['defects4j', 'compile', '-w', work_dir], timeout)
+        entry['compile_seconds'] = round(time.time() - compile_start, 1)
+        if not ok:
+            entry.update(status='compile_failed', error=output)
+            return unique_id, entry
+        entry['status'] = 'compiled'
+    return unique_id, entry
+
+
+def pending_bugs(bugs, manifest, compile_workspace, repos_dir):
+    """
+    Return (project, bid, checked_out) for every bug that still needs work. An intact checkout without a manifest
+    entry, e.g. made before the manifest existed, is adopted and only compiled.
+    """
+    pending = []
+    for project, bid in bugs:
+        entry = manifest.get(f"{project}_{bid}")
+        if entry is None:
+            pending.append((project, bid, intact_checkout(os.path.join(repos_dir, f"{project}_{bid}_buggy"))))
+            continue
+        exists = os.path.exists(os.path.join(entry['work_dir'], 'defects4j.build.properties'))
+        if exists and (entry['status'] == 'compiled' or (entry['status'] == 'checked_out' and not compile_workspace)):
+            continue
+        checked_out = exists and entry['status'] in ('checked_out', 'compile_failed')
+        pending.append((project, bid, checked_out))
+    return pending
+
+
+def run_pass(pending, repos_dir, manifest, manifest_path, workers, compile_workspace, timeout, attempt):
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(provision, project, bid, repos_dir, compile_workspace, checked_out, timeout)
+                   for project, bid, checked_out in pending]
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                unique_id, entry = future.result()
+            except Exception as e:
+                print(f"[ERROR] Worker failed: {str(e)}")
+                failed += 1
+                continue
+            entry['attempts'] = manifest.get(unique_id, {}).get('attempts', 0) + 1
+            manifest[unique_id] = entry
+            save_manifest(manifest_path, manifest)
+            if entry['status'] in DONE_STATUSES:
+                print(f"[INFO] ({done}/{len(pending)}) {unique_id}: {entry['status']}")
+            else:
+                failed += 1
+                print(f"[WARNING] ({done}/{len(pending)}) {unique_id}: {entry['status']} (pass {attempt})\n"
+                      f"{entry.get('error', '')}")
+    return failed
+
+
+def get_repos(root_dir, projects=None, workers=4, compile_workspace=True, retries=1, timeout=1800,
+              manifest_path=None):
+    repos_dir = os.path.join(root_dir, 'defects4j_buggy')
+    os.makedirs(repos_dir, exist_ok=True)
+    manifest_path = manifest_path or os.path.join(repos_dir, 'checkout_manifest.json')
+    manifest = load_manifest(manifest_path)
+    bugs = bug_list(projects)
+
+    for attempt in range(1, retries + 2):
+        pending = pending_bugs(bugs, manifest, compile_workspace, repos_dir)
+        if not pending:
+            break
+        print(f"[INFO] Pass {attempt}: provisioning {len(pending)} of {len(bugs)} bugs with {workers} workers")
+        failed = run_pass(pending, repos_dir, manifest, manifest_path, workers, compile_workspace, timeout, attempt)
+        if not failed:
+            break
+
+    selected = set(bugs)
+    failures = [unique_id for unique_id, entry in sorted(manifest.items())
+                if entry['status'] not in DONE_STATUSES and (entry['project'], entry['bid']) in selected]
+    print(f"[INFO] {len(bugs) - len(failures)}/{len(bugs)} workspaces ready, manifest: {manifest_path}")
+    if failures:
+        print(f"[WARNING] Failed: {', '.join(failures)}")
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check out and compile the Defects4J buggy versions")
+    parser.add_argument('--root_dir', default=os.getcwd(), type=str,
+                        help="Workspaces are created under <root_dir>/defects4j_buggy")
+    parser.add_argument('--projects', nargs='+', default=None, type=str, help="Only these projects")
+    parser.add_argument('--workers', default=4, type=int, help="Concurrent checkouts")
+    parser.add_argument('--no_compile', action='store_true', help="Skip the `defects4j compile` warm-up")
+    parser.add_argument('--retries', default=1, type=int, help="Extra passes over failed bugs")
+    parser.add_argument('--timeout', default=1800, type=int, help="Timeout of one checkout or compile (seconds)")
+    parser.add_argument('--manifest', default=None, type=str,
+                        help="Manifest path (default: <root_dir>/defects4j_buggy/checkout_manifest.json)")
+    args = parser.parse_args()
+
+    get_repos(args.root_dir, args.projects, args.workers, not args.no_compile, args.retries, args.timeout,
+              args.manifest)
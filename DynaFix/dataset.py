@@ -0,0 +1,109 @@
+import os
+import sys
+import csv
+import sqlite3
+import hashlib
+import threading
+
+DATASET_CACHE_VERSION = 1
+
+
+class BugDataset:
+    """
+    Input CSV (data or exception info) converted once into an SQLite file indexed on slug.
+    The cache is rebuilt when the CSV's mtime or size changes. Opening it only reads the slug index;
+    the rows of a slug (with their buggy_code) are fetched when they are asked for.
+    """
+
+    def __init__(self, csv_path, cache_dir="./result/dataset_cache"):
+        self.csv_path = os.path.abspath(csv_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        name = os.path.splitext(os.path.basename(csv_path))[0]
+        digest = hashlib.sha1(self.csv_path.encode("utf-8")).hexdigest()[:8]
+        self.cache_path = os.path.join(cache_dir, f"{name}_{digest}.sqlite")
+
+        stat = os.stat(self.csv_path)
+        self.version = f"{DATASET_CACHE_VERSION}:{stat.st_mtime_ns}:{stat.st_size}"
+        if self._cached_version() != self.version:
+            self._build()
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.cache_path, check_same_thread=False)
+        self.columns = [row[1] for row in self._conn.execute("PRAGMA table_info(rows)")][1:]
+        self.slugs = sorted(row[0] for row in self._conn.execute("SELECT DISTINCT slug FROM rows"))
+        self._slug_set = set(self.slugs)
+
+    def _cached_version(self):
+        if not os.path.exists(self.cache_path):
+            return None
+        try:
+            conn = sqlite3.connect(self.cache_path)
+            try:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            finally:
+                conn.close()
+            return row[0] if row else None
+        except sqlite3.Error:
+            return None
+
+    def _build(self):
+        print(f"[INFO] Indexing {self.csv_path} into {self.cache_path}")
+        csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        conn = sqlite3.connect(tmp_path)
+        try:
+            with open(self.csv_path, "r", encoding="utf-8", newline="") as f:
+                reader = csv.reader(f)
+                header = next(reader)
+                # Keep named columns only; some CSVs carry trailing empty columns
+                indices, columns = [], []
+                for index, column in enumerate(header):
+                    if column and column not in columns:
+                        indices.append(index)
+                        columns.append(column)
+                if "slug" not in columns:
+                    raise ValueError(f"No slug column in {self.csv_path}")
+
+                slug_index = indices[columns.index("slug")]
+
+                quoted = ", ".join(f'"{column}" TEXT' for column in columns)
+                conn.execute(f"CREATE TABLE rows (position INTEGER PRIMARY KEY, {quoted})")
+                placeholders = ", ".join("?" for _ in range(len(columns) + 1))
+                conn.executemany(
+                    f"INSERT INTO rows VALUES ({placeholders})",
+                    ((position, *(record[i] if i < len(record) else "" for i in indices))
+                     for position, record in enumerate(reader)
+                     if len(record) > slug_index and record[slug_index].strip()))
+            conn.execute("CREATE INDEX rows_slug ON rows (slug)")
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("INSERT INTO meta VALUES ('version', ?)", (self.version,))
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, self.cache_path)
+
+    def __len__(self):
+        return len(self.slugs)
+
+    def __contains__(self, slug):
+        return slug in self._slug_set
+
+    def rows(self, slug):
+        """All rows of a slug in file order, as dicts"""
+        if slug not in self._slug_set:
+            return []
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM rows WHERE slug = ? ORDER BY position", (slug,))
+            records = cursor.fetchall()
+        return [dict(zip(self.columns, record[1:])) for record in records]
+
+    def first(self, slug):
+        rows = self.rows(slug)
+        return rows[0] if rows else None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
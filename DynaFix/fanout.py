@@ -0,0 +1,116 @@
+import os
+import re
+import json
+import shutil
+import threading
+
+# SBFL location slugs: '<Project>_<id>b_<rank>', rank 1 being the most suspicious method
+LOCATION_PATTERN = re.compile(r"^(.+?)b_(\d+)$")
+
+
+def group_locations(slugs, top_k=None, scores=None):
+    """
+    Group SBFL location slugs by bug, most suspicious first: by score when scores (slug -> suspiciousness) has
+    one, otherwise by the rank in the slug. Slugs that are not locations form a group of their own.
+    Returns [(bug, [location slugs])] with at most top_k locations per bug.
+    """
+    groups = {}
+    for slug in slugs:
+        match = LOCATION_PATTERN.match(slug)
+        bug, rank = (match.group(1), int(match.group(2))) if match else (slug, 1)
+        groups.setdefault(bug, []).append((rank, slug))
+
+    ordered = []
+    for bug, locations in groups.items():
+        locations.sort(key=lambda item: (-(scores or {}).get(item[1], 0.0), item[0]))
+        ordered.append((bug, [slug for _, slug in locations][:top_k or None]))
+    return ordered
+
+
+def rebase_class_path(class_path, bug, work_dir):
+    """Point a class path of the bug's checkout into another workspace"""
+    marker = f"/{bug}_buggy/"
+    normalized = class_path.replace('\\', '/')
+    if marker not in normalized:
+        return class_path
+    return os.path.join(work_dir, normalized.split(marker, 1)[1])
+
+
+def prepare_workspace(base_dir, bug, location, workspace_root):
+    """Copy the bug's checkout to '<workspace_root>/<location>_buggy' unless it exists; returns its path"""
+    work_dir = os.path.join(workspace_root, f"{location}_buggy")
+    if os.path.exists(os.path.join(work_dir, 'defects4j.build.properties')):
+        return work_dir
+    source_dir = os.path.join(base_dir, f"{bug}_buggy")
+    if not os.path.isdir(source_dir):
+        raise FileNotFoundError(f"No checkout of {bug} at {source_dir}")
+    if os.path.exists(work_dir):
+        shutil.rmtree(work_dir)
+    tmp_dir = f"{work_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    shutil.copytree(source_dir, tmp_dir, symlinks=True)
+    os.replace(tmp_dir, work_dir)
+    return work_dir
+
+
+class BugFanout:
+    """
+    Width-attempt budget and cancellation shared by the concurrently repaired locations of one bug.
+    The first location that yields a plausible patch cancels its siblings.
+    """
+
+    def __init__(self, bug, locations, width_budget):
+        self.bug = bug
+        self.locations = locations
+        self.width_budget = width_budget
+        self.widths_used = 0
+        self.repaired_by = None
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    def take_width(self):
+        """Claim one width attempt, False once the budget is spent or a sibling succeeded"""
+        with self._lock:
+            if self.cancelled.is_set() or self.widths_used >= self.width_budget:
+                return False
+            self.widths_used += 1
+            return True
+
+    def report_success(self, location):
+        with self._lock:
+            if self.repaired_by is None:
+                self.repaired_by = location
+        self.cancelled.set()
+
+
+class FanoutState:
+    """Per-bug outcome of a fan-out run, persisted so a restarted run skips finished bugs"""
+
+    def __init__(self, state_path):
+        self.state_path = state_path
+        self.bugs = {}
+        self._lock = threading.Lock()
+        if os.path.exists(state_path):
+            with open(state_path, 'r', encoding='utf-8') as f:
+                self.bugs = json.load(f)
+
+    def done(self, bug):
+        return bug in self.bugs
+
+    def finish(self, fanout, seconds):
+        with self._lock:
+            self.bugs[fanout.bug] = {
+                'locations': fanout.locations,
+                'repaired_by': fanout.repaired_by,
+                'widths_used': fanout.widths_used,
+                'seconds': round(seconds, 1),
+            }
+            tmp_path = self.state_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.bugs, f, indent=2)
+            os.replace(tmp_path, self.state_path)
+
+    def summary(self):
+        repaired = sum(1 for entry in self.bugs.values() if entry['repaired_by'])
+        widths = sum(entry['widths_used'] for entry in self.bugs.values())
+        return f"{repaired}/{len(self.bugs)} bugs repaired, {widths} width attempts used"
@@ -0,0 +1,62 @@
+import os
+import json
+import time
+import threading
+
+
+class RepairJournal:
+    """
+    Append-only JSONL log of every validated attempt (slug, width, iteration, prompt hash, response, fixed
+    methods, validation result), written and fsynced before the attempt reaches the result CSVs.
+    On restart the attempts of a slug whose prompt hash still matches are replayed from it instead of asking the
+    LLM and running the tests again; CSV rows a crash kept from being written are added then.
+    A line cut short by a crash is ignored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._attempts = {}
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        skipped = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    skipped += 1
+                    continue
+                self._attempts.setdefault(event['slug'], {})[(event['width'], event['iteration'])] = event
+        total = sum(len(attempts) for attempts in self._attempts.values())
+        print(f"[INFO] Journal {self.path}: {total} attempts of {len(self._attempts)} slugs"
+              + (f", {skipped} damaged lines skipped" if skipped else ""))
+
+    def attempts(self, slug):
+        """{(width, iteration): event} of a slug"""
+        return dict(self._attempts.get(slug, {}))
+
+    def record(self, slug, width, iteration, prompt_hash, response, fixed_codes, reward, submission_result,
+               failing_tests):
+        event = {
+            'slug': slug,
+            'width': width,
+            'iteration': iteration,
+            'prompt_hash': prompt_hash,
+            'response': response,
+            'fixed_codes': list(fixed_codes),
+            'reward': bool(reward),
+            'submission_result': submission_result,
+            'failing_tests': None if failing_tests is None else sorted(failing_tests),
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        line = json.dumps(event, ensure_ascii=False) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._attempts.setdefault(slug, {})[(width, iteration)] = event
+        return event
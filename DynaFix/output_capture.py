@@ -0,0 +1,116 @@
+import os
+import re
+import time
+import signal
+import tempfile
+import threading
+import subprocess
+from collections import deque
+
+# Bytes of output kept in memory per stream; the rest only goes to the spool file
+TAIL_BYTES = 64 * 1024
+# Longest line handled at once, longer ones are split
+CHUNK_BYTES = 64 * 1024
+MAX_WATCHED_LINES = 200
+# Seconds to wait for the rest of a killed process group to exit
+KILL_GRACE_SECONDS = 5
+
+
+def new_spool_path(prefix):
+    """A fresh spool file in the temp directory, never inside a checkout; the caller removes it"""
+    fd, path = tempfile.mkstemp(prefix=f"dynafix_{prefix}_", suffix=".log")
+    os.close(fd)
+    return path
+
+
+class StreamCapture:
+    """
+    Copy a subprocess pipe to a spool file on a background thread, keeping in memory only the last tail_bytes
+    and the lines matching one of the watch patterns, so the memory of a run stays bounded however much it prints.
+    """
+
+    def __init__(self, stream, spool_path, tail_bytes=TAIL_BYTES, watch=()):
+        self.spool_path = spool_path
+        self.tail_bytes = tail_bytes
+        self.watch = [re.compile(pattern) for pattern in watch]
+        self.watched = []
+        self.total_bytes = 0
+        self._tail = deque()
+        self._tail_size = 0
+        self._stream = stream
+        self._thread = threading.Thread(target=self._pump, daemon=True)
+        self._thread.start()
+
+    def _pump(self):
+        try:
+            spool = open(self.spool_path, 'wb')
+        except OSError as e:
+            # Keep draining the pipe, or the child blocks once it is full
+            print(f"[WARNING] Cannot spool output to {self.spool_path}: {str(e)}")
+            spool = open(os.devnull, 'wb')
+        with spool:
+            for chunk in iter(lambda: self._stream.readline(CHUNK_BYTES), b''):
+                spool.write(chunk)
+                self.total_bytes += len(chunk)
+                self._tail.append(chunk)
+                self._tail_size += len(chunk)
+                while self._tail_size - len(self._tail[0]) >= self.tail_bytes:
+                    self._tail_size -= len(self._tail.popleft())
+                if self.watch and len(self.watched) < MAX_WATCHED_LINES:
+                    line = chunk.decode('utf-8', errors='replace')
+                    if any(pattern.search(line) for pattern in self.watch):
+                        self.watched.append(line.rstrip('\n'))
+        self._stream.close()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def tail(self):
+        """The last tail_bytes of the stream (a little more when its first line is long)"""
+        return b''.join(self._tail).decode('utf-8', errors='replace')
+
+    def text(self):
+        """Watched lines followed by the tail, for status parsing"""
+        return '\n'.join(self.watched) + '\n' + self.tail()
+
+
+def _kill_group(process):
+    """Kill the process group started for a command and wait until none of its processes is left"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+    deadline = time.time() + KILL_GRACE_SECONDS
+    while time.time() < deadline:
+        try:
+            os.killpg(process.pid, 0)
+        except ProcessLookupError:
+            return
+        time.sleep(0.05)
+
+
+def run_captured(cmd, spool_path, timeout=None, tail_bytes=TAIL_BYTES, watch=(), stderr_spool_path=None, **kwargs):
+    """
+    Run cmd with its stdout streamed to spool_path, and its stderr to stderr_spool_path or merged into stdout.
+    Returns (returncode, stdout capture, stderr capture or None).
+    cmd runs in its own process group. When the call is left early (subprocess.TimeoutExpired on timeout, or any
+    exception raised into it, e.g. an eventlet.Timeout) the whole group, including the JVMs under a shell, is
+    killed and gone before the exception propagates.
+    """
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE if stderr_spool_path else subprocess.STDOUT,
+                               start_new_session=True, **kwargs)
+    stdout = StreamCapture(process.stdout, spool_path, tail_bytes, watch)
+    stderr = StreamCapture(process.stderr, stderr_spool_path, tail_bytes, watch) if stderr_spool_path else None
+    captures = [capture for capture in (stdout, stderr) if capture is not None]
+    try:
+        returncode = process.wait(timeout=timeout)
+    except BaseException:
+        _kill_group(process)
+        for capture in captures:
+            capture.join(timeout=5)
+        raise
+    for capture in captures:
+        capture.join()
+    return returncode, stdout, stderr
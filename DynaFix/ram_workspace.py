@@ -0,0 +1,146 @@
+import os
+import time
+import fnmatch
+import shutil
+import threading
+
+# Files of a workspace worth keeping once it leaves RAM: ByteTrace logs written to the checkout root
+SYNC_PATTERNS = ('bugDetect_*.log*', 'bugDetectOri_*.log*', 'bugDetect_*.trace')
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class RamWorkspaceCache:
+    """
+    Copies of Defects4J checkouts on a RAM-backed directory (tmpfs, /dev/shm), so source rewrites, Ant builds,
+    test runs and git resets do not touch the checkout disk. Workspaces stay cached after they are released and
+    the least recently used unleased ones are evicted when a new copy would exceed the capacity (bytes;
+    0 = 80% of the space free when the cache is created). Only the files matching SYNC_PATTERNS are copied
+    back to the persistent checkout on release; the other artifacts already go to result/ or the output dirs.
+    Leases are counted per process: processes sharing a RAM directory should not evict each other's workspaces,
+    so give each its own directory or enough capacity.
+    """
+
+    def __init__(self, ram_root, capacity=0):
+        self.ram_root = os.path.abspath(ram_root)
+        os.makedirs(self.ram_root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'fallbacks': 0}
+
+        # Workspaces left by a previous run are reused
+        for name in os.listdir(self.ram_root):
+            path = os.path.join(self.ram_root, name)
+            if name.endswith('_buggy') and os.path.isdir(path):
+                self._entries[name[:-len('_buggy')]] = self._entry(dir_size(path), ready=True)
+            elif name.endswith('.tmp'):
+                shutil.rmtree(path, ignore_errors=True)
+        used = self.used()
+        self.capacity = capacity or used + int(shutil.disk_usage(self.ram_root).free * 0.8)
+        print(f"[INFO] RAM workspaces under {self.ram_root}: {len(self._entries)} cached, "
+              f"{used / 1024 ** 3:.2f}/{self.capacity / 1024 ** 3:.2f} GB used")
+
+    @staticmethod
+    def _entry(size, ready=False):
+        entry = {'size': size, 'leases': 0, 'last_used': time.time(), 'ready': threading.Event()}
+        if ready:
+            entry['ready'].set()
+        return entry
+
+    def used(self):
+        return sum(entry['size'] for entry in self._entries.values())
+
+    def work_dir(self, name):
+        return os.path.join(self.ram_root, f"{name}_buggy")
+
+    def _evict(self, needed):
+        """Remove unleased workspaces, least recently used first, until needed more bytes fit"""
+        idle = sorted((entry['last_used'], name) for name, entry in self._entries.items()
+                      if entry['leases'] == 0 and entry['ready'].is_set())
+        for _, name in idle:
+            if self.used() + needed <= self.capacity:
+                break
+            shutil.rmtree(self.work_dir(name), ignore_errors=True)
+            del self._entries[name]
+            self.stats['evictions'] += 1
+
+    def lease(self, name, source_dir):
+        """
+        Return the RAM copy of source_dir as '<ram_root>/<name>_buggy', copying it on a miss.
+        Returns None (use the persistent checkout) when the copy does not fit or fails.
+        """
+        copy = False
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                entry['leases'] += 1
+                entry['last_used'] = time.time()
+                self.stats['hits'] += 1
+            else:
+                size = dir_size(source_dir)
+                self._evict(size)
+                if self.used() + size > self.capacity:
+                    print(f"[WARNING] No room for {name} in {self.ram_root} ({size / 1024 ** 2:.0f} MB), "
+                          f"using the checkout on disk")
+                    self.stats['fallbacks'] += 1
+                    return None
+                entry = self._entries[name] = self._entry(size)
+                entry['leases'] = 1
+                self.stats['misses'] += 1
+                copy = True
+        if not copy:
+            # Another thread may still be copying this workspace
+            entry['ready'].wait()
+            return self.work_dir(name) if name in self._entries else None
+
+        work_dir = self.work_dir(name)
+        tmp_dir = f"{work_dir}.{os.getpid()}.tmp"
+        try:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            shutil.copytree(source_dir, tmp_dir, symlinks=True)
+            os.replace(tmp_dir, work_dir)
+        except Exception as e:
+            print(f"[WARNING] Could not stage {name} in {self.ram_root}: {str(e)}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            with self._lock:
+                self._entries.pop(name, None)
+                self.stats['fallbacks'] += 1
+            entry['ready'].set()
+            return None
+        entry['ready'].set()
+        return work_dir
+
+    def release(self, name, persistent_dir=None):
+        """End a lease, copying the artifacts worth keeping back to persistent_dir"""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return
+            entry['leases'] = max(entry['leases'] - 1, 0)
+            entry['last_used'] = time.time()
+        if persistent_dir:
+            self.sync_back(name, persistent_dir)
+
+    def sync_back(self, name, persistent_dir):
+        work_dir = self.work_dir(name)
+        if not os.path.isdir(work_dir) or not os.path.isdir(persistent_dir):
+            return 0
+        synced = 0
+        for file_name in os.listdir(work_dir):
+            if any(fnmatch.fnmatch(file_name, pattern) for pattern in SYNC_PATTERNS):
+                shutil.copy2(os.path.join(work_dir, file_name), os.path.join(persistent_dir, file_name))
+                synced += 1
+        return synced
+
+    def summary(self):
+        return (f"{self.stats['hits']} hits, {self.stats['misses']} copies, {self.stats['evictions']} evictions, "
+                f"{self.stats['fallbacks']} fallbacks to disk, {self.used() / 1024 ** 3:.2f} GB cached")
@@ -0,0 +1,317 @@
+"""
+Analytics over the experiment outputs under Result/ (eval CSVs, token usage CSVs, validation results and
+correct-bug JSONs). All files are ingested once into a cached columnar store (one DataFrame per table,
+pickled); only files whose mtime or size changed are re-read on the next run.
+
+    python result_analytics.py summary
+    python result_analytics.py attempts --config Depth=5
+    python result_analytics.py overlap RQ1/DynaFix_GPT4o/DynaFix_v1.2 DynaFix_GPT4_v1.2 --source correct
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import pandas as pd
+
+SLUG_PATTERN = r'^([A-Za-z]+)[_-](\d+)'
+CACHE_VERSION = 1
+
+
+def normalize_slugs(slugs):
+    """'Chart_10b_1' (SBFL), 'Cli-251' (RWB) and 'Chart_10' all become '<Project>_<id>'"""
+    parts = slugs.astype(str).str.extract(SLUG_PATTERN)
+    return (parts[0] + '_' + parts[1]).fillna(slugs.astype(str))
+
+
+def read_eval(path, config):
+    df = pd.read_csv(path, usecols=['slug', 'reward', 'submission_result', 'width_attempt', 'iteration'],
+                     dtype={'slug': str, 'submission_result': str}, keep_default_na=False)
+    df['reward'] = df['reward'].astype(str).str.strip().str.lower() == 'true'
+    df['width_attempt'] = pd.to_numeric(df['width_attempt'], errors='coerce').fillna(-1).astype('int32')
+    df['iteration'] = pd.to_numeric(df['iteration'], errors='coerce').fillna(-1).astype('int32')
+    df['failing_tests'] = pd.to_numeric(df['submission_result'].str.extract(r'Failing tests:\s*(\d+)')[0],
+                                        errors='coerce')
+    df['compiled'] = df['failing_tests'].notna()
+    df['attempt'] = df.groupby('slug', sort=False).cumcount().astype('int32') + 1
+    df['slug'] = normalize_slugs(df['slug'])
+    df.insert(0, 'config', config)
+    df['config'] = df['config'].astype('category')
+    df['submission_result'] = df['submission_result'].astype('category')
+    return 'attempts', df
+
+
+def read_tokens(path, config):
+    df = pd.read_csv(path, usecols=['slug', 'model', 'input_tokens', 'output_tokens', 'total_tokens'],
+                     dtype={'slug': str, 'model': str})
+    df['slug'] = normalize_slugs(df['slug'])
+    df.insert(0, 'config', config)
+    for column in ('config', 'model'):
+        df[column] = df[column].astype('category')
+    return 'tokens', df
+
+
+def read_validation(path, config):
+    df = pd.read_csv(path, dtype=str, keep_default_na=False).rename(
+        columns={'Slug': 'slug', 'Validation_Result': 'result'})
+    df['slug'] = normalize_slugs(df['slug'])
+    df['plausible'] = df['result'] == 'PLAUSIBLE'
+    df.insert(0, 'config', config)
+    return 'validation', df[['config', 'slug', 'result', 'plausible']]
+
+
+def read_correct(path, config):
+    """Correct-bug JSONs come as {tool: {'Correct Bugs': [...]}}, {tool: [...]} or {group: [{model_name, bugs}]}"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    rows = []
+    for tool, value in data.items():
+        if isinstance(value, dict):
+            bugs = next((v for v in value.values() if isinstance(v, list)), [])
+            rows += [(f"{config}:{tool}", bug) for bug in bugs]
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    rows += [(f"{config}:{tool}/{item.get('model_name', '?')}", bug) for bug in item.get('bugs', [])]
+                else:
+                    rows.append((f"{config}:{tool}", item))
+    df = pd.DataFrame(rows, columns=['config', 'slug'])
+    df['slug'] = normalize_slugs(df['slug'])
+    return 'correct', df
+
+
+def reader_for(name):
+    if name.startswith('pred_'):
+        # Patches only, nothing to aggregate
+        return None
+    if name.endswith('.json'):
+        return read_correct
+    if name.startswith('eval_') and name.endswith('.csv'):
+        return read_eval
+    if name.startswith('token_usage') and name.endswith('.csv'):
+        return read_tokens
+    if name.startswith('validation_results') and name.endswith('.csv'):
+        return read_validation
+    return None
+
+
+class ResultStore:
+    """Tables of all result files, cached on disk and refreshed per file"""
+
+    TABLES = ('attempts', 'tokens', 'validation', 'correct')
+
+    def __init__(self, results_dir, cache_path):
+        self.results_dir = results_dir
+        self.cache_path = cache_path
+        self.files = {}
+        self.tables = {}
+
+    def _scan(self):
+        found = {}
+        for root, _, names in os.walk(self.results_dir):
+            for name in names:
+                reader = reader_for(name)
+                if reader is None:
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                found[os.path.relpath(path, self.results_dir)] = (reader, (stat.st_mtime_ns, stat.st_size))
+        return found
+
+    def load(self):
+        """Load the cache and re-ingest new or changed files, return the number of files read"""
+        cached = {}
+        if os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, 'rb') as f:
+                    payload = pickle.load(f)
+                if payload.get('version') == CACHE_VERSION:
+                    cached = payload['files']
+            except Exception as e:
+                print(f"[WARNING] Ignoring unreadable cache {self.cache_path}: {str(e)}")
+
+        ingested = 0
+        for relpath, (reader, version) in self._scan().items():
+            entry = cached.get(relpath)
+            if entry is not None and entry['version'] == version:
+                self.files[relpath] = entry
+                continue
+            config = os.path.splitext(relpath)[0].replace(os.sep, '/')
+            if reader is read_tokens or reader is read_validation:
+                # Token usage and validation results describe the run of their directory
+                config = os.path.dirname(relpath).replace(os.sep, '/')
+            try:
+                table, frame = reader(os.path.join(self.results_dir, relpath), config)
+            except Exception as e:
+                print(f"[WARNING] Skipping {relpath}: {str(e)}")
+                continue
+            self.files[relpath] = {'version': version, 'table': table, 'frame': frame}
+            ingested += 1
+
+        if ingested or set(self.files) != set(cached):
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            tmp_path = self.cache_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({'version': CACHE_VERSION, 'files': self.files}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.cache_path)
+
+        for table in self.TABLES:
+            frames = [entry['frame'] for entry in self.files.values() if entry['table'] == table]
+            self.tables[table] = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        if not self.tables['attempts'].empty:
+            self.tables['attempts']['config'] = self.tables['attempts']['config'].astype('category')
+        return ingested
+
+    def select(self, table, config=None):
+        df = self.tables[table]
+        if config and not df.empty:
+            df = df[df['config'].astype(str).str.contains(config, regex=False)]
+        return df
+
+
+def plausible_sets(store, config=None):
+    """Per configuration, the slugs with a passing patch (eval CSVs and validation results)"""
+    attempts = store.select('attempts', config)
+    validation = store.select('validation', config)
+    frames = []
+    if not attempts.empty:
+        frames.append(attempts.loc[attempts['reward'], ['config', 'slug']])
+    if not validation.empty:
+        frames.append(validation.loc[validation['plausible'], ['config', 'slug']])
+    if not frames:
+        return {}
+    df = pd.concat(frames).astype({'config': str})
+    return {name: set(group) for name, group in df.groupby('config')['slug']}
+
+
+def correct_sets(store, config=None):
+    df = store.select('correct', config)
+    if df.empty:
+        return {}
+    return {name: set(group) for name, group in df.groupby('config')['slug']}
+
+
+def attempts_to_fix(store, config=None):
+    """Attempts spent until the first passing patch, per configuration and slug"""
+    df = store.select('attempts', config)
+    if df.empty:
+        return pd.DataFrame(columns=['config', 'slug', 'attempts'])
+    first = df[df['reward']].groupby(['config', 'slug'], observed=True, sort=False)['attempt'].min()
+    return first.rename('attempts').reset_index()
+
+
+def config_summary(store, config=None):
+    """One row per eval configuration: bugs, plausible, attempts, compile rate and token costs"""
+    df = store.select('attempts', config)
+    if df.empty:
+        return pd.DataFrame()
+    grouped = df.groupby('config', observed=True)
+    summary = pd.DataFrame({
+        'bugs': grouped['slug'].nunique(),
+        'plausible': df[df['reward']].groupby('config', observed=True)['slug'].nunique(),
+        'attempts': grouped.size(),
+        'compile_rate': grouped['compiled'].mean().round(3),
+    }).fillna({'plausible': 0})
+    summary['plausible'] = summary['plausible'].astype(int)
+
+    fixes = attempts_to_fix(store, config).groupby('config', observed=True)['attempts']
+    summary['attempts_to_fix_median'] = fixes.median()
+    summary['attempts_to_fix_p90'] = fixes.quantile(0.9)
+
+    tokens = store.tables['tokens']
+    if not tokens.empty:
+        run_dirs = pd.Series(summary.index.astype(str), index=summary.index).str.rsplit('/', n=1).str[0]
+        totals = tokens.groupby(tokens['config'].astype(str), observed=True)['total_tokens'].sum()
+        summary['tokens'] = run_dirs.map(totals)
+        summary['tokens_per_fixed_bug'] = (summary['tokens'] / summary['plausible'].where(summary['plausible'] > 0))\
+            .round(0)
+    summary.index = summary.index.astype(str)
+    return summary.sort_index()
+
+
+def overlap(sets, names):
+    """Sizes, intersections and unique members of the selected sets (matched by substring)"""
+    selected = {}
+    for name in names:
+        matches = [key for key in sets if name in key]
+        if len(matches) != 1:
+            raise ValueError(f"'{name}' matches {len(matches)} configurations: {matches[:10]}")
+        selected[matches[0]] = sets[matches[0]]
+
+    keys = list(selected)
+    rows = []
+    for a in keys:
+        row = {'config': a, 'size': len(selected[a]),
+               'unique': len(selected[a] - set().union(*(selected[b] for b in keys if b != a)))}
+        for b in keys:
+            union = selected[a] | selected[b]
+            row[f"jaccard[{keys.index(b)}]"] = round(len(selected[a] & selected[b]) / len(union), 3) if union else 1.0
+        rows.append(row)
+    common = set.intersection(*selected.values()) if selected else set()
+    return pd.DataFrame(rows), common, selected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze the experiment results under Result/")
+    parser.add_argument('command', choices=['summary', 'plausible', 'correct', 'attempts', 'tokens', 'overlap'])
+    parser.add_argument('names', nargs='*', help="Configurations to compare (substrings), for `overlap`")
+    parser.add_argument('--results_dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                                                               'Result'), type=str)
+    parser.add_argument('--cache', default='./result/result_analytics_cache.pkl', type=str)
+    parser.add_argument('--config', default=None, type=str, help="Only configurations containing this substring")
+    parser.add_argument('--source', default='plausible', choices=['plausible', 'correct'],
+                        help="Which sets `overlap` compares")
+    parser.add_argument('--output', default=None, type=str, help="Also write the result table as CSV")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    store = ResultStore(args.results_dir, args.cache)
+    ingested = store.load()
+    print(f"[INFO] {len(store.files)} result files, {ingested} re-read, loaded in "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms")
+
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_colwidth', 90)
+    pd.set_option('display.max_rows', 500)
+    pd.set_option('display.max_columns', None)
+    table = None
+    if args.command == 'summary':
+        table = config_summary(store, args.config)
+    elif args.command in ('plausible', 'correct'):
+        sets = plausible_sets(store, args.config) if args.command == 'plausible' else correct_sets(store, args.config)
+        table = pd.DataFrame([{'config': name, 'bugs': len(slugs), 'slugs': ' '.join(sorted(slugs))}
+                              for name, slugs in sorted(sets.items())])
+    elif args.command == 'attempts':
+        fixes = attempts_to_fix(store, args.config)
+        table = fixes.groupby('config', observed=True)['attempts'].describe(percentiles=[0.5, 0.9])
+        print(table)
+        table = fixes.groupby(['config', 'attempts'], observed=True).size().rename('bugs').reset_index()
+    elif args.command == 'tokens':
+        tokens = store.select('tokens', args.config)
+        table = tokens.groupby(tokens['config'].astype(str)).agg(
+            requests=('total_tokens', 'size'), bugs=('slug', 'nunique'), input_tokens=('input_tokens', 'sum'),
+            output_tokens=('output_tokens', 'sum'), total_tokens=('total_tokens', 'sum'))
+    elif args.command == 'overlap':
+        sets = plausible_sets(store) if args.source == 'plausible' else correct_sets(store)
+        if len(args.names) < 2:
+            parser.error("overlap needs at least two configurations")
+        try:
+            table, common, selected = overlap(sets, args.names)
+        except ValueError as e:
+            print(f"[ERROR] {str(e)}")
+            return 1
+        print(f"Common to all {len(selected)}: {len(common)}")
+        for name, slugs in selected.items():
+            others = set().union(*(s for n, s in selected.items() if n != name))
+            print(f"Only {name}: {' '.join(sorted(slugs - others))}")
+
+    print(table)
+    if args.output and table is not None:
+        table.to_csv(args.output)
+    print(f"[INFO] Done in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,202 @@
+import os
+import json
+import time
+
+# Submission results that mean the patch never reached the tests
+UNUSABLE_RESULTS = ('Compile failed', 'Locate failed', 'Replace failed', 'No file replacements provided',
+                    'Match failed')
+
+
+class BudgetScheduler:
+    """
+    Hand out width/deep attempts across bugs in rounds under a global token and time budget.
+    Every round each active bug gets one width chain. Bugs whose attempts compile and reduce the failing tests
+    get more width chains and deeper chains; bugs whose chains keep failing to compile or locate are cut off.
+    The state is persisted after every report and each round's decisions are appended to a JSONL log.
+    """
+
+    def __init__(self, state_path, log_path, token_budget=0, time_budget=0, max_width=7, max_deep=5,
+                 min_deep=2, bonus_width=1, cutoff_chains=2):
+        self.state_path = state_path
+        self.log_path = log_path
+        self.token_budget = token_budget
+        self.time_budget = time_budget
+        self.max_width = max_width
+        self.max_deep = max_deep
+        self.min_deep = min(min_deep, max_deep)
+        self.bonus_width = bonus_width
+        self.cutoff_chains = cutoff_chains
+        self.state = {'round': 0, 'tokens': 0, 'seconds': 0.0, 'bugs': {}}
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+
+    def save(self):
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def _log(self, event):
+        event['time'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(event) + '\n')
+
+    def register(self, slug, index, original_failing):
+        bugs = self.state['bugs']
+        if slug not in bugs:
+            bugs[slug] = {
+                'index': index,
+                'original_failing': original_failing,
+                'widths_used': 0,
+                'attempts': 0,
+                'compiled': 0,
+                'unusable_streak': 0,
+                'best_failing': None,
+                'improved_last': False,
+                'tokens': 0,
+                'seconds': 0.0,
+                'repaired': False,
+                'cut': None,
+            }
+
+    def budget_status(self):
+        """Return (True, None) while budget is left, otherwise (False, reason)"""
+        if self.token_budget and self.state['tokens'] >= self.token_budget:
+            return False, f"token budget exhausted ({self.state['tokens']}/{self.token_budget})"
+        if self.time_budget and self.state['seconds'] >= self.time_budget:
+            return False, f"time budget exhausted ({self.state['seconds']:.0f}s/{self.time_budget}s)"
+        return True, None
+
+    def _active(self, bug):
+        return not bug['repaired'] and not bug['cut'] and bug['widths_used'] < self.max_width
+
+    def _score(self, bug):
+        """Higher is more promising: compile rate plus the fraction of failing tests already fixed"""
+        if bug['attempts'] == 0:
+            return 1.0
+        score = 0.5 * bug['compiled'] / bug['attempts']
+        original, best = bug['original_failing'], bug['best_failing']
+        if original and best is not None and best < original:
+            score += (original - best) / original
+        if bug['improved_last']:
+            score += 0.5
+        return score
+
+    def _cost_per_attempt(self):
+        attempts = sum(bug['attempts'] for bug in self.state['bugs'].values())
+        if not attempts:
+            return 0, 0.0
+        return self.state['tokens'] / attempts, self.state['seconds'] / attempts
+
+    def plan_round(self):
+        """Decide this round's grants as a list of (slug, width_count, deep_try), most promising first"""
+        ok, reason = self.budget_status()
+        active = [(slug, bug) for slug, bug in self.state['bugs'].items() if self._active(bug)]
+        if not ok or not active:
+            self._log({'round': self.state['round'], 'event': 'stop',
+                       'reason': reason or 'no active bugs left'})
+            return []
+
+        self.state['round'] += 1
+        ranked = sorted(active, key=lambda item: (-self._score(item[1]), item[1]['index']))
+        tokens_per_attempt, seconds_per_attempt = self._cost_per_attempt()
+        tokens_left = self.token_budget - self.state['tokens'] if self.token_budget else None
+        seconds_left = self.time_budget - self.state['seconds'] if self.time_budget else None
+
+        grants, decisions = [], []
+        for slug, bug in ranked:
+            progressing = bug['improved_last'] or bool(
+                bug['best_failing'] is not None and bug['original_failing']
+                and bug['best_failing'] < bug['original_failing'])
+            width_count = 1 + (self.bonus_width if progressing else 0)
+            width_count = min(width_count, self.max_width - bug['widths_used'])
+            deep_try = self.max_deep if progressing else self.min_deep
+
+            # Drop the least promising grants once the expected cost exceeds what is left of the budget
+            expected = width_count * deep_try
+            if tokens_left is not None and tokens_per_attempt:
+                if tokens_left < expected * tokens_per_attempt:
+                    decisions.append({'slug': slug, 'score': round(self._score(bug), 3), 'grant': None,
+                                      'reason': 'deferred: not enough token budget left this round'})
+                    continue
+                tokens_left -= expected * tokens_per_attempt
+            if seconds_left is not None and seconds_per_attempt:
+                if seconds_left < expected * seconds_per_attempt:
+                    decisions.append({'slug': slug, 'score': round(self._score(bug), 3), 'grant': None,
+                                      'reason': 'deferred: not enough time budget left this round'})
+                    continue
+                seconds_left -= expected * seconds_per_attempt
+
+            grants.append((slug, width_count, deep_try))
+            decisions.append({'slug': slug, 'score': round(self._score(bug), 3),
+                              'grant': {'width': width_count, 'deep': deep_try},
+                              'reason': 'progressing' if progressing else
+                              ('explore' if bug['attempts'] == 0 else 'baseline')})
+
+        # Always make progress: if everything was deferred, grant the most promising bug a minimal chain
+        if not grants:
+            slug, bug = ranked[0]
+            grants.append((slug, 1, self.min_deep))
+            decisions.append({'slug': slug, 'score': round(self._score(bug), 3),
+                              'grant': {'width': 1, 'deep': self.min_deep}, 'reason': 'minimal grant'})
+
+        self._log({'round': self.state['round'], 'event': 'plan', 'tokens': self.state['tokens'],
+                   'seconds': round(self.state['seconds'], 1), 'decisions': decisions})
+        self.save()
+        return grants
+
+    def report(self, slug, attempts, widths_used, repaired, tokens, seconds, finished=False):
+        """Update a bug's statistics with the attempts made during its grant"""
+        bug = self.state['bugs'][slug]
+        previous_best = bug['best_failing']
+        chains = {}
+        for attempt in attempts:
+            chains.setdefault(attempt['width_attempt'], []).append(attempt)
+            bug['attempts'] += 1
+            result = attempt['submission_result'] or ''
+            if not any(marker in result for marker in UNUSABLE_RESULTS):
+                bug['compiled'] += 1
+            if attempt['failing_tests'] is not None and \
+                    (bug['best_failing'] is None or attempt['failing_tests'] < bug['best_failing']):
+                bug['best_failing'] = attempt['failing_tests']
+
+        for chain in chains.values():
+            if all(any(marker in (a['submission_result'] or '') for marker in UNUSABLE_RESULTS) for a in chain):
+                bug['unusable_streak'] += 1
+            else:
+                bug['unusable_streak'] = 0
+
+        if bug['best_failing'] is None:
+            bug['improved_last'] = False
+        elif previous_best is None:
+            bug['improved_last'] = bool(bug['original_failing']) and bug['best_failing'] < bug['original_failing']
+        else:
+            bug['improved_last'] = bug['best_failing'] < previous_best
+        bug['widths_used'] = widths_used
+        bug['repaired'] = bug['repaired'] or repaired
+        bug['tokens'] += tokens
+        bug['seconds'] += seconds
+        self.state['tokens'] += tokens
+        self.state['seconds'] += seconds
+
+        event = {'round': self.state['round'], 'event': 'report', 'slug': slug, 'attempts': len(attempts),
+                 'best_failing': bug['best_failing'], 'repaired': bug['repaired'], 'tokens': tokens,
+                 'seconds': round(seconds, 1)}
+        if not bug['repaired'] and finished and bug['widths_used'] < self.max_width:
+            bug['cut'] = "search stopped (time out or unparsable test result)"
+            event['cut'] = bug['cut']
+        elif not bug['repaired'] and bug['unusable_streak'] >= self.cutoff_chains:
+            bug['cut'] = f"{bug['unusable_streak']} consecutive chains failed to compile or locate"
+            event['cut'] = bug['cut']
+        self._log(event)
+        self.save()
+
+    def summary(self):
+        bugs = self.state['bugs'].values()
+        repaired = sum(1 for bug in bugs if bug['repaired'])
+        return (f"{repaired}/{len(self.state['bugs'])} bugs repaired in {self.state['round']} rounds, "
+                f"{self.state['tokens']} tokens, {self.state['seconds'] / 3600:.2f} h")
@@ -0,0 +1,183 @@
+"""
+Timing spans of the repair pipeline, written as one JSON line per finished span.
+
+    with span("run_JUnit"):
+        ...
+
+Spans nest per thread and inherit the tags (slug, width, iteration) of the span around them. Nothing is
+recorded until configure() is called with a log path; until then span() returns a shared no-op context.
+
+    python timing.py result/defects4j/spans.jsonl
+
+summarizes a span log: latency percentiles per project and stage, and where the wall time of each
+top-level span went (its critical path, as the time spent exclusively in each stage).
+"""
+import os
+import json
+import time
+import argparse
+import itertools
+import threading
+from contextlib import nullcontext
+
+_NO_SPAN = nullcontext()
+_recorder = None
+
+
+class SpanRecorder:
+    def __init__(self, log_path):
+        self.log_path = log_path
+        os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+        self._file = open(log_path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+        self._prefix = f"{os.getpid()}-{int(time.time())}"
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def write(self, event):
+        line = json.dumps(event) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class _Span:
+    __slots__ = ("recorder", "name", "tags", "id", "parent", "start", "wall_start")
+
+    def __init__(self, recorder, name, tags):
+        self.recorder = recorder
+        self.name = name
+        self.tags = tags
+
+    def __enter__(self):
+        stack = self.recorder._stack()
+        if stack:
+            parent = stack[-1]
+            self.tags = {**parent.tags, **self.tags}
+            self.parent = parent.id
+        else:
+            self.parent = None
+        self.id = f"{self.recorder._prefix}-{next(self.recorder._ids)}"
+        stack.append(self)
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        self.recorder._stack().pop()
+        event = {"span": self.name, "id": self.id, "parent": self.parent, "start": round(self.wall_start, 6),
+                 "duration": round(duration, 6), "status": "ok" if exc_type is None else exc_type.__name__}
+        event.update(self.tags)
+        self.recorder.write(event)
+        return False
+
+
+def configure(log_path):
+    """Start recording spans to log_path (JSONL, appended); None switches recording off"""
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+    _recorder = SpanRecorder(log_path) if log_path else None
+
+
+def span(name, **tags):
+    """Context manager timing one stage, tagged e.g. with slug=..., width=..., iteration=..."""
+    if _recorder is None:
+        return _NO_SPAN
+    return _Span(_recorder, name, tags)
+
+
+def read_spans(log_paths):
+    spans = []
+    for log_path in log_paths:
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    spans.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # The last line of a killed run may be cut off
+                    continue
+    return spans
+
+
+def _percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def latency_table(spans):
+    """Per (project, stage) count, mean and percentiles of the span durations"""
+    grouped = {}
+    for event in spans:
+        project = str(event.get("slug", "-")).rsplit("_", 1)[0]
+        grouped.setdefault((project, event["span"]), []).append(event["duration"])
+    rows = []
+    for (project, stage), values in sorted(grouped.items()):
+        values.sort()
+        rows.append({"project": project, "stage": stage, "count": len(values),
+                     "mean": sum(values) / len(values), "p50": _percentile(values, 0.5),
+                     "p90": _percentile(values, 0.9), "p99": _percentile(values, 0.99), "max": values[-1],
+                     "total": sum(values)})
+    return rows
+
+
+def critical_path(spans):
+    """
+    Per project, split the wall time of the top-level spans into the time spent exclusively in each stage.
+    Stages run sequentially within a slug, so this is the critical path of the slug's repair.
+    """
+    children = {}
+    for event in spans:
+        if event.get("parent"):
+            children.setdefault(event["parent"], 0.0)
+            children[event["parent"]] += event["duration"]
+
+    breakdown = {}
+    for event in spans:
+        project = str(event.get("slug", "-")).rsplit("_", 1)[0]
+        stages = breakdown.setdefault(project, {"wall": 0.0, "stages": {}})
+        if not event.get("parent"):
+            stages["wall"] += event["duration"]
+        exclusive = max(event["duration"] - children.get(event["id"], 0.0), 0.0)
+        stages["stages"][event["span"]] = stages["stages"].get(event["span"], 0.0) + exclusive
+    return breakdown
+
+
+def summarize(log_paths, output=None):
+    spans = read_spans(log_paths)
+    latencies = latency_table(spans)
+    breakdown = critical_path(spans)
+
+    print(f"{'project':<10} {'stage':<24} {'count':>6} {'p50 (s)':>9} {'p90 (s)':>9} {'p99 (s)':>9} {'total (s)':>10}")
+    for row in latencies:
+        print(f"{row['project']:<10} {row['stage']:<24} {row['count']:>6} {row['p50']:>9.3f} {row['p90']:>9.3f} "
+              f"{row['p99']:>9.3f} {row['total']:>10.1f}")
+
+    print("\nCritical path (exclusive time per stage):")
+    for project, data in sorted(breakdown.items()):
+        wall = data["wall"] or 1e-9
+        parts = sorted(data["stages"].items(), key=lambda item: -item[1])
+        print(f"{project:<10} {data['wall']:>10.1f}s  " +
+              ", ".join(f"{stage} {seconds / wall:.0%}" for stage, seconds in parts if seconds / wall >= 0.005))
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump({"latency": latencies, "critical_path": breakdown}, f, indent=2)
+        print(f"[INFO] Summary written to {output}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Summarize DynaFix timing spans")
+    parser.add_argument('log_paths', nargs='+', type=str, help="Span logs written with --span_log")
+    parser.add_argument('--output', default=None, type=str, help="Also write the summary as JSON")
+    cli_args = parser.parse_args()
+    summarize(cli_args.log_paths, cli_args.output)
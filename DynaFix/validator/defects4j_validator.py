@@ -1,31 +1,29 @@
 import os
 import re
 import subprocess
-import signal
+from timing import span
+from output_capture import run_captured, new_spool_path
+from admission import admit
 
-
-def signal_handler(signum, frame):
-    raise TimeoutError("Time out")
-
-
-def set_timeout(seconds):
-    signal.signal(signal.SIGALRM, signal_handler)
-    signal.alarm(seconds)
-
-
-def reset_timeout():
-    signal.alarm(0)
+# Lines of the 'defects4j test' output kept in memory besides the tail; the rest is spooled to a temp file
+TEST_STATUS_PATTERNS = (r'Running ant \(compile\.tests\)', r'Failing tests:\s*\d+')
 
 
 def run_JUnit(bug_id, test_config, base_dir):
     buggy_dir = os.path.join(base_dir, bug_id + '_buggy')
     try:
-        set_timeout(test_config['time_out'])
         cmd = 'defects4j test'
-        process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=buggy_dir)
-        output, _ = process.communicate()
-        output = output.decode('utf-8')
-        reset_timeout()
+        # Output is spooled to a temp file; only the status lines and the tail stay in memory
+        spool_path = new_spool_path(bug_id)
+        try:
+            with admit(bug_id.split('_')[0], buggy_dir):
+                _, capture, _ = run_captured(cmd, spool_path, shell=True, cwd=buggy_dir,
+                                             timeout=test_config['time_out'], watch=TEST_STATUS_PATTERNS)
+        except subprocess.TimeoutExpired:
+            raise TimeoutError("Time out")
+        finally:
+            os.remove(spool_path)
+        output = capture.text()
 
         if 'Running ant (compile.tests)................................................ FAIL' in output:
             return False, 'Compile failed'
@@ -34,10 +32,68 @@ def run_JUnit(bug_id, test_config, base_dir):
             failing_test_result = match.group(0) if match else 'Failing tests count not found'
             return True if failing_test_result == 'Failing tests: 0' else False, failing_test_result
     except (RuntimeError, TimeoutError, Exception) as e:
-        process.kill()
         return False, str(e)
 
 
+def _normalize_test_name(name):
+    """Turn JUnit's 'method(pkg.Class)' and Defects4J's 'pkg.Class::method' into 'pkg.Class::method'"""
+    name = name.strip()
+    match = re.match(r'^(.+?)\((.+)\)$', name)
+    if match:
+        return f"{match.group(2)}::{match.group(1)}"
+    return name
+
+
+def read_failing_tests(bug_id, base_dir):
+    """Failing tests of the last 'defects4j test' run, parsed from the failing_tests file"""
+    failing_tests_path = os.path.join(base_dir, f"{bug_id}_buggy", "failing_tests")
+    if not os.path.exists(failing_tests_path):
+        return None
+
+    failing = set()
+    with open(failing_tests_path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            if line.startswith('--- '):
+                failing.add(_normalize_test_name(line[4:]))
+    return failing
+
+
+def read_test_outcomes(bug_id, base_dir):
+    """
+    Per-test results of the last 'defects4j test' run as {test: 'PASS' | 'FAIL'}.
+    Executed tests come from the all_tests file, failures from the failing_tests file.
+    Returns an empty dict when the run left no results (e.g. compile failure).
+    """
+    failing = read_failing_tests(bug_id, base_dir)
+    if failing is None:
+        return {}
+
+    outcomes = {}
+    all_tests_path = os.path.join(base_dir, f"{bug_id}_buggy", "all_tests")
+    if os.path.exists(all_tests_path):
+        with open(all_tests_path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if line.strip():
+                    outcomes[_normalize_test_name(line)] = 'PASS'
+    for test_name in failing:
+        outcomes[test_name] = 'FAIL'
+    return outcomes
+
+
+def read_trigger_tests(bug_id, base_dir):
+    """Tests that fail on the original buggy version (d4j.tests.trigger)"""
+    properties_path = os.path.join(base_dir, f"{bug_id}_buggy", "defects4j.build.properties")
+    if not os.path.exists(properties_path):
+        return set()
+
+    with open(properties_path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            key, _, value = line.partition('=')
+            if key.strip() == 'd4j.tests.trigger':
+                return {_normalize_test_name(name) for name in value.split(',') if name.strip()}
+    return set()
+
+
 def class_read(java_file_path):
     try:
         with open(java_file_path, 'r', encoding='utf-8') as file:
@@ -134,7 +190,8 @@ def test(bug_id, file_replacements, base_dir):
 
     test_config = {"time_out": 1200}
 
-    restore_file(bug_id, base_dir=base_dir)
+    with span("restore_file"):
+        restore_file(bug_id, base_dir=base_dir)
 
     try:
         # Replace methods in all files at once
@@ -142,13 +199,15 @@ def test(bug_id, file_replacements, base_dir):
             print("java_file_path:", java_file_path)
             if not os.path.exists(java_file_path):
                 raise ValueError(f"File not found: {java_file_path}")
-            replace_file(java_file_path, method_replacements)
+            with span("replace_file"):
+                replace_file(java_file_path, method_replacements)
     except Exception as e:
         return False, f"Replace failed: {str(e)}"
 
     try:
         # Run JUnit test once
-        reward, submission_result = run_JUnit(bug_id, test_config, base_dir)
+        with span("run_JUnit"):
+            reward, submission_result = run_JUnit(bug_id, test_config, base_dir)
         return reward, submission_result
     except Exception as e:
         return False, f"JUnit test failed: {str(e)}"
\ No newline at end of file
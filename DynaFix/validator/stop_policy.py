@@ -0,0 +1,38 @@
+class PlateauStopPolicy:
+    """
+    Decide when a deep repair chain is hopeless, based on the failing tests of each attempt.
+    A chain is stopped when its failing set has not shrunk below the best attempt so far for `patience`
+    consecutive iterations, or (with stop_on_regression) when a test fails that the original bug did not break.
+    """
+
+    def __init__(self, original_failing, patience=0, stop_on_regression=False):
+        self.original_failing = set(original_failing or [])
+        self.patience = patience
+        self.stop_on_regression = stop_on_regression
+        self.reset()
+
+    def reset(self):
+        """Start a new deep chain"""
+        self.best_count = None
+        self.stale_iterations = 0
+
+    def observe(self, failing_tests):
+        """Record the failing tests of one attempt, return the reason to stop the chain or None"""
+        if failing_tests is None:
+            return None
+
+        if self.stop_on_regression and self.original_failing:
+            regressions = set(failing_tests) - self.original_failing
+            if regressions:
+                return f"regression in {len(regressions)} test(s) the original bug did not break: " \
+                       f"{', '.join(sorted(regressions)[:5])}"
+
+        if self.best_count is None or len(failing_tests) < self.best_count:
+            self.best_count = len(failing_tests)
+            self.stale_iterations = 0
+            return None
+
+        self.stale_iterations += 1
+        if self.patience and self.stale_iterations >= self.patience:
+            return f"failing tests have not shrunk below {self.best_count} for {self.stale_iterations} iteration(s)"
+        return None
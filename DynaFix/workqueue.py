@@ -0,0 +1,323 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Task states
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def attempt_order(record):
+    return record['ID'], record['width_attempt'], record['iteration']
+
+
+class SqliteWorkQueue:
+    """
+    Campaign queue in one SQLite file, which may sit on a filesystem shared by all nodes.
+    Workers lease slugs for lease_seconds and extend the lease with heartbeats; a lease that expires (the worker
+    crashed or lost the filesystem) goes back to pending, and a slug whose leases were lost or released
+    max_attempts times is marked failed. Attempt records of all workers are collected in the attempts table, one
+    per (slug, width attempt, iteration), so a slug repaired again after a lost lease does not count twice.
+    Every operation is one short BEGIN IMMEDIATE transaction, the rollback journal is used as WAL needs shared
+    memory that network filesystems do not provide.
+    """
+
+    def __init__(self, path, lease_seconds=600, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._transaction() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS tasks (slug TEXT PRIMARY KEY, idx INTEGER, state TEXT, "
+                       "worker TEXT, lease_until REAL, attempts INTEGER DEFAULT 0, outcome TEXT, updated REAL)")
+            db.execute("CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, idx)")
+            db.execute("CREATE TABLE IF NOT EXISTS attempts (slug TEXT, width_attempt INTEGER, iteration INTEGER, "
+                       "worker TEXT, time REAL, record TEXT, PRIMARY KEY (slug, width_attempt, iteration))")
+            # Last lease, heartbeat, completion or release of any worker
+            db.execute("CREATE TABLE IF NOT EXISTS activity (id INTEGER PRIMARY KEY CHECK (id = 0), time REAL)")
+
+    @contextmanager
+    def _transaction(self):
+        db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def enqueue(self, items):
+        """Add (index, slug) items that are not queued yet; returns how many were new"""
+        now = time.time()
+        with self._transaction() as db:
+            before = db.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+            db.executemany("INSERT OR IGNORE INTO tasks (slug, idx, state, updated) VALUES (?, ?, ?, ?)",
+                           [(slug, index, PENDING, now) for index, slug in items])
+            return db.execute("SELECT COUNT(*) FROM tasks").fetchone()[0] - before
+
+    def _touch(self, db, now):
+        db.execute("INSERT OR REPLACE INTO activity (id, time) VALUES (0, ?)", (now,))
+
+    def _requeue_expired(self, db, now):
+        db.execute("UPDATE tasks SET state = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END, "
+                   "attempts = attempts + 1, worker = NULL, lease_until = NULL, updated = ? "
+                   "WHERE state = ? AND lease_until < ?",
+                   (self.max_attempts, FAILED, PENDING, now, LEASED, now))
+
+    def lease(self, worker):
+        """Lease the first pending slug as (index, slug), None when nothing is pending"""
+        now = time.time()
+        with self._transaction() as db:
+            self._requeue_expired(db, now)
+            row = db.execute("SELECT idx, slug FROM tasks WHERE state = ? ORDER BY idx LIMIT 1",
+                             (PENDING,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE tasks SET state = ?, worker = ?, lease_until = ?, updated = ? WHERE slug = ?",
+                       (LEASED, worker, now + self.lease_seconds, now, row[1]))
+            self._touch(db, now)
+            return row[0], row[1]
+
+    def heartbeat(self, worker, slug):
+        """Extend a lease; False when the worker no longer holds it"""
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute("UPDATE tasks SET lease_until = ?, updated = ? "
+                                "WHERE slug = ? AND worker = ? AND state = ?",
+                                (now + self.lease_seconds, now, slug, worker, LEASED))
+            if cursor.rowcount == 1:
+                self._touch(db, now)
+            return cursor.rowcount == 1
+
+    def complete(self, worker, slug, outcome):
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute("UPDATE tasks SET state = ?, outcome = ?, lease_until = NULL, updated = ? "
+                                "WHERE slug = ? AND worker = ? AND state = ?",
+                                (DONE, json.dumps(outcome), now, slug, worker, LEASED))
+            if cursor.rowcount == 1:
+                self._touch(db, now)
+            return cursor.rowcount == 1
+
+    def release(self, worker, slug, error):
+        """Give a lease back after an error, counting it as an attempt"""
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute("UPDATE tasks SET state = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END, "
+                                "attempts = attempts + 1, worker = NULL, lease_until = NULL, outcome = ?, "
+                                "updated = ? WHERE slug = ? AND worker = ? AND state = ?",
+                                (self.max_attempts, FAILED, PENDING, json.dumps({'error': error}), now,
+                                 slug, worker, LEASED))
+            if cursor.rowcount == 1:
+                self._touch(db, now)
+
+    def add_result(self, worker, slug, record):
+        """Store an attempt record, replacing the one of an earlier lease of the same attempt"""
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO attempts (slug, width_attempt, iteration, worker, time, record) "
+                       "VALUES (?, ?, ?, ?, ?, ?)",
+                       (slug, record['width_attempt'], record['iteration'], worker, time.time(),
+                        json.dumps(record, ensure_ascii=False)))
+
+    def results(self):
+        """The latest record of every attempt, ordered by ID, width attempt and iteration"""
+        with self._transaction() as db:
+            rows = db.execute("SELECT worker, record FROM attempts").fetchall()
+        return sorted((dict(json.loads(record), worker=worker) for worker, record in rows), key=attempt_order)
+
+    def last_activity(self):
+        """Time of the last lease, heartbeat, completion or release, None before the first one"""
+        with self._transaction() as db:
+            row = db.execute("SELECT time FROM activity WHERE id = 0").fetchone()
+        return row[0] if row else None
+
+    def counts(self):
+        with self._transaction() as db:
+            self._requeue_expired(db, time.time())
+            rows = db.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+
+# KEYS: pending, leases, owner, activity; ARGV: worker, lease until, now
+LEASE_SCRIPT = """
+local popped = redis.call('ZPOPMIN', KEYS[1])
+if #popped == 0 then return false end
+redis.call('ZADD', KEYS[2], ARGV[2], popped[1])
+redis.call('HSET', KEYS[3], popped[1], ARGV[1])
+redis.call('SET', KEYS[4], ARGV[3])
+return popped
+"""
+
+# KEYS: owner, leases, activity; ARGV: slug, worker, lease until, now
+HEARTBEAT_SCRIPT = """
+if redis.call('HGET', KEYS[1], ARGV[1]) ~= ARGV[2] then return 0 end
+if not redis.call('ZSCORE', KEYS[2], ARGV[1]) then return 0 end
+redis.call('ZADD', KEYS[2], 'XX', ARGV[3], ARGV[1])
+redis.call('SET', KEYS[3], ARGV[4])
+return 1
+"""
+
+# KEYS: owner, leases, done, activity; ARGV: slug, worker, outcome, now
+COMPLETE_SCRIPT = """
+if redis.call('HGET', KEYS[1], ARGV[1]) ~= ARGV[2] then return 0 end
+if redis.call('ZREM', KEYS[2], ARGV[1]) == 0 then return 0 end
+redis.call('HDEL', KEYS[1], ARGV[1])
+redis.call('HSET', KEYS[3], ARGV[1], ARGV[3])
+redis.call('SET', KEYS[4], ARGV[4])
+return 1
+"""
+
+# Released by its worker, or expired when the worker is empty
+GIVE_BACK_KEYS = ('owner', 'leases', 'attempts', 'failed', 'pending', 'index', 'activity')
+# KEYS: GIVE_BACK_KEYS; ARGV: slug, worker, outcome, max attempts, now
+GIVE_BACK_SCRIPT = """
+if ARGV[2] ~= '' then
+    if redis.call('HGET', KEYS[1], ARGV[1]) ~= ARGV[2] then return 0 end
+else
+    local lease_until = redis.call('ZSCORE', KEYS[2], ARGV[1])
+    if not lease_until or tonumber(lease_until) > tonumber(ARGV[5]) then return 0 end
+end
+if redis.call('ZREM', KEYS[2], ARGV[1]) == 0 then return 0 end
+redis.call('HDEL', KEYS[1], ARGV[1])
+if redis.call('HINCRBY', KEYS[3], ARGV[1], 1) >= tonumber(ARGV[4]) then
+    redis.call('HSET', KEYS[4], ARGV[1], ARGV[3])
+else
+    redis.call('ZADD', KEYS[5], redis.call('HGET', KEYS[6], ARGV[1]), ARGV[1])
+end
+if ARGV[2] ~= '' then redis.call('SET', KEYS[7], ARGV[5]) end
+return 1
+"""
+
+
+class RedisWorkQueue:
+    """
+    The same queue on a Redis-compatible server (Redis, Valkey, KeyDB ...), for nodes without a shared filesystem.
+    Needs the optional `redis` package. Keys are prefixed with the campaign name. Every state change that touches
+    more than one key runs as a Lua script, so it is atomic and a worker dying halfway cannot lose a slug.
+    """
+
+    def __init__(self, url, campaign='dynafix', lease_seconds=600, max_attempts=3):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("A redis:// queue needs the redis package (pip install redis)")
+        self.db = redis.Redis.from_url(url, decode_responses=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.key = lambda name: f"{campaign}:{name}"
+        self._lease = self.db.register_script(LEASE_SCRIPT)
+        self._heartbeat = self.db.register_script(HEARTBEAT_SCRIPT)
+        self._complete = self.db.register_script(COMPLETE_SCRIPT)
+        self._give_back = self.db.register_script(GIVE_BACK_SCRIPT)
+
+    def enqueue(self, items):
+        new = 0
+        for index, slug in items:
+            if self.db.hsetnx(self.key('index'), slug, index):
+                self.db.zadd(self.key('pending'), {slug: index})
+                new += 1
+        return new
+
+    def _keys(self, *names):
+        return [self.key(name) for name in names]
+
+    def _requeue_expired(self, now):
+        for slug in self.db.zrangebyscore(self.key('leases'), 0, now):
+            # The script checks the expiry again, only one worker requeues it
+            self._give_back(keys=self._keys(*GIVE_BACK_KEYS),
+                            args=[slug, '', json.dumps({'error': 'lease lost'}), self.max_attempts, now])
+
+    def lease(self, worker):
+        now = time.time()
+        self._requeue_expired(now)
+        leased = self._lease(keys=self._keys('pending', 'leases', 'owner', 'activity'),
+                             args=[worker, now + self.lease_seconds, now])
+        if not leased:
+            return None
+        slug, index = leased
+        return int(float(index)), slug
+
+    def heartbeat(self, worker, slug):
+        now = time.time()
+        return bool(self._heartbeat(keys=self._keys('owner', 'leases', 'activity'),
+                                    args=[slug, worker, now + self.lease_seconds, now]))
+
+    def complete(self, worker, slug, outcome):
+        return bool(self._complete(keys=self._keys('owner', 'leases', 'done', 'activity'),
+                                   args=[slug, worker, json.dumps(outcome), time.time()]))
+
+    def release(self, worker, slug, error):
+        self._give_back(keys=self._keys(*GIVE_BACK_KEYS),
+                        args=[slug, worker, json.dumps({'error': error}), self.max_attempts, time.time()])
+
+    def add_result(self, worker, slug, record):
+        """Store an attempt record, replacing the one of an earlier lease of the same attempt"""
+        field = f"{slug}\t{record['width_attempt']}\t{record['iteration']}"
+        self.db.hset(self.key('attempts'), field, json.dumps(dict(record, worker=worker), ensure_ascii=False))
+
+    def results(self):
+        """The latest record of every attempt, ordered by ID, width attempt and iteration"""
+        return sorted((json.loads(record) for record in self.db.hvals(self.key('attempts'))), key=attempt_order)
+
+    def last_activity(self):
+        """Time of the last lease, heartbeat, completion or release, None before the first one"""
+        value = self.db.get(self.key('activity'))
+        return float(value) if value is not None else None
+
+    def counts(self):
+        self._requeue_expired(time.time())
+        return {PENDING: self.db.zcard(self.key('pending')), LEASED: self.db.zcard(self.key('leases')),
+                DONE: self.db.hlen(self.key('done')), FAILED: self.db.hlen(self.key('failed'))}
+
+
+def open_queue(url, lease_seconds=600, max_attempts=3):
+    """'redis://host:port/db[#campaign]' or a path of a SQLite file (optionally 'sqlite:///path')"""
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        url, _, campaign = url.partition('#')
+        return RedisWorkQueue(url, campaign or 'dynafix', lease_seconds, max_attempts)
+    if url.startswith('sqlite://'):
+        url = url[len('sqlite://'):]
+    return SqliteWorkQueue(url, lease_seconds, max_attempts)
+
+
+class LeaseKeeper:
+    """Heartbeat a lease from a background thread; `lost` is set once another worker may have taken it over"""
+
+    def __init__(self, queue, worker, slug):
+        self.queue = queue
+        self.worker = worker
+        self.slug = slug
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        interval = max(self.queue.lease_seconds / 3, 1)
+        while not self._stop.wait(interval):
+            try:
+                if not self.queue.heartbeat(self.worker, self.slug):
+                    print(f"[WARNING] Lease on {self.slug} lost, stopping its repair")
+                    self.lost.set()
+                    return
+            except Exception as e:
+                # A transient queue error; the lease survives until it actually expires
+                print(f"[WARNING] Heartbeat for {self.slug} failed: {str(e)}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()